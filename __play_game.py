@@ -1,26 +1,42 @@
 import sys
 import os
+import json
 import math
 import time
 import random
 import datetime
+import importlib
+import shutil
+import tempfile
+import numpy
 from camera_reader import CameraReader
 from pose_estimator import PoseEstimator, PoseLandmark
+from pose_pipeline import PosePipeline
+from pose_replay import PoseReplay
+from landmark_filter import LandmarkFilter
 from game_controller import GameController
 from data_manager import DataManager
 from parameters_manager import ParametersManager
 from difficulty_adapter import DifficulyAdapter
+from session_writer import SessionWriter
 
 # ===================================================================================================================================================
 
 USER_ID                  = None # Id of the user as a string (ex : 0001)
 USER_TRAINED_SIDE        = None # Trained side as a string (right or left)
 
+STARTUP_PROFILE          = False # Report the import and constructor timings, then quit (--profile-startup option)
+STARTUP_TIMINGS          = []    # [name, ms] of the timed startup steps
+
 GAME_CONTROLLER          = None # Object that contains the game controller
 GAME_RUNNING             = True # Flag that tells if the game is still running (false : when the user close the window)
 GAME_FPS                 = 60   # Max frame rate of the game
 GAME_WIDTH               = 1600 # px, Game width (the ratio must be the same as the camera)
 GAME_HEIGHT              = 1200 # px, Game height
+GAME_RENDER_TYPE         = GameController.RENDER_DIRTY # Only redraw the areas of the objects that changed
+GAME_TEXT_CACHE_SIZE     = 256  # Number of rendered texts kept by the game controller
+GAME_GRID_CELL_SIZE      = 64   # px, Cell size of the spatial grid of the game controller (contact queries), larger than the targets
+GAME_SEED                = None # Seed of the random numbers (targets, DDA), saved with the parameters to replay the session
 
 WINDOW_NAME              = "webcam-adaptive-serious-game" # Name of the game window
 WINDOW_ICON              = "./docs/icon.png"              # Icon to use (top left)
@@ -30,21 +46,42 @@ CAMERA_TYPE              = CameraReader.CAMERA_EXTERNAL # Camera to use
 CAMERA_WIDTH             = 640 # px, Camera width, common resolutions are : 1920×1080, 1280×720, 640×480, 320×240
 CAMERA_HEIGHT            = 480 # px, Camera height
 CAMERA_FPS               = 60  # Desired frame rate of the camera (does not work)
+CAMERA_CAPTURE_TYPE      = CameraReader.CAPTURE_THREADED # Capture in a dedicated thread, so the camera I/O overlaps the game loop
+CAMERA_BUFFER_SIZE       = 3   # Number of frames kept by the capture thread (only the newest is used)
+CAMERA_FLIP              = False # Flip the images (mirror), otherwise the pose estimator mirrors the landmarks (no flip per frame)
+CAMERA_SOURCE_PATH       = None # Device, video file or image directory of the source, instead of the camera (--camera option)
+CAMERA_SOURCE_TIMING     = CameraReader.TIMING_RECORDED # Timing of the video file, image directory and synthetic sources (--max-speed option)
 
 POSE_ESTIMATOR           = None # Object that contains the pose estimator
 POSE_MODEL_COMPLEXITY    = PoseEstimator.MODEL_COMPLEXITY_FAST # Model to use
 POSE_MIN_VISIBILITY      = 0.2 # Min detection confidence (landmarks with lower confidence are ignored)
+POSE_MIRROR              = not CAMERA_FLIP # Mirror the landmarks of the images that are not flipped
 POSE_EXCLUDED_LANDMARKS  = [PoseLandmark.RIGHT_HAND, PoseLandmark.LEFT_HAND] # Landmarks to ignore
 POSE_DUMMY_VARIABLE      = PoseLandmark.exclude_landmarks(POSE_EXCLUDED_LANDMARKS) # Dummy, it is a method call
 
+POSE_PIPELINE            = None # Object that contains the pose pipeline (camera thread -> pose worker -> game loop)
+POSE_FRAME_TS            = None # Capture timestamp (monotonic) of the landmarks being processed
+POSE_PREDICTED           = [] # Landmarks being processed that are predicted (lost for a few frames), they are not added to the kinematics data
+POSE_FILTER              = None # Object that contains the landmark filter (One-Euro filters and short-gap prediction)
+POSE_FILTER_MIN_CUTOFF   = 1.0  # Hz, Cutoff frequency of the filters at rest (lower : less jitter, more lag)
+POSE_FILTER_BETA         = 10.0 # Increase of the cutoff frequency with the speed of the landmark (higher : less lag in motion), per normalized coordinate per second : a 1 s reach lags 8 px at 640 px (1.0 : 25 px), see tests/test_landmark_filter.py
+POSE_FILTER_D_CUTOFF     = 1.0  # Hz, Cutoff frequency of the speed
+POSE_FILTER_MAX_GAP      = 3    # Number of frames a lost landmark is predicted at constant speed
+POSE_REPLAY_PATH         = None # Landmarks trace to replay instead of the camera, without window and unthrottled (--replay option)
+
 PARAM_MANAGER            = None # Object that contains the parameters manager
 PARAM_DATE               = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S") # Date of the experiment as string
 PARAM_TIMESTAMP          = time.time() # Date of the experiment as Unix timestamp
 PARAM_MONOTONIC          = time.monotonic() # Monotonic initial value
 
 DATA_MANAGER             = None # Object that contains the data manager
+DATA_WRITER              = None # Object that contains the session writer (CSV files shared by the data manager and the difficulty adapter)
+DATA_FORMAT              = SessionWriter.FORMAT_CSV_AND_NPZ # Also save typed columns (.npz) with the parameters embedded, faster to load for the analyses
 DATA_REF_VECTOR          = [0, -1, 0] # Reference vector for the trunk compensation computation
+DATA_KINEMATICS_TYPE     = DataManager.KINEMATICS_CKATOOL # Kinematics computation (CKATool, the vectorized NumPy computation is only allowed once DataManager.KINEMATICS_NUMPY_VALIDATED)
 DATA_FOLDER              = "./experiments/{user_id}-{user_trained_side}-{dda_type}/{experiment_date}/" # Folder where to save the experiment data
+DATA_RECORD_LANDMARKS    = True # Save the landmarks of each pose result (landmarks.csv), to replay the session
+DATA_LANDMARKS_FILE      = None # Path of the landmarks trace, set when its header is written
 
 OBJ_LAND_RADIUS          = 10 # px, Radius of the landmarks
 OBJ_LAND_WIDTH           = 1  # px, Width of the landmarks connections
@@ -69,6 +106,7 @@ DIFF_START               = 0.5  # Difficulty levels to begin with
 DIFF_INCREMENT           = 0.05 # Increment used to adjust the parameters
 DIFF_WINDOW_SIZE_SCORE   = 10   # Size of the window for the score (used by the DDA)
 DIFF_WINDOW_SIZE_METRICS = 5    # Size of the window for the metrics (performance and motor metrics)
+DIFF_DECISION_DEADLINE   = 50   # ms, Max time to wait for the model of the data-based DDA (it runs in the background), the rule-based DDA is used after
 
 DIFF_MIN_TARGET_ANGLE    = 120  # degrees, Min target angle (reference point is the shoulder, 0 degree is pointing downwards)
 DIFF_MAX_TARGET_ANGLE    = 150  # degrees, Max target angle
@@ -86,8 +124,6 @@ CALIB_RIGHT_HAND_X       = GAME_WIDTH - 400 # px, x position of the right hand t
 CALIB_LEFT_HAND_X        = 400              # px, x position of the left hand target (calibration step)
 CALIB_HAND_Y             = GAME_HEIGHT / 2  # px, y position of the hand target  (calibration step)
 
-CALIB_RIGHT_SHOULDER_X   = CALIB_RIGHT_HAND_X - DIFF_MAX_TARGET_DISTANCE # px, x position of the right shoulder target (calibration step)
-CALIB_LEFT_SHOULDER_X    = CALIB_LEFT_HAND_X + DIFF_MAX_TARGET_DISTANCE  # px, x position of the left shoulder target (calibration step)
 CALIB_SHOULDER_Y         = GAME_HEIGHT / 2 # px, y position of the shoulder target (calibration step) 
 
 MS_CURRENT_STEP          = 0 # Current step of the step machine
@@ -147,6 +183,8 @@ MEMORY_PLAY = {
     "reach_failed"         : False,
     "dwell_failed"         : False,
     "target_succeeded"     : False,
+    # Iterations computed in the background
+    "iteration_futures"    : [],
 }
 
 # STATE MACHINE : calibration step ==================================================================================================================
@@ -168,8 +206,8 @@ def update_step_calibration(landmarks_as_px):
         hand_y = CALIB_HAND_Y
         GAME_CONTROLLER.create_object_circle(MEMORY_CALIBRATION["target_hand_id"], hand_x, hand_y, GameController.COLOR_GREEN, OBJ_TARGET_RADIUS)
 
-        # Shoulder target
-        shoulder_x = CALIB_RIGHT_SHOULDER_X if USER_TRAINED_SIDE == DataManager.SIDE_RIGHT else CALIB_LEFT_SHOULDER_X
+        # Shoulder target, at the max target distance from the hand (not a constant : the replay restores the distance of the recorded session)
+        shoulder_x = hand_x - DIFF_MAX_TARGET_DISTANCE if USER_TRAINED_SIDE == DataManager.SIDE_RIGHT else hand_x + DIFF_MAX_TARGET_DISTANCE
         shoulder_y = CALIB_SHOULDER_Y
         GAME_CONTROLLER.create_object_circle(MEMORY_CALIBRATION["target_shoulder_id"], shoulder_x, shoulder_y, GameController.COLOR_GREEN, OBJ_TARGET_RADIUS)
 
@@ -416,7 +454,7 @@ def update_step_play(landmarks_as_px):
         # Aligned
         elif event_contact and trunk_respected:
             GAME_CONTROLLER.delete_event(MEMORY_PLAY["event_expired_end_id"])
-            DATA_MANAGER.end_iteration()
+            MEMORY_PLAY["iteration_futures"].append(DATA_MANAGER.end_iteration_async())
             MEMORY_PLAY["substep"] = 50
 
         # Clear objects
@@ -429,7 +467,7 @@ def update_step_play(landmarks_as_px):
             GAME_CONTROLLER.delete_object(MEMORY_PLAY["text_end_id"])
             GAME_CONTROLLER.delete_event(MEMORY_PLAY["event_expired_end_id"])
             GAME_CONTROLLER.delete_event(MEMORY_PLAY["event_contact_end_id"])
-            DATA_MANAGER.end_iteration()
+            MEMORY_PLAY["iteration_futures"].append(DATA_MANAGER.end_iteration_async())
             MEMORY_PLAY["substep"] = 70
         
     # ========
@@ -495,13 +533,23 @@ def update_step_play(landmarks_as_px):
             GAME_CONTROLLER.delete_object(MEMORY_PLAY["text_end_id"])
             GAME_CONTROLLER.delete_event(MEMORY_PLAY["event_contact_end_id"])
             GAME_CONTROLLER.delete_event(MEMORY_PLAY["event_dwell_end_id"])
-            DATA_MANAGER.end_iteration()
+            MEMORY_PLAY["iteration_futures"].append(DATA_MANAGER.end_iteration_async())
             MEMORY_PLAY["substep"] = 70
     
     # ========
     # Update the DDA
     # ========
     elif MEMORY_PLAY["substep"] == 70:
+        # Wait for the kinematics, without blocking the rendering (the replay blocks, to be reproducible)
+        if POSE_REPLAY_PATH is None:
+            for future in MEMORY_PLAY["iteration_futures"]:
+                if not future.done(): return
+        
+        # Raise the errors of the worker, if any
+        for future in MEMORY_PLAY["iteration_futures"]:
+            future.result()
+        MEMORY_PLAY["iteration_futures"].clear()
+
         last_reach_iteration = DATA_MANAGER.get_last_iteration(DataManager.TYPE_REACH)
         last_dwell_iteration = DATA_MANAGER.get_last_iteration(DataManager.TYPE_DWELL)
         DIFF_ADAPTER.set_results(
@@ -588,9 +636,16 @@ def update_data(target_id, target_position, norm_position, norm_distance, landma
     landmarks = [neck, hip, shoulder, elbow, wrist, end_effector, target]
     for landmark in landmarks:
         if landmark is None: return False
+
+    # The predicted landmarks are not measures, they are not added
+    if len(POSE_PREDICTED) > 0:
+        landmark_ids = [PoseLandmark.MIDDLE_SHOULDER, PoseLandmark.MIDDLE_HIP]
+        landmark_ids += [PoseLandmark.RIGHT_SHOULDER, PoseLandmark.RIGHT_ELBOW, PoseLandmark.RIGHT_WRIST] if USER_TRAINED_SIDE == DataManager.SIDE_RIGHT else [PoseLandmark.LEFT_SHOULDER, PoseLandmark.LEFT_ELBOW, PoseLandmark.LEFT_WRIST]
+        for landmark_id in landmark_ids:
+            if landmark_id in POSE_PREDICTED: return DATA_MANAGER.has_enough_data()
     
     # Add the data
-    timestamp = time.monotonic() # Used instead of time.time() to avoid timestamp discontinuities caused by system clock updates
+    timestamp = POSE_FRAME_TS # Capture time of the frame, time.monotonic() is used instead of time.time() to avoid timestamp discontinuities caused by system clock updates
     timestamp -= PARAM_MONOTONIC
     timestamp += PARAM_TIMESTAMP
     enough_data = DATA_MANAGER.add_data(
@@ -617,33 +672,69 @@ def update_trunk_text(text_trunk_id, neck_landmark):
 # MAIN ==============================================================================================================================================
 
 def main(parameters):
+    parameters = set_options(parameters)
     check_parameters(parameters)
     set_parameters(parameters)
     save_parameters()
+    random.seed(GAME_SEED)
+    if STARTUP_PROFILE: import_dependencies()
     set_utils()
 
+    # Report the startup timings, without playing
+    if STARTUP_PROFILE:
+        print_startup_timings()
+        return
+
     set_background()
     create_landmarks()
 
+    landmarks_as_px = None
+    start_ts = time.perf_counter()
+
     while GAME_RUNNING:
         update_game_states()
 
-        image = get_image()
-        if image is None: continue
-
-        landmarks = get_landmarks(image)
-        if landmarks is None: continue
+        # The steps only run on new landmarks, the pose estimation runs at its own rate
+        landmarks = get_landmarks()
+        if landmarks is not None:
+            landmarks_as_px = get_landmarks_as_px(landmarks)
+            update_steps(landmarks_as_px)
 
-        landmarks_as_px = get_landmarks_as_px(landmarks)
-
-        update_steps(landmarks_as_px)
-        update_landmarks(landmarks_as_px)
+        # The rendering runs at the display rate
+        if landmarks_as_px is not None: update_landmarks(landmarks_as_px)
 
         draw_canvas()
         regulate_fps()
 
+    # Report the throughput of the replay, or of the pose pipeline at the end of the camera source
+    if POSE_REPLAY_PATH is not None: print_replay_benchmark(time.perf_counter() - start_ts)
+    elif POSE_PIPELINE.is_finished(): print_pose_benchmark(time.perf_counter() - start_ts)
+
 # MAIN : utility functions ==========================================================================================================================
 
+def set_options(parameters):
+    global STARTUP_PROFILE, POSE_REPLAY_PATH, CAMERA_SOURCE_PATH, CAMERA_SOURCE_TIMING
+
+    # Get the options, the other parameters are positional
+    result = []
+    i = 0
+    while i < len(parameters):
+        if parameters[i] == "--profile-startup":
+            STARTUP_PROFILE = True
+        elif parameters[i] == "--replay" and i + 1 < len(parameters):
+            POSE_REPLAY_PATH = parameters[i + 1]
+            i += 1
+        elif parameters[i] == "--camera" and i + 1 < len(parameters):
+            CAMERA_SOURCE_PATH = parameters[i + 1]
+            i += 1
+        elif parameters[i] == "--max-speed":
+            CAMERA_SOURCE_TIMING = CameraReader.TIMING_MAX_SPEED
+        else:
+            result.append(parameters[i])
+        i += 1
+
+    return result
+
 def check_parameters(parameters):
     # Check the parameters length
     if len(parameters) != 4:
@@ -661,12 +752,27 @@ def check_parameters(parameters):
     if parameters[3] != "none" and not os.path.isfile(parameters[3]):
         raise RuntimeError("The pretrained model path must be none or a valid model file path")
 
+    # Check the replay trace, the parameters of the recorded session are next to it
+    if POSE_REPLAY_PATH is not None and not os.path.isfile(POSE_REPLAY_PATH):
+        raise RuntimeError("The replay path must be a valid landmarks trace file path")
+    if POSE_REPLAY_PATH is not None and not os.path.isfile(os.path.join(os.path.dirname(POSE_REPLAY_PATH), "parameters.json")):
+        raise RuntimeError("The replay needs the parameters of the recorded session, next to its trace")
+
+    # Check the camera source
+    if CAMERA_SOURCE_PATH is not None and CAMERA_SOURCE_PATH != "synthetic" and not CAMERA_SOURCE_PATH.startswith("/dev/") and not os.path.exists(CAMERA_SOURCE_PATH):
+        raise RuntimeError("The camera source must be synthetic, a device, a video file or an image directory")
+
+    # Check the kinematics type, the NumPy kinematics are saved and used by the DDA only once they match CKATool
+    if DATA_KINEMATICS_TYPE == DataManager.KINEMATICS_NUMPY and not DataManager.KINEMATICS_NUMPY_VALIDATED:
+        raise RuntimeError("The NumPy kinematics are not validated against CKATool yet (tests/test_kinematics.py)")
+
     # Check game and camera ration
     if GAME_WIDTH / GAME_HEIGHT != CAMERA_WIDTH / CAMERA_HEIGHT:
         raise RuntimeError("The game ratio and the camera ratio must be equal")
 
 def set_parameters(parameters):
-    global USER_ID, USER_TRAINED_SIDE, DIFF_TYPE, DIFF_PRETRAINED_MODEL, DATA_FOLDER
+    global USER_ID, USER_TRAINED_SIDE, DIFF_TYPE, DIFF_PRETRAINED_MODEL, DATA_FOLDER, GAME_SEED, PARAM_MONOTONIC, DIFF_DECISION_DEADLINE, DATA_RECORD_LANDMARKS
+    global CAMERA_TYPE, CAMERA_CAPTURE_TYPE
     
     USER_ID = parameters[0]
 
@@ -688,27 +794,141 @@ def set_parameters(parameters):
         experiment_date = PARAM_DATE
     )
 
+    # The startup profile writes the parameters and creates the folders of the utils in a temporary folder, removed when the game quits
+    if STARTUP_PROFILE: DATA_FOLDER = tempfile.mkdtemp(prefix="profile-startup-")
+
+    # The camera source replaces the camera
+    if CAMERA_SOURCE_PATH == "synthetic":
+        CAMERA_TYPE = CameraReader.CAMERA_SYNTHETIC
+    elif CAMERA_SOURCE_PATH is not None and CAMERA_SOURCE_PATH.startswith("/dev/"):
+        CAMERA_TYPE = CameraReader.CAMERA_V4L2
+    elif CAMERA_SOURCE_PATH is not None and os.path.isdir(CAMERA_SOURCE_PATH):
+        CAMERA_TYPE = CameraReader.CAMERA_IMAGE_DIRECTORY
+    elif CAMERA_SOURCE_PATH is not None:
+        CAMERA_TYPE = CameraReader.CAMERA_VIDEO_FILE
+
+    # At max speed, every frame of the source is estimated (the pose worker reads the source itself)
+    if CAMERA_SOURCE_TIMING == CameraReader.TIMING_MAX_SPEED:
+        CAMERA_CAPTURE_TYPE = CameraReader.CAPTURE_SYNCHRONOUS
+
+    # The replay uses the seed and the time of the recorded session, and synchronous DDA decisions (reproducible)
+    if POSE_REPLAY_PATH is None:
+        GAME_SEED = random.randrange(2 ** 32)
+    else:
+        set_recorded_parameters()
+        PARAM_MONOTONIC = 0 # The timestamps of the trace are relative to the start of the recorded session
+        DIFF_DECISION_DEADLINE = None
+        DATA_RECORD_LANDMARKS = False
+
+def set_recorded_parameters():
+    global GAME_SEED
+
+    path = os.path.join(os.path.dirname(POSE_REPLAY_PATH), "parameters.json")
+    with open(path, "r") as file:
+        recorded_parameters = json.load(file)
+
+    # Check the seed
+    GAME_SEED = recorded_parameters.get("game_seed")
+    if GAME_SEED is None: raise RuntimeError("The recorded session has no seed, it cannot be replayed")
+
+    # Check the parameters of the command line, and the parameters used by the constants (sizes, excluded landmarks)
+    checked_parameters = {
+        "user_trained_side" : USER_TRAINED_SIDE,
+        "diff_type" : DIFF_TYPE,
+        "diff_pretrained_model" : DIFF_PRETRAINED_MODEL,
+        "game_width" : GAME_WIDTH,
+        "game_height" : GAME_HEIGHT,
+        "camera_width" : CAMERA_WIDTH,
+        "camera_height" : CAMERA_HEIGHT,
+        "pose_excluded_landmarks" : POSE_EXCLUDED_LANDMARKS,
+    }
+    for name in checked_parameters:
+        if name in recorded_parameters and recorded_parameters[name] != checked_parameters[name]:
+            raise RuntimeError("The parameter " + name + " does not match the recorded session (recorded : " + str(recorded_parameters[name]) + ")")
+
+    # Restore the other parameters of the recorded session (the older sessions do not have all of them)
+    restored_parameters = {
+        "data_ref_vector" : "DATA_REF_VECTOR",
+        "pose_filter_min_cutoff" : "POSE_FILTER_MIN_CUTOFF",
+        "pose_filter_beta" : "POSE_FILTER_BETA",
+        "pose_filter_d_cutoff" : "POSE_FILTER_D_CUTOFF",
+        "pose_filter_max_gap" : "POSE_FILTER_MAX_GAP",
+        "diff_goal_score" : "DIFF_GOAL_SCORE",
+        "diff_margin_score" : "DIFF_MARGIN_SCORE",
+        "diff_start" : "DIFF_START",
+        "diff_increment" : "DIFF_INCREMENT",
+        "diff_window_size_score" : "DIFF_WINDOW_SIZE_SCORE",
+        "diff_window_size_metrics" : "DIFF_WINDOW_SIZE_METRICS",
+        "diff_min_target_angle" : "DIFF_MIN_TARGET_ANGLE",
+        "diff_max_target_angle" : "DIFF_MAX_TARGET_ANGLE",
+        "diff_max_trunk_angle" : "DIFF_MAX_TRUNK_ANGLE",
+        "diff_dwell_time" : "DIFF_DWELL_TIME",
+        "diff_min_target_distance" : "DIFF_MIN_TARGET_DISTANCE",
+        "diff_max_target_distance" : "DIFF_MAX_TARGET_DISTANCE",
+        "diff_min_target_size" : "DIFF_MIN_TARGET_SIZE",
+        "diff_max_target_size" : "DIFF_MAX_TARGET_SIZE",
+        "diff_min_reach_time" : "DIFF_MIN_REACH_TIME",
+        "diff_max_reach_time" : "DIFF_MAX_REACH_TIME",
+    }
+    for name in restored_parameters:
+        if name in recorded_parameters: globals()[restored_parameters[name]] = recorded_parameters[name]
+
 def save_parameters():
     global PARAM_MANAGER
     PARAM_MANAGER = ParametersManager(DATA_FOLDER, None)
     PARAM_MANAGER.save_parameters(
         USER_ID, USER_TRAINED_SIDE,
-        GAME_WIDTH, GAME_HEIGHT, GAME_FPS,
+        GAME_WIDTH, GAME_HEIGHT, GAME_FPS, GAME_SEED,
         CAMERA_TYPE, CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS,
         POSE_MODEL_COMPLEXITY, POSE_MIN_VISIBILITY, POSE_EXCLUDED_LANDMARKS,
+        POSE_FILTER_MIN_CUTOFF, POSE_FILTER_BETA, POSE_FILTER_D_CUTOFF, POSE_FILTER_MAX_GAP,
         DATA_REF_VECTOR, DATA_FOLDER, PARAM_DATE,
         DIFF_TYPE, DIFF_PRETRAINED_MODEL, DIFF_GOAL_SCORE, DIFF_MARGIN_SCORE, DIFF_START, DIFF_INCREMENT, DIFF_WINDOW_SIZE_SCORE, DIFF_WINDOW_SIZE_METRICS,
         DIFF_MIN_TARGET_ANGLE, DIFF_MAX_TARGET_ANGLE, DIFF_MAX_TRUNK_ANGLE, DIFF_DWELL_TIME,
         DIFF_MIN_TARGET_DISTANCE, DIFF_MAX_TARGET_DISTANCE, DIFF_MIN_TARGET_SIZE, DIFF_MAX_TARGET_SIZE, DIFF_MIN_REACH_TIME, DIFF_MAX_REACH_TIME,
     )
 
+def import_dependencies():
+    # The utils import their dependencies on first use (slow), only those of the session are needed
+    # They are imported here to time them apart from the constructors
+    dependencies = ["pygame"] if POSE_REPLAY_PATH is not None else ["cv2", "mediapipe", "pygame"]
+    if DATA_KINEMATICS_TYPE == DataManager.KINEMATICS_CKATOOL:
+        dependencies.append("ckatool")
+    if DIFF_TYPE == DifficulyAdapter.TYPE_DATA_BASED and os.path.splitext(DIFF_PRETRAINED_MODEL)[1] != ".npz":
+        dependencies += ["cloudpickle", "mabwiser.mab", "sklearn.preprocessing"]
+
+    for dependency in dependencies:
+        time_startup("import " + dependency, lambda: importlib.import_module(dependency))
+
 def set_utils():
-    global GAME_CONTROLLER, CAMERA_READER, POSE_ESTIMATOR, DATA_MANAGER, DIFF_ADAPTER
-    GAME_CONTROLLER = GameController(GAME_FPS, GAME_WIDTH, GAME_HEIGHT, WINDOW_NAME, WINDOW_ICON)
-    CAMERA_READER = CameraReader(CAMERA_TYPE, CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS)
-    POSE_ESTIMATOR = PoseEstimator(POSE_MODEL_COMPLEXITY, POSE_MIN_VISIBILITY)    
-    DATA_MANAGER = DataManager(DATA_REF_VECTOR, DATA_FOLDER, None)
-    DIFF_ADAPTER = DifficulyAdapter(DIFF_TYPE, DIFF_PRETRAINED_MODEL, DIFF_GOAL_SCORE, DIFF_MARGIN_SCORE, DIFF_START, DIFF_INCREMENT, DIFF_WINDOW_SIZE_SCORE, DIFF_WINDOW_SIZE_METRICS, DATA_FOLDER, None)
+    global GAME_CONTROLLER, CAMERA_READER, POSE_ESTIMATOR, POSE_PIPELINE, POSE_FILTER, DATA_WRITER, DATA_MANAGER, DIFF_ADAPTER
+    if POSE_REPLAY_PATH is None:
+        GAME_CONTROLLER = time_startup("GameController", lambda: GameController(GAME_FPS, GAME_WIDTH, GAME_HEIGHT, WINDOW_NAME, WINDOW_ICON, None, GAME_TEXT_CACHE_SIZE, GAME_RENDER_TYPE, GAME_GRID_CELL_SIZE))
+        CAMERA_READER = time_startup("CameraReader", lambda: CameraReader(CAMERA_TYPE, CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS, CAMERA_CAPTURE_TYPE, CAMERA_BUFFER_SIZE, CAMERA_SOURCE_PATH, CAMERA_SOURCE_TIMING, CAMERA_FLIP))
+        POSE_ESTIMATOR = time_startup("PoseEstimator", lambda: PoseEstimator(POSE_MODEL_COMPLEXITY, POSE_MIN_VISIBILITY, POSE_MIRROR))
+        POSE_PIPELINE = time_startup("PosePipeline", lambda: PosePipeline(CAMERA_READER, POSE_ESTIMATOR))
+    else:
+        # Replay : no window (dummy video driver) and no camera, the time of the game is the time of the trace
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        POSE_PIPELINE = time_startup("PoseReplay", lambda: PoseReplay(POSE_REPLAY_PATH))
+        GAME_CONTROLLER = time_startup("GameController", lambda: GameController(GAME_FPS, GAME_WIDTH, GAME_HEIGHT, WINDOW_NAME, WINDOW_ICON, POSE_PIPELINE.get_time, GAME_TEXT_CACHE_SIZE, GAME_RENDER_TYPE, GAME_GRID_CELL_SIZE))
+    POSE_FILTER = time_startup("LandmarkFilter", lambda: LandmarkFilter(len(PoseLandmark.get_landmarks()), POSE_FILTER_MIN_CUTOFF, POSE_FILTER_BETA, POSE_FILTER_D_CUTOFF, POSE_FILTER_MAX_GAP))
+    DATA_WRITER = time_startup("SessionWriter", lambda: SessionWriter(format=DATA_FORMAT, metadata=PARAM_MANAGER.get_parameters()))
+    DATA_MANAGER = time_startup("DataManager", lambda: DataManager(DATA_REF_VECTOR, DATA_FOLDER, None, DATA_WRITER, DATA_KINEMATICS_TYPE))
+    DIFF_ADAPTER = time_startup("DifficulyAdapter", lambda: DifficulyAdapter(DIFF_TYPE, DIFF_PRETRAINED_MODEL, DIFF_GOAL_SCORE, DIFF_MARGIN_SCORE, DIFF_START, DIFF_INCREMENT, DIFF_WINDOW_SIZE_SCORE, DIFF_WINDOW_SIZE_METRICS, DATA_FOLDER, None, DATA_WRITER, DIFF_DECISION_DEADLINE))
+
+def time_startup(name, function):
+    start = time.perf_counter()
+    result = function()
+    STARTUP_TIMINGS.append([name, (time.perf_counter() - start) * 1000])
+    return result
+
+def print_startup_timings():
+    total = 0
+    for name, duration in STARTUP_TIMINGS:
+        print(name + " : " + "{:.1f}".format(duration) + " ms")
+        total += duration
+    print("Total : " + "{:.1f}".format(total) + " ms")
 
 def set_background():
     color = GameController.COLOR_BLACK
@@ -723,37 +943,61 @@ def update_game_states():
     GAME_CONTROLLER.refresh_states()
     GAME_RUNNING = GAME_CONTROLLER.get_running_state() 
 
-def get_image():
-    # Read the camera
-    result = CAMERA_READER.read()
-    if not result: return None
+    # The game stops at the end of the replayed trace, or of the video file and image directory sources
+    if POSE_PIPELINE.is_finished(): GAME_RUNNING = False
 
-    # Get the image
-    result = CAMERA_READER.get_image()
-    if result is None: return None
-    image = result[0]
-    
-    return image
+def get_landmarks():
+    global POSE_FRAME_TS, POSE_PREDICTED
 
-def get_landmarks(image):
-    # Estimate the pose
-    POSE_ESTIMATOR.set_image(image)
-    result = POSE_ESTIMATOR.estimate()
+    # Get the newest result of the pose pipeline
+    result = POSE_PIPELINE.read()
     if not result: return None
 
     # Get the landmark coordinates
-    landmarks = POSE_ESTIMATOR.get_landmarks()
+    result = POSE_PIPELINE.get_landmarks()
+    if DATA_RECORD_LANDMARKS: save_landmarks(result) # Before the filter, the replay filters them again
+
+    # Filter the landmarks, the lost landmarks are predicted for a few frames
+    landmarks = POSE_FILTER.filter(result[0], result[2])
+    if landmarks is None: return None # No pose detected
+
+    POSE_FRAME_TS = result[2]
+    POSE_PREDICTED = [landmark for i, landmark in enumerate(PoseLandmark.get_landmarks()) if landmarks[2][i]]
 
     return landmarks
 
+def save_landmarks(result):
+    global DATA_LANDMARKS_FILE
+    landmarks, frame_number, frame_ts = result
+
+    # Write the header
+    if DATA_LANDMARKS_FILE is None:
+        DATA_LANDMARKS_FILE = os.path.join(DATA_FOLDER, "landmarks.csv")
+        header = ["frame", "timestamp"]
+        for landmark in PoseLandmark.get_landmarks():
+            name = PoseLandmark.get_name(landmark)
+            header += [name + "_x", name + "_y"]
+        DATA_WRITER.write_row(DATA_LANDMARKS_FILE, header)
+
+    # Write the landmarks (normalized image coordinates, NaN : not detected), the timestamp is relative to the start of the session
+    row = [frame_number, frame_ts - PARAM_MONOTONIC]
+    if landmarks is None:
+        row += [math.nan, math.nan] * len(PoseLandmark.get_landmarks())
+    else:
+        coordinates, visible = landmarks
+        row += numpy.where(visible[:, numpy.newaxis], coordinates, math.nan).ravel().tolist()
+    DATA_WRITER.write_row(DATA_LANDMARKS_FILE, row)
+
 def get_landmarks_as_px(landmarks):
-    # Convert the landmarks to px
+    # Convert the landmarks to px, in one operation
+    coordinates, visible = landmarks[0], landmarks[1]
+    coordinates_as_px = (coordinates * [GAME_WIDTH, GAME_HEIGHT]).astype(int).tolist()
+
+    # Keep the reliable landmarks
     result = {}
-    for landmark in landmarks:
-        output = landmarks.get(landmark)
-        result[landmark] = [0, 0]
-        result[landmark][0] = int(output[0] * GAME_WIDTH)  # To pixels
-        result[landmark][1] = int(output[1] * GAME_HEIGHT) # To pixels
+    for i, landmark in enumerate(PoseLandmark.get_landmarks()):
+        if not visible[i]: continue
+        result[landmark] = coordinates_as_px[i]
 
     return result
 
@@ -783,8 +1027,27 @@ def draw_canvas():
     GAME_CONTROLLER.refresh_screen()
 
 def regulate_fps():
+    # The replay runs unthrottled
+    if POSE_REPLAY_PATH is not None: return
     GAME_CONTROLLER.regulate_fps()
 
+def print_replay_benchmark(duration):
+    n_frames = POSE_PIPELINE.get_stats()["replay_read_frames"]
+    n_targets = DIFF_ADAPTER.get_n_targets()
+    print("Replay frames : " + str(n_frames))
+    print("Replay targets : " + str(n_targets) + " (score " + DIFF_ADAPTER.get_str_score() + ")")
+    text_cache_stats = GAME_CONTROLLER.get_stats()
+    print("Replay text cache : " + str(text_cache_stats["text_cache_hits"]) + " hits, " + str(text_cache_stats["text_cache_misses"]) + " misses")
+    print("Replay duration : " + "{:.2f}".format(duration) + " s")
+    print("Replay throughput : " + "{:.2f}".format(n_targets / duration) + " targets/s, " + "{:.0f}".format(n_frames / duration) + " frames/s")
+
+def print_pose_benchmark(duration):
+    stats = POSE_PIPELINE.get_stats()
+    n_frames = stats["pose_estimated_frames"]
+    print("Pose frames : " + str(n_frames) + " (dropped : camera " + str(stats["camera_dropped_frames"]) + ", pose " + str(stats["pose_dropped_results"]) + ")")
+    print("Pose duration : " + "{:.2f}".format(duration) + " s")
+    print("Pose throughput : " + "{:.1f}".format(n_frames / duration) + " frames/s, mean latency " + "{:.1f}".format(stats["pose_mean_latency_ms"]) + " ms")
+
 # ===================================================================================================================================================
 
 if __name__ == "__main__":
@@ -795,8 +1058,11 @@ if __name__ == "__main__":
         GAME_RUNNING = False
     finally:
         if GAME_CONTROLLER is not None: GAME_CONTROLLER.close()
+        if POSE_PIPELINE is not None: POSE_PIPELINE.close() # Before the camera reader and the pose estimator it uses
         if CAMERA_READER is not None: CAMERA_READER.close()
         if POSE_ESTIMATOR is not None: POSE_ESTIMATOR.close()
         if PARAM_MANAGER is not None: PARAM_MANAGER.close()
         if DATA_MANAGER is not None: DATA_MANAGER.close()
-        if DIFF_ADAPTER is not None: DIFF_ADAPTER.close()
\ No newline at end of file
+        if DIFF_ADAPTER is not None: DIFF_ADAPTER.close()
+        if DATA_WRITER is not None: DATA_WRITER.close() # After the data manager and the difficulty adapter that write to it
+        if STARTUP_PROFILE: shutil.rmtree(DATA_FOLDER, ignore_errors=True)
\ No newline at end of file
@@ -0,0 +1,153 @@
+import sys
+import os
+import csv
+import hashlib
+import importlib.metadata
+from concurrent.futures import ProcessPoolExecutor
+from data_manager import DataManager
+
+# ===================================================================================================================================================
+
+EXPERIMENTS_FOLDER       = None # Folder that contains the experiments (searched recursively for coordinates.csv)
+KINEMATICS_TYPE          = None # Kinematics computation to use
+
+DATA_REF_VECTOR          = [0, -1, 0] # Reference vector for the trunk compensation computation
+DATA_MIN_DATA            = 16 # Min data of an iteration, the iterations with less data are skipped
+DATA_PREFIX              = "recomputed" # Prefix of the recomputed files (ex : recomputed-kinematics.csv), next to the coordinates.csv file
+
+POOL_WORKERS             = None # Number of processes (None : number of CPUs)
+POOL_CHUNK_SIZE          = 4    # Number of sessions sent to a process at once
+
+# MAIN ==============================================================================================================================================
+
+def main(parameters):
+    check_parameters(parameters)
+    set_parameters(parameters)
+
+    # Get the sessions
+    paths = get_coordinates_paths(EXPERIMENTS_FOLDER)
+    print("Sessions found : " + str(len(paths)))
+
+    # Recompute the kinematics in a process pool
+    tasks = [[path, KINEMATICS_TYPE, DATA_REF_VECTOR, DATA_MIN_DATA, DATA_PREFIX] for path in paths]
+    with ProcessPoolExecutor(max_workers=POOL_WORKERS) as executor:
+        for result in executor.map(recompute_session, tasks, chunksize=POOL_CHUNK_SIZE):
+            print(result[0] + " : " + result[1])
+
+# MAIN : utility functions ==========================================================================================================================
+
+def check_parameters(parameters):
+    # Check the parameters length
+    if len(parameters) != 2:
+        raise RuntimeError("Exactly two parameters are needed (experiments folder, kinematics type)")
+
+    # Check the experiments folder
+    if not os.path.isdir(parameters[0]):
+        raise RuntimeError("The experiments folder must be a valid folder path")
+
+    # Check the kinematics type, the NumPy kinematics do not rewrite the archived sessions until they match CKATool
+    if parameters[1] not in ["ckatool", "numpy"]:
+        raise RuntimeError("The kinematics type must be ckatool or numpy")
+    if parameters[1] == "numpy" and not DataManager.KINEMATICS_NUMPY_VALIDATED:
+        raise RuntimeError("The NumPy kinematics are not validated against CKATool yet (tests/test_kinematics.py)")
+
+def set_parameters(parameters):
+    global EXPERIMENTS_FOLDER, KINEMATICS_TYPE
+
+    EXPERIMENTS_FOLDER = parameters[0]
+
+    if parameters[1] == "ckatool":
+        KINEMATICS_TYPE = DataManager.KINEMATICS_CKATOOL
+    elif parameters[1] == "numpy":
+        KINEMATICS_TYPE = DataManager.KINEMATICS_NUMPY
+
+def get_coordinates_paths(folder):
+    result = []
+    for root, dirs, files in os.walk(folder):
+        if "coordinates.csv" not in files: continue
+        result.append(os.path.join(root, "coordinates.csv"))
+    return sorted(result)
+
+def get_kinematics_version(kinematics_type):
+    # Version of the computation : the results change with the code of the kinematics, and with the installed CKATool
+    version = [DataManager.KINEMATICS_VERSION]
+    if kinematics_type == DataManager.KINEMATICS_CKATOOL:
+        try: version.append(importlib.metadata.version("ckatool"))
+        except importlib.metadata.PackageNotFoundError: version.append(None)
+    return version
+
+def get_hash(path, kinematics_type, ref_vector, min_data):
+    # Hash of the content, of the parameters and of the version of the computation
+    hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            hash.update(block)
+    hash.update(str([kinematics_type, ref_vector, min_data, get_kinematics_version(kinematics_type)]).encode())
+    return hash.hexdigest()
+
+def get_iterations(path):
+    # Group the rows by iteration, in the order of the file
+    iterations = {}
+    with open(path, "r", newline="") as file:
+        for row in csv.DictReader(file):
+            iteration = int(float(row["iteration"]))
+            if iteration not in iterations: iterations[iteration] = []
+            iterations[iteration].append(row)
+    return iterations
+
+def recompute_session(task):
+    path, kinematics_type, ref_vector, min_data, prefix = task
+    folder = os.path.dirname(path)
+    hash_file = os.path.join(folder, prefix + "-kinematics.sha256")
+
+    # Skip the unchanged sessions
+    hash = get_hash(path, kinematics_type, ref_vector, min_data)
+    if os.path.isfile(hash_file):
+        with open(hash_file, "r") as file:
+            if file.read().strip() == hash: return [path, "skipped, unchanged"]
+
+    # Delete the previous results (the files are written in append mode), and the copies of the coordinates of the older versions
+    for name in ["-coordinates.csv", "-kinematics.csv", "-kinematics.sha256"]:
+        previous_file = os.path.join(folder, prefix + name)
+        if os.path.isfile(previous_file): os.remove(previous_file)
+
+    # Recompute the iterations
+    n_iterations = 0
+    n_skipped = 0
+    data_manager = DataManager(ref_vector, folder, prefix, None, kinematics_type, min_data, False) # The coordinates are not written again
+    try:
+        iterations = get_iterations(path)
+        for iteration in iterations:
+            rows = iterations[iteration]
+            if len(rows) < min_data:
+                n_skipped += 1
+                continue
+
+            first_row = rows[0]
+            side = int(float(first_row["side"]))
+            type = int(float(first_row["type"]))
+            id = int(float(first_row["id"]))
+
+            data_manager.start_iteration(side, type, id, iteration)
+            for row in rows:
+                data_manager.add_data(
+                    float(row["timestamp"]), float(row["neck_x"]), float(row["neck_y"]), float(row["hip_x"]), float(row["hip_y"]),
+                    float(row["shoulder_x"]), float(row["shoulder_y"]), float(row["elbow_x"]), float(row["elbow_y"]),
+                    float(row["wrist_x"]), float(row["wrist_y"]), float(row["end_effector_x"]), float(row["end_effector_y"]),
+                    float(row["target_x"]), float(row["target_y"])
+                )
+            data_manager.end_iteration()
+            n_iterations += 1
+    finally:
+        data_manager.close()
+
+    # Save the hash, once the results are complete
+    with open(hash_file, "w") as file: file.write(hash)
+
+    return [path, "recomputed, {n_iterations} iterations, {n_skipped} skipped".format(n_iterations=n_iterations, n_skipped=n_skipped)]
+
+# ===================================================================================================================================================
+
+if __name__ == "__main__":
+    parameters = sys.argv[1:] # The first parameter is the file name
+    main(parameters)
@@ -1,43 +1,251 @@
-import cv2
+import os
+import time
+import threading
+from collections import deque
+import numpy
+
+
+class _FrameSource:
+
+    TYPE_DEVICE          = 0 # Camera (OpenCV backend), the frames arrive at the camera rate
+    TYPE_VIDEO_FILE      = 1 # Video file, decoded by OpenCV
+    TYPE_IMAGE_DIRECTORY = 2 # Images of a directory, in the order of their names
+    TYPE_SYNTHETIC       = 3 # Generated images (moving gradient, no pose), without decoding
+
+    _IMAGE_EXTENSIONS = [".png", ".jpg", ".jpeg", ".bmp"]
+
+    @staticmethod
+    def create_source_device(device, api, width, height, fps):
+        import cv2
+        source = _FrameSource(_FrameSource.TYPE_DEVICE, False, fps)
+        source._capture = cv2.VideoCapture(device, api)
+
+        # Set the camera dimensions and FPS
+        source._capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        source._capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        source._capture.set(cv2.CAP_PROP_FPS, fps)
+
+        # Check the camera opening
+        if not source._capture.isOpened():
+            raise RuntimeError("The camera cannot be opened")
+
+        return source
+
+    @staticmethod
+    def create_source_video_file(path, paced):
+        import cv2
+        # Check the file
+        if not os.path.isfile(path):
+            raise RuntimeError("The video file does not exist")
+
+        source = _FrameSource(_FrameSource.TYPE_VIDEO_FILE, paced, 0)
+        source._capture = cv2.VideoCapture(path)
+
+        # Check the file opening
+        if not source._capture.isOpened():
+            raise RuntimeError("The video file cannot be opened")
+
+        source._fps = source._capture.get(cv2.CAP_PROP_FPS)
+        return source
+
+    @staticmethod
+    def create_source_image_directory(path, fps, paced):
+        import cv2
+        # Check the directory
+        if not os.path.isdir(path):
+            raise RuntimeError("The image directory does not exist")
+
+        source = _FrameSource(_FrameSource.TYPE_IMAGE_DIRECTORY, paced, fps)
+        source._paths = [os.path.join(path, name) for name in sorted(os.listdir(path)) if os.path.splitext(name)[1].lower() in _FrameSource._IMAGE_EXTENSIONS]
+
+        # Check the images
+        if len(source._paths) == 0:
+            raise RuntimeError("The image directory does not contain any image")
+
+        image = cv2.imread(source._paths[0])
+        if image is None:
+            raise RuntimeError("The image cannot be read")
+
+        source._width = image.shape[1]
+        source._height = image.shape[0]
+        return source
+
+    @staticmethod
+    def create_source_synthetic(width, height, fps, paced):
+        source = _FrameSource(_FrameSource.TYPE_SYNTHETIC, paced, fps)
+        source._width = width
+        source._height = height
+
+        # Gradient twice as wide as the image, a frame is a window on it that moves by one column per frame
+        gradient = numpy.linspace(0, 255, 2 * width).astype(numpy.uint8)
+        source._pattern = numpy.empty((height, 2 * width, 3), dtype=numpy.uint8)
+        source._pattern[:, :, 0] = gradient
+        source._pattern[:, :, 1] = gradient[::-1]
+        source._pattern[:, :, 2] = numpy.linspace(0, 255, height).astype(numpy.uint8)[:, numpy.newaxis]
+        return source
+
+    def __init__(self, type, paced, fps):
+        self._type = type
+        self._paced = paced # Deliver the frames at their recorded timestamps (or at the FPS), otherwise as fast as possible
+        self._fps = fps
+        self._capture = None
+        self._frame = None # Decoded frame of the camera or the video file, reused by the next decoding
+        self._paths = None
+        self._pattern = None
+        self._width = 0
+        self._height = 0
+        self._n_frames = 0
+        self._finished = False
+        self._start_ts = None
+
+    def close(self):
+        # Release the camera or the video file
+        if self._capture is None: return
+        try: self._capture.release()
+        except: pass
+
+    def read(self):
+        import cv2
+        # Read the next frame (BGR), None when it fails or when the source is finished
+        if self._finished: return None
+
+        image = None
+        frame_time = self._n_frames / self._fps if self._fps > 0 else 0 # s, time of the frame in the recording
+
+        if self._type == _FrameSource.TYPE_DEVICE or self._type == _FrameSource.TYPE_VIDEO_FILE:
+            success, image = self._capture.read(self._frame)
+            if not success:
+                self._finished = self._type == _FrameSource.TYPE_VIDEO_FILE # End of the file (a camera may fail once)
+                return None
+            self._frame = image
+            if self._type == _FrameSource.TYPE_VIDEO_FILE:
+                frame_time = self._capture.get(cv2.CAP_PROP_POS_MSEC) / 1000 # Timestamp of the decoded frame
+        elif self._type == _FrameSource.TYPE_IMAGE_DIRECTORY:
+            if self._n_frames >= len(self._paths):
+                self._finished = True
+                return None
+            image = cv2.imread(self._paths[self._n_frames])
+            if image is None: raise RuntimeError("The image cannot be read")
+        elif self._type == _FrameSource.TYPE_SYNTHETIC:
+            offset = self._n_frames % self._width
+            image = self._pattern[:, offset:offset + self._width]
+
+        self._n_frames += 1
+
+        # Wait for the time of the frame (the camera paces itself)
+        if self._paced: self._wait(frame_time)
+
+        return image
+
+    def is_finished(self):
+        return self._finished
+
+    def get_characteristics(self):
+        import cv2
+        # Width, height and FPS of the frames
+        if self._capture is not None:
+            return [self._capture.get(cv2.CAP_PROP_FRAME_WIDTH), self._capture.get(cv2.CAP_PROP_FRAME_HEIGHT), self._capture.get(cv2.CAP_PROP_FPS)]
+
+        return [self._width, self._height, self._fps]
+
+    def _wait(self, frame_time):
+        # The first frame sets the start of the recording
+        if self._start_ts is None: self._start_ts = time.monotonic() - frame_time
+
+        delay = self._start_ts + frame_time - time.monotonic()
+        if delay > 0: time.sleep(delay)
 
 
 class CameraReader:
 
-    CAMERA_INTERNAL = 0
-    CAMERA_EXTERNAL = 1
+    CAMERA_INTERNAL        = 0 # Windows (DirectShow), first device
+    CAMERA_EXTERNAL        = 1 # Windows (DirectShow), second device
+    CAMERA_V4L2            = 2 # Linux (Video4Linux), device of the source path (ex : /dev/video0), first device by default
+    CAMERA_VIDEO_FILE      = 3 # Video file of the source path
+    CAMERA_IMAGE_DIRECTORY = 4 # Images of the source path directory, in the order of their names, at the camera FPS
+    CAMERA_SYNTHETIC       = 5 # Generated images of the camera dimensions, at the camera FPS
 
     _CAMERAS = [
         CAMERA_INTERNAL,
         CAMERA_EXTERNAL,
+        CAMERA_V4L2,
+        CAMERA_VIDEO_FILE,
+        CAMERA_IMAGE_DIRECTORY,
+        CAMERA_SYNTHETIC,
+    ]
+
+    # Timing of the video file, image directory and synthetic sources
+    TIMING_RECORDED  = 0 # The frames are delivered at their recorded timestamps (as a camera)
+    TIMING_MAX_SPEED = 1 # The frames are delivered as fast as they are read (benchmark)
+
+    _TIMINGS = [
+        TIMING_RECORDED,
+        TIMING_MAX_SPEED,
+    ]
+
+    CAPTURE_SYNCHRONOUS = 0
+    CAPTURE_THREADED    = 1
+
+    _CAPTURES = [
+        CAPTURE_SYNCHRONOUS,
+        CAPTURE_THREADED,
     ]
     
-    def __init__(self, camera_type, camera_width, camera_height, camera_fps):
-        self._camera = None
+    def __init__(self, camera_type, camera_width, camera_height, camera_fps, capture_type = CAPTURE_SYNCHRONOUS, buffer_size = 3, source_path = None, source_timing = TIMING_RECORDED, flip = True):
+        import cv2 # Slow to import : the functions that use it import it, not the module
+
+        self._source = None
         self._image = None
+        self._frame_number = 0
+        self._frame_ts = 0
+        self._capture_type = capture_type
+        self._flip = flip # Flip the images horizontally, otherwise the landmarks are mirrored by the pose estimator (cheaper)
+
+        # Threaded capture
+        self._thread = None
+        self._lock = threading.Lock()
+        self._running = False
+        self._buffer = deque(maxlen=buffer_size) # Ring buffer, the oldest frame is overwritten when full
+        self._n_captured_frames = 0
+        self._n_dropped_frames = 0
 
         # Check the camera type
         if camera_type not in CameraReader._CAMERAS:
             raise RuntimeError("The camera type does not exist")
         
-        # Set the camera type
-        if camera_type == CameraReader.CAMERA_INTERNAL:
-            self._camera = cv2.VideoCapture(0, cv2.CAP_DSHOW) # Windows
-        elif camera_type == CameraReader.CAMERA_EXTERNAL:
-            self._camera = cv2.VideoCapture(1, cv2.CAP_DSHOW) # Windows
+        # Check the capture type
+        if capture_type not in CameraReader._CAPTURES:
+            raise RuntimeError("The capture type does not exist")
+        
+        # Check the buffer size
+        if buffer_size < 1:
+            raise RuntimeError("The buffer size must be at least one")
+        
+        # Check the source timing
+        if source_timing not in CameraReader._TIMINGS:
+            raise RuntimeError("The source timing does not exist")
 
-        # Set the camera dimensions and FPS
-        self._camera.set(cv2.CAP_PROP_FRAME_WIDTH, camera_width)
-        self._camera.set(cv2.CAP_PROP_FRAME_HEIGHT, camera_height)
-        self._camera.set(cv2.CAP_PROP_FPS, camera_fps)
+        # Check the source path
+        if source_path is None and camera_type in [CameraReader.CAMERA_VIDEO_FILE, CameraReader.CAMERA_IMAGE_DIRECTORY]:
+            raise RuntimeError("The camera type needs a source path")
 
-        # Check the camera opening
-        if not self._camera.isOpened():
-            raise RuntimeError("The camera cannot be opened")
+        # Set the frame source
+        paced = source_timing == CameraReader.TIMING_RECORDED
+        if camera_type == CameraReader.CAMERA_INTERNAL:
+            self._source = _FrameSource.create_source_device(0, cv2.CAP_DSHOW, camera_width, camera_height, camera_fps) # Windows
+        elif camera_type == CameraReader.CAMERA_EXTERNAL:
+            self._source = _FrameSource.create_source_device(1, cv2.CAP_DSHOW, camera_width, camera_height, camera_fps) # Windows
+        elif camera_type == CameraReader.CAMERA_V4L2:
+            self._source = _FrameSource.create_source_device(0 if source_path is None else source_path, cv2.CAP_V4L2, camera_width, camera_height, camera_fps) # Linux
+        elif camera_type == CameraReader.CAMERA_VIDEO_FILE:
+            self._source = _FrameSource.create_source_video_file(source_path, paced)
+        elif camera_type == CameraReader.CAMERA_IMAGE_DIRECTORY:
+            self._source = _FrameSource.create_source_image_directory(source_path, camera_fps, paced)
+        elif camera_type == CameraReader.CAMERA_SYNTHETIC:
+            self._source = _FrameSource.create_source_synthetic(camera_width, camera_height, camera_fps, paced)
         
         # Print the camera dimensions and FPS
-        camera_width = self._camera.get(cv2.CAP_PROP_FRAME_WIDTH)
-        camera_height = self._camera.get(cv2.CAP_PROP_FRAME_HEIGHT)
-        camera_fps = self._camera.get(cv2.CAP_PROP_FPS)
+        camera_width, camera_height, camera_fps = self._source.get_characteristics()
         characteristics = "The camera is open : width {camera_width}, height {camera_height}, FPS {camera_fps}".format(
             camera_width = camera_width,
             camera_height = camera_height,
@@ -45,29 +253,120 @@ class CameraReader:
         )
         print(characteristics)
 
+        # Images converted from the frames, reused (no allocation per frame) : one for the read image, one being converted and those of the ring buffer
+        # None : allocated by the first frame, once its dimensions are known
+        n_images = buffer_size + 2 if capture_type == CameraReader.CAPTURE_THREADED else 2
+        self._free_images = [None] * n_images
+
+        # Start the capture thread
+        if capture_type == CameraReader.CAPTURE_THREADED:
+            self._running = True
+            self._thread = threading.Thread(target=self._capture, daemon=True) # Daemon : do not prevent the program from exiting
+            self._thread.start()
+
     def close(self):
+        # Stop the capture thread
+        self._running = False
+        if self._thread is not None: self._thread.join()
+
         # Release the camera
-        try: self._camera.release()
-        except: pass
+        if self._source is not None: self._source.close()
 
     def read(self):
-        # Read the camera
-        success, image = self._camera.read()
-        if not success: return False
+        if self._capture_type == CameraReader.CAPTURE_THREADED:
+            return self._read_threaded()
         
-        # Flip the image horizontally
-        image = cv2.flip(image, 1)
-
-        # Convert from BGR to RGB
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        # Read the camera
+        image = self._read_camera()
+        if image is None: return False
 
-        # Set the image
+        # Set the image, the previous one is reused
+        with self._lock:
+            if self._image is not None: self._free_images.append(self._image)
         self._image = image
+        self._frame_number = self._frame_number + 1
+        self._frame_ts = time.monotonic()
         return True
     
     def get_image(self):
         # Check the image
         if self._image is None: return None
 
-        image = self._image        
-        return [image, image.shape[1], image.shape[0]]
\ No newline at end of file
+        # The image is reused by the next reads, it is valid until the next read
+        image = self._image
+        return [image, image.shape[1], image.shape[0]]
+    
+    def get_frame_info(self):
+        # Check the image
+        if self._image is None: return None
+
+        # Frame sequence number and capture timestamp (monotonic) of the image
+        return [self._frame_number, self._frame_ts]
+    
+    def is_finished(self):
+        # The source is finished (end of a video file or of an image directory) and all its frames were read
+        return self._source.is_finished() and self.get_buffer_depth() == 0
+
+    def get_buffer_depth(self):
+        # Frames waiting in the ring buffer
+        with self._lock:
+            return len(self._buffer)
+    
+    def get_dropped_frames(self):
+        # Frames captured by the thread but never returned by read
+        with self._lock:
+            return self._n_dropped_frames
+    
+    def _read_camera(self):
+        import cv2
+        # Read the camera
+        frame = self._source.read()
+        if frame is None: return None
+
+        # Get a free image
+        with self._lock: image = self._free_images.pop()
+        if image is None or image.shape != frame.shape: image = numpy.empty(frame.shape, dtype=numpy.uint8)
+
+        # Flip the image horizontally, then convert from BGR to RGB in place
+        if self._flip:
+            cv2.flip(frame, 1, dst=image)
+            cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+        else:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=image)
+
+        return image
+
+    def _read_threaded(self):
+        # Get the newest frame, without waiting for the camera
+        with self._lock:
+            if len(self._buffer) == 0: return False # No new frame since the last read
+            self._n_dropped_frames += len(self._buffer) - 1 # Older frames are skipped
+            frame = self._buffer.pop()
+
+            # The images of the skipped frames and the previous image are reused
+            for skipped_frame in self._buffer: self._free_images.append(skipped_frame[0])
+            self._buffer.clear()
+            if self._image is not None: self._free_images.append(self._image)
+
+        # Set the image
+        self._image = frame[0]
+        self._frame_number = frame[1]
+        self._frame_ts = frame[2]
+        return True
+
+    def _capture(self):
+        while self._running:
+            # Read the camera (the GIL is released while OpenCV waits for the frame)
+            image = self._read_camera()
+            if image is None:
+                if self._source.is_finished(): break # No more frames
+                time.sleep(0.001) # Avoid a busy loop when the camera fails
+                continue
+
+            # Add the frame to the ring buffer
+            with self._lock:
+                if len(self._buffer) == self._buffer.maxlen:
+                    self._free_images.append(self._buffer.popleft()[0]) # The oldest frame is overwritten, its image is reused
+                    self._n_dropped_frames += 1
+                self._n_captured_frames += 1
+                self._buffer.append([image, self._n_captured_frames, time.monotonic()])
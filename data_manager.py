@@ -1,37 +1,45 @@
+import math
 import numpy
-import ckatool
 import os
+from session_writer import SessionWriter
+from kinematics import Kinematics
+from concurrent.futures import ThreadPoolExecutor
 
 
 class _DataIteration:
 
-    def __init__(self):
-        self.side = []
-        self.type = []
-        self.id = []
-        self.iteration = []
-        self.timestamp = []
-        self.neck_x = []
-        self.neck_y = []
-        self.neck_z = []
-        self.hip_x = []
-        self.hip_y = []
-        self.hip_z = []
-        self.shoulder_x = []
-        self.shoulder_y = []
-        self.shoulder_z = []
-        self.elbow_x = []
-        self.elbow_y = []
-        self.elbow_z = []
-        self.wrist_x = []
-        self.wrist_y = []
-        self.wrist_z = []
-        self.end_effector_x = []
-        self.end_effector_y = []
-        self.end_effector_z = []
-        self.target_x = []
-        self.target_y = []
-        self.target_z = []
+    # Columns of the data array, the other columns are constant (side, type, id, iteration) or always 0 (z coordinates)
+    _TIMESTAMP      = 0
+    _NECK_X         = 1
+    _NECK_Y         = 2
+    _HIP_X          = 3
+    _HIP_Y          = 4
+    _SHOULDER_X     = 5
+    _SHOULDER_Y     = 6
+    _ELBOW_X        = 7
+    _ELBOW_Y        = 8
+    _WRIST_X        = 9
+    _WRIST_Y        = 10
+    _END_EFFECTOR_X = 11
+    _END_EFFECTOR_Y = 12
+    _TARGET_X       = 13
+    _TARGET_Y       = 14
+
+    _N_COLUMNS      = 15
+    _MIN_CAPACITY   = 256 # About 8 seconds at 30 FPS
+
+    def __init__(self, side, type, id, iteration):
+        self.iteration_side = side
+        self.iteration_type = type
+        self.iteration_id = id
+        self.iteration_number = iteration
+
+        # One row per column : each column is contiguous, the views given to CKATool and to the writers are not copied
+        self._data = numpy.empty((_DataIteration._N_COLUMNS, _DataIteration._MIN_CAPACITY), dtype=numpy.float64)
+        self._size = 0
+
+        self.trunk_start_angle = 0
+        self.trunk_end_angle = 0
 
         self.shoulder_number_of_velocity_peaks = 0
         self.elbow_number_of_velocity_peaks = 0
@@ -76,6 +84,94 @@ class _DataIteration:
         self.target_error_distance = 0
         self.hand_path_ratio = 0
 
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamp, neck_x, neck_y, hip_x, hip_y, shoulder_x, shoulder_y, elbow_x,
+               elbow_y, wrist_x, wrist_y, end_effector_x, end_effector_y, target_x, target_y):
+        # Grow the data array (amortized, the capacity is doubled)
+        if self._size == self._data.shape[1]: self._resize(2 * self._data.shape[1])
+
+        # Add the data
+        self._data[:, self._size] = (
+            timestamp, neck_x, neck_y, hip_x, hip_y, shoulder_x, shoulder_y, elbow_x,
+            elbow_y, wrist_x, wrist_y, end_effector_x, end_effector_y, target_x, target_y
+        )
+        self._size = self._size + 1
+
+    def trim(self):
+        # Release the unused capacity, once the iteration is complete
+        self._resize(self._size)
+
+    def get_rows(self):
+        # Data as rows of Python floats
+        return self._data[:, :self._size].T.tolist()
+
+    def _resize(self, capacity):
+        data = numpy.empty((_DataIteration._N_COLUMNS, capacity), dtype=numpy.float64)
+        data[:, :self._size] = self._data[:, :self._size]
+        self._data = data
+
+    def _get_column(self, column):
+        return self._data[column, :self._size]
+
+    def _get_constant(self, value):
+        # Read-only view, nothing is allocated per data
+        return numpy.broadcast_to(value, (self._size,))
+
+    @property
+    def side(self): return self._get_constant(self.iteration_side)
+    @property
+    def type(self): return self._get_constant(self.iteration_type)
+    @property
+    def id(self): return self._get_constant(self.iteration_id)
+    @property
+    def iteration(self): return self._get_constant(self.iteration_number)
+    @property
+    def timestamp(self): return self._get_column(_DataIteration._TIMESTAMP)
+    @property
+    def neck_x(self): return self._get_column(_DataIteration._NECK_X)
+    @property
+    def neck_y(self): return self._get_column(_DataIteration._NECK_Y)
+    @property
+    def neck_z(self): return self._get_constant(0.0)
+    @property
+    def hip_x(self): return self._get_column(_DataIteration._HIP_X)
+    @property
+    def hip_y(self): return self._get_column(_DataIteration._HIP_Y)
+    @property
+    def hip_z(self): return self._get_constant(0.0)
+    @property
+    def shoulder_x(self): return self._get_column(_DataIteration._SHOULDER_X)
+    @property
+    def shoulder_y(self): return self._get_column(_DataIteration._SHOULDER_Y)
+    @property
+    def shoulder_z(self): return self._get_constant(0.0)
+    @property
+    def elbow_x(self): return self._get_column(_DataIteration._ELBOW_X)
+    @property
+    def elbow_y(self): return self._get_column(_DataIteration._ELBOW_Y)
+    @property
+    def elbow_z(self): return self._get_constant(0.0)
+    @property
+    def wrist_x(self): return self._get_column(_DataIteration._WRIST_X)
+    @property
+    def wrist_y(self): return self._get_column(_DataIteration._WRIST_Y)
+    @property
+    def wrist_z(self): return self._get_constant(0.0)
+    @property
+    def end_effector_x(self): return self._get_column(_DataIteration._END_EFFECTOR_X)
+    @property
+    def end_effector_y(self): return self._get_column(_DataIteration._END_EFFECTOR_Y)
+    @property
+    def end_effector_z(self): return self._get_constant(0.0)
+    @property
+    def target_x(self): return self._get_column(_DataIteration._TARGET_X)
+    @property
+    def target_y(self): return self._get_column(_DataIteration._TARGET_Y)
+    @property
+    def target_z(self): return self._get_constant(0.0)
+
 
 class DataManager:
 
@@ -94,20 +190,50 @@ class DataManager:
         TYPE_REACH,
         TYPE_DWELL,
     ]
+
+    KINEMATICS_CKATOOL = 0
+    KINEMATICS_NUMPY   = 1 # Vectorized computation (kinematics module), a few NumPy passes per iteration
+
+    _KINEMATICS = [
+        KINEMATICS_CKATOOL,
+        KINEMATICS_NUMPY,
+    ]
+
+    KINEMATICS_NUMPY_VALIDATED = False # The NumPy kinematics match CKATool (parity tests of tests/test_kinematics.py run with CKATool), the scripts only allow them once set
+
+    KINEMATICS_VERSION = 1 # Version of the kinematics computation (this module and the kinematics module), to increment when the results change
     
-    def __init__(self, ref_vector, folder, date):
+    def __init__(self, ref_vector, folder, date, writer = None, kinematics_type = KINEMATICS_CKATOOL, min_data = 16, save_coordinates = True):
+        # Check the kinematics type
+        if kinematics_type not in DataManager._KINEMATICS: raise RuntimeError("The kinematics type does not exist")
+
+        # Import CKATool, only for its kinematics (slow to import, imported again by the computation from the loaded modules)
+        if kinematics_type == DataManager.KINEMATICS_CKATOOL: import ckatool
+
+        self._kinematics_type = kinematics_type
         self._iteration_number = 0
         self._iteration_side = 0
         self._iteration_type = 0
         self._iteration_id = 0
         self._iteration = None
         self._last_iterations = {}
+        self._headers_written = False
+        self._save_coordinates = save_coordinates # False : only the kinematics are written (ex : recomputed from saved coordinates)
+
+        # Set the worker, for the computation of kinematics outside of the game loop
+        # Only one worker : the iterations are computed and written in order
+        self._executor = ThreadPoolExecutor(max_workers=1)
 
         # Set the reference vector, for the computation of the trunk compensation
         self._reference = ref_vector
+        self._reference_norm = math.sqrt(ref_vector[0] * ref_vector[0] + ref_vector[1] * ref_vector[1] + ref_vector[2] * ref_vector[2])
 
         # Set the minimum data, for the computation of kinematics, as CKATool crashes when there is not enough data
-        self._min_data = 16
+        self._min_data = min_data
+
+        # Set the writer, shared with the other managers of the session or owned
+        self._own_writer = writer is None
+        self._writer = SessionWriter() if writer is None else writer
 
         # Create the folder
         os.makedirs(folder, exist_ok=True) # Avoid already existing error
@@ -121,9 +247,13 @@ class DataManager:
             self._kinematics_file = os.path.join(folder, date + "-kinematics.csv")
 
     def close(self):
-        pass
+        # Wait for the pending iterations
+        self._executor.shutdown(wait=True)
+
+        # Write the pending data
+        if self._own_writer: self._writer.close()
 
-    def start_iteration(self, side, type, id):
+    def start_iteration(self, side, type, id, iteration = None):
         # Check the side
         if side not in DataManager._SIDES: raise RuntimeError("The side does not exist")
 
@@ -135,46 +265,27 @@ class DataManager:
         if it is not None: raise RuntimeError("The iteration already exists")
 
         # Set the iteration
-        self._iteration_number = self._iteration_number + 1
+        # The iteration number is given when recomputing archived iterations
+        self._iteration_number = self._iteration_number + 1 if iteration is None else iteration
         self._iteration_side = side
         self._iteration_type = type
         self._iteration_id = id
-        self._iteration = _DataIteration()
+        self._iteration = _DataIteration(side, type, id, self._iteration_number)
 
     def end_iteration(self):
-        # Check the iteration
-        it = self._iteration
-        it_nbr = self._iteration_number
-        if it is None: raise RuntimeError("The iteration does not exist")
-
-        # Check the data
-        if len(it.iteration) == 0: raise RuntimeError("The iteration contains no data")
-        
-        # Create the CKATool objects
-        side = "right" if self._iteration_side == DataManager.SIDE_RIGHT else "left"
-        neck = ckatool.Neck(it.timestamp, it.neck_x, it.neck_y, it.neck_z, it.iteration)
-        hip = ckatool.Hip(it.timestamp, it.hip_x, it.hip_y, it.hip_z, it.iteration)
-        shoulder = ckatool.Shoulder(it.timestamp, it.shoulder_x, it.shoulder_y, it.shoulder_z, it.iteration, side)
-        elbow = ckatool.Elbow(it.timestamp, it.elbow_x, it.elbow_y, it.elbow_z, it.iteration, side)
-        wrist = ckatool.Wrist(it.timestamp, it.wrist_x, it.wrist_y, it.wrist_z, it.iteration, side)
-        end_effector = ckatool.EndEffector(it.timestamp, it.end_effector_x, it.end_effector_y, it.end_effector_z, it.iteration)
-        target = ckatool.Target(it.timestamp, it.target_x, it.target_y, it.target_z, it.iteration)
+        # Detach the iteration
+        args = self._detach_iteration()
 
-        # Compute the kinematics
-        self._compute_kinematics(neck, hip, shoulder, elbow, wrist, end_effector, target)
-        self._save_kinematics(it, it_nbr, neck, hip, shoulder, elbow, wrist, end_effector, target)
-        
-        # Write the headers
-        if self._iteration_number == 1:
-            self._write_coordinates_header()
-            self._write_kinematics_header()
+        # Compute and save the iteration
+        self._end_iteration(*args)
 
-        # Write the data
-        self._write_coordinates_data(it)
-        self._write_kinematics_data(it)
+    def end_iteration_async(self):
+        # Detach the iteration, a new iteration can start immediately
+        args = self._detach_iteration()
 
-        self._last_iterations[self._iteration_type] = self._iteration # Save the iteration
-        self._iteration = None # Unset the iteration
+        # Compute and save the iteration in the worker
+        future = self._executor.submit(self._end_iteration, *args)
+        return future
 
     def get_last_iteration(self, type):
         # Check the type
@@ -193,35 +304,25 @@ class DataManager:
         if it is None: raise RuntimeError("The iteration does not exist")
 
         # Add the data
-        it.side.append(self._iteration_side)
-        it.type.append(self._iteration_type)
-        it.id.append(self._iteration_id)
-        it.iteration.append(self._iteration_number)
-        it.timestamp.append(timestamp)
-        it.neck_x.append(neck_x)
-        it.neck_y.append(neck_y)
-        it.neck_z.append(0)
-        it.hip_x.append(hip_x)
-        it.hip_y.append(hip_y)
-        it.hip_z.append(0)
-        it.shoulder_x.append(shoulder_x)
-        it.shoulder_y.append(shoulder_y)
-        it.shoulder_z.append(0)
-        it.elbow_x.append(elbow_x)
-        it.elbow_y.append(elbow_y)
-        it.elbow_z.append(0)
-        it.wrist_x.append(wrist_x)
-        it.wrist_y.append(wrist_y)
-        it.wrist_z.append(0)
-        it.end_effector_x.append(end_effector_x)
-        it.end_effector_y.append(end_effector_y)
-        it.end_effector_z.append(0)
-        it.target_x.append(target_x)
-        it.target_y.append(target_y)
-        it.target_z.append(0)
+        it.append(
+            timestamp, neck_x, neck_y, hip_x, hip_y, shoulder_x, shoulder_y, elbow_x,
+            elbow_y, wrist_x, wrist_y, end_effector_x, end_effector_y, target_x, target_y
+        )
+
+        # Update the trunk angle
+        trunk_angle = self._get_trunk_angle(neck_x, neck_y, hip_x, hip_y)
+        if len(it) == 1: it.trunk_start_angle = trunk_angle
+        it.trunk_end_angle = trunk_angle
+
+        return self.has_enough_data()
+
+    def has_enough_data(self):
+        # Check the iteration
+        it = self._iteration
+        if it is None: raise RuntimeError("The iteration does not exist")
 
         # Check the number of data
-        number_of_data = len(self._iteration.side)
+        number_of_data = len(it)
         enough_data = number_of_data >= self._min_data
 
         return enough_data
@@ -232,28 +333,98 @@ class DataManager:
         if it is None: raise RuntimeError("The iteration does not exist")
 
         # Check the data
-        if len(it.iteration) <= 1: return 0
+        if len(it) <= 1: return 0
         
-        # Get a subset of the data
-        timestamp = [it.timestamp[0], it.timestamp[-1]]
-        iteration = [it.iteration[0], it.iteration[-1]]
-        neck_x = [it.neck_x[0], it.neck_x[-1]]
-        neck_y = [it.neck_y[0], it.neck_y[-1]]
-        neck_z = [it.neck_z[0], it.neck_z[-1]]
-        hip_x = [it.hip_x[0], it.hip_x[-1]]
-        hip_y = [it.hip_y[0], it.hip_y[-1]]
-        hip_z = [it.hip_z[0], it.hip_z[-1]]
-
-        # Create the CKATool objects
-        neck = ckatool.Neck(timestamp, neck_x, neck_y, neck_z, iteration)
-        hip = ckatool.Hip(timestamp, hip_x, hip_y, hip_z, iteration)
-
-        # Compute the trunk displacement
-        neck.calculate_trunk_angle(hip, self._reference)
-        trunk_displacement = abs(neck.trunk_angle[-1] - neck.trunk_angle[0])
+        # Compute the trunk displacement, between the first and the last data
+        trunk_displacement = abs(it.trunk_end_angle - it.trunk_start_angle)
 
         return trunk_displacement
 
+    def _get_trunk_angle(self, neck_x, neck_y, hip_x, hip_y):
+        # Angle between the trunk vector (hip to neck) and the reference vector, as CKATool computes it
+        # The z coordinates are always 0
+        trunk_x = neck_x - hip_x
+        trunk_y = neck_y - hip_y
+        trunk_norm = math.sqrt(trunk_x * trunk_x + trunk_y * trunk_y)
+        if trunk_norm == 0 or self._reference_norm == 0: return 0
+
+        cos_angle = (trunk_x * self._reference[0] + trunk_y * self._reference[1]) / (trunk_norm * self._reference_norm)
+        cos_angle = min(1.0, max(-1.0, cos_angle)) # Avoid floating point rounding error
+        trunk_angle = math.degrees(math.acos(cos_angle))
+
+        return trunk_angle
+
+    def _detach_iteration(self):
+        # Check the iteration
+        it = self._iteration
+        if it is None: raise RuntimeError("The iteration does not exist")
+
+        # Check the data
+        if len(it) == 0: raise RuntimeError("The iteration contains no data")
+
+        it.trim() # Only the data is kept, for the last iterations
+        self._iteration = None # Unset the iteration
+
+        return [it, self._iteration_number, self._iteration_side, self._iteration_type]
+
+    def _end_iteration(self, it, it_nbr, it_side, it_type):
+        # Compute the kinematics
+        if self._kinematics_type == DataManager.KINEMATICS_CKATOOL:
+            self._compute_ckatool_kinematics(it, it_nbr, it_side)
+        elif self._kinematics_type == DataManager.KINEMATICS_NUMPY:
+            self._compute_numpy_kinematics(it)
+        
+        # Write the headers
+        if not self._headers_written:
+            if self._save_coordinates: self._write_coordinates_header()
+            self._write_kinematics_header()
+            self._headers_written = True
+
+        # Write the data
+        if self._save_coordinates: self._write_coordinates_data(it)
+        self._write_kinematics_data(it)
+
+        self._last_iterations[it_type] = it # Save the iteration
+
+        return it
+
+    def _compute_ckatool_kinematics(self, it, it_nbr, it_side):
+        import ckatool
+        # Create the CKATool objects, with Python lists as before the columnar storage (the columns are views, and the constants are read-only)
+        side = "right" if it_side == DataManager.SIDE_RIGHT else "left"
+        timestamp = it.timestamp.tolist()
+        iteration = it.iteration.tolist()
+        z = it.neck_z.tolist() # Always 0
+        neck = ckatool.Neck(timestamp, it.neck_x.tolist(), it.neck_y.tolist(), z, iteration)
+        hip = ckatool.Hip(timestamp, it.hip_x.tolist(), it.hip_y.tolist(), list(z), iteration)
+        shoulder = ckatool.Shoulder(timestamp, it.shoulder_x.tolist(), it.shoulder_y.tolist(), list(z), iteration, side)
+        elbow = ckatool.Elbow(timestamp, it.elbow_x.tolist(), it.elbow_y.tolist(), list(z), iteration, side)
+        wrist = ckatool.Wrist(timestamp, it.wrist_x.tolist(), it.wrist_y.tolist(), list(z), iteration, side)
+        end_effector = ckatool.EndEffector(timestamp, it.end_effector_x.tolist(), it.end_effector_y.tolist(), list(z), iteration)
+        target = ckatool.Target(timestamp, it.target_x.tolist(), it.target_y.tolist(), list(z), iteration)
+
+        # Compute the kinematics
+        self._compute_kinematics(neck, hip, shoulder, elbow, wrist, end_effector, target)
+        self._save_kinematics(it, it_nbr, neck, hip, shoulder, elbow, wrist, end_effector, target)
+
+    def _compute_numpy_kinematics(self, it):
+        # Compute the kinematics on the column views
+        result = Kinematics.compute(
+            it.timestamp,
+            [it.neck_x, it.neck_y],
+            [it.hip_x, it.hip_y],
+            [it.shoulder_x, it.shoulder_y],
+            [it.elbow_x, it.elbow_y],
+            [it.wrist_x, it.wrist_y],
+            [it.end_effector_x, it.end_effector_y],
+            [it.target_x, it.target_y],
+            self._reference
+        )
+
+        # Save the kinematics, the names are the attributes of the iteration
+        for name in result:
+            setattr(it, name, result[name])
+
     def _compute_kinematics(self, neck, hip, shoulder, elbow, wrist, end_effector, target):
         neck.calculate_trunk_angle(hip, self._reference)
 
@@ -352,32 +523,29 @@ class DataManager:
             "end_effector_x", "end_effector_y", "end_effector_z",
             "target_x", "target_y", "target_z"
         ]
-        header_str = ",".join(header)
-
         # Write the header
-        with open(self._coordinates_file, "a") as file: file.write(header_str + "\n")
+        self._writer.write_row(self._coordinates_file, header)
 
     def _write_coordinates_data(self, it):
-        with open(self._coordinates_file, "a") as file:
-            i = 0
-            while i < len(it.iteration):
-                # Get the line
-                line = [
-                    it.side[i], it.type[i], it.id[i], it.iteration[i], it.timestamp[i],
-                    it.neck_x[i], it.neck_y[i], it.neck_z[i],
-                    it.hip_x[i], it.hip_y[i], it.hip_z[i],
-                    it.shoulder_x[i], it.shoulder_y[i], it.shoulder_z[i],
-                    it.elbow_x[i], it.elbow_y[i], it.elbow_z[i],
-                    it.wrist_x[i], it.wrist_y[i], it.wrist_z[i],
-                    it.end_effector_x[i], it.end_effector_y[i], it.end_effector_z[i],
-                    it.target_x[i], it.target_y[i], it.target_z[i]
-                ]
-                line_str = ",".join(str(data) for data in line)
-                                
-                # Write the line
-                file.write(line_str + "\n")
-
-                i = i + 1
+        # Get the constant part of the lines
+        prefix = [it.iteration_side, it.iteration_type, it.iteration_id, it.iteration_number]
+
+        # Get the lines
+        lines = []
+        for row in it.get_rows():
+            lines.append(prefix + [
+                row[_DataIteration._TIMESTAMP],
+                row[_DataIteration._NECK_X], row[_DataIteration._NECK_Y], 0,
+                row[_DataIteration._HIP_X], row[_DataIteration._HIP_Y], 0,
+                row[_DataIteration._SHOULDER_X], row[_DataIteration._SHOULDER_Y], 0,
+                row[_DataIteration._ELBOW_X], row[_DataIteration._ELBOW_Y], 0,
+                row[_DataIteration._WRIST_X], row[_DataIteration._WRIST_Y], 0,
+                row[_DataIteration._END_EFFECTOR_X], row[_DataIteration._END_EFFECTOR_Y], 0,
+                row[_DataIteration._TARGET_X], row[_DataIteration._TARGET_Y], 0
+            ])
+
+        # Write the lines
+        self._writer.write_rows(self._coordinates_file, lines)
 
     def _write_kinematics_header(self):
         # Get the header
@@ -395,15 +563,13 @@ class DataManager:
             "trunk_displacement", "shoulder_displacement", "elbow_displacement",
             "target_error_distance", "hand_path_ratio"
         ]
-        header_str = ",".join(header)
-
         # Write the header
-        with open(self._kinematics_file, "a") as file: file.write(header_str + "\n")
+        self._writer.write_row(self._kinematics_file, header)
 
     def _write_kinematics_data(self, it):
         # Get the line
         line = [
-            it.side[0], it.type[0], it.id[0], it.iteration[0], it.timestamp[0], it.timestamp[-1],
+            it.iteration_side, it.iteration_type, it.iteration_id, it.iteration_number, it.timestamp[0], it.timestamp[-1],
             it.shoulder_number_of_velocity_peaks, it.elbow_number_of_velocity_peaks, it.wrist_number_of_velocity_peaks,
             it.shoulder_ratio_mean_peak_velocity, it.elbow_ratio_mean_peak_velocity, it.wrist_ratio_mean_peak_velocity,
             it.shoulder_mean_velocity, it.elbow_mean_velocity, it.wrist_mean_velocity,
@@ -416,7 +582,6 @@ class DataManager:
             it.trunk_displacement, it.shoulder_displacement, it.elbow_displacement,
             it.target_error_distance, it.hand_path_ratio,
         ]
-        line_str = ",".join(str(data) for data in line)
         
         # Write the line
-        with open(self._kinematics_file, "a") as file: file.write(line_str + "\n")
\ No newline at end of file
+        self._writer.write_row(self._kinematics_file, line)
\ No newline at end of file
@@ -1,8 +1,55 @@
 import os
+import time
 import random
-import cloudpickle
-import pandas
-from collections import deque
+import numpy
+from session_writer import SessionWriter
+from rolling_window import RollingWindow
+from linear_bandit import LinearBandit
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+
+class _OnlineStandardizer:
+
+    @staticmethod
+    def create_from_scaler(scaler):
+        # Continue the statistics of a fitted scikit-learn StandardScaler
+        return _OnlineStandardizer.create_from_statistics(scaler.mean_, scaler.var_, float(numpy.max(scaler.n_samples_seen_)))
+
+    @staticmethod
+    def create_from_statistics(mean, var, n_samples):
+        obj = _OnlineStandardizer(mean.shape[0])
+        obj.n_samples = n_samples
+        obj.mean[:] = mean
+        obj.m2[:] = var * n_samples
+        obj._update_scale()
+        return obj
+
+    def __init__(self, n_features):
+        self.n_samples = 0
+        self.mean = numpy.zeros(n_features)
+        self.m2 = numpy.zeros(n_features) # Sum of the squared differences from the mean
+        self.scale = numpy.ones(n_features)
+        self._delta = numpy.zeros(n_features)
+
+    def partial_fit(self, sample):
+        # Welford update, with one sample (same statistics as StandardScaler.partial_fit)
+        sample = sample.reshape(-1)
+        self.n_samples += 1
+        numpy.subtract(sample, self.mean, out=self._delta)
+        self.mean += self._delta / self.n_samples
+        self.m2 += self._delta * (sample - self.mean)
+        self._update_scale()
+
+    def transform(self, sample, out):
+        numpy.subtract(sample, self.mean, out=out)
+        numpy.divide(out, self.scale, out=out)
+        return out
+
+    def _update_scale(self):
+        # Standard deviation, the features without variance are not scaled (as StandardScaler)
+        variance = self.m2 / self.n_samples if self.n_samples > 0 else numpy.zeros_like(self.m2)
+        numpy.sqrt(variance, out=self.scale)
+        self.scale[self.scale < 10 * numpy.finfo(self.scale.dtype).eps] = 1.0
 
 
 class DifficulyAdapter:
@@ -22,7 +69,22 @@ class DifficulyAdapter:
     _PARAMETER_TYPE_TARGET_SIZE = 1
     _PARAMETER_TYPE_REACH_TIME = 2
 
-    def __init__(self, type, pretrained_model_path, goal_score, margin_score, diff_start, diff_increment, window_size_score, window_size_metrics, folder, date):
+    # Context of the data-based DDA, in the column order used for the training (model_training.CONTEXT_COLS)
+    _CONTEXT_COLS = [
+        "diff_target_distance",
+        "diff_target_size",
+        "diff_reach_time",
+        "window_reach_wrist_number_of_velocity_peaks",
+        "window_reach_wrist_mean_velocity",
+        "window_reach_wrist_sparc",
+        "window_reach_wrist_jerk",
+        "window_reach_trunk_rom",
+        "window_reach_hand_path_ratio",
+        "window_has_dwell",
+        "window_dwell_wrist_mean_velocity",
+    ]
+
+    def __init__(self, type, pretrained_model_path, goal_score, margin_score, diff_start, diff_increment, window_size_score, window_size_metrics, folder, date, writer = None, decision_deadline_ms = None):
         # Check the type
         if type not in DifficulyAdapter._TYPES: raise RuntimeError("The type does not exist")
 
@@ -37,6 +99,10 @@ class DifficulyAdapter:
         self._folder = folder
         self._date = date
 
+        # Set the writer, shared with the other managers of the session or owned
+        self._own_writer = writer is None
+        self._writer = SessionWriter() if writer is None else writer
+
         # Create the folder
         os.makedirs(folder, exist_ok=True) # Avoid already existing error
 
@@ -60,20 +126,20 @@ class DifficulyAdapter:
         self._reach_iteration = None
         self._dwell_iteration = None
         
-        self._target_succeeded = deque(maxlen=window_size_score)
+        self._target_succeeded = RollingWindow(window_size_score)
 
-        self._trunk_failed = deque(maxlen=window_size_metrics)
-        self._reach_failed = deque(maxlen=window_size_metrics)
-        self._dwell_failed = deque(maxlen=window_size_metrics)
+        self._trunk_failed = RollingWindow(window_size_metrics)
+        self._reach_failed = RollingWindow(window_size_metrics)
+        self._dwell_failed = RollingWindow(window_size_metrics)
 
-        self._reach_wrist_number_of_velocity_peaks = deque(maxlen=window_size_metrics)
-        self._reach_wrist_mean_velocity = deque(maxlen=window_size_metrics)
-        self._reach_wrist_sparc = deque(maxlen=window_size_metrics)
-        self._reach_wrist_jerk = deque(maxlen=window_size_metrics)
-        self._reach_trunk_rom = deque(maxlen=window_size_metrics)
-        self._reach_hand_path_ratio = deque(maxlen=window_size_metrics)
-        self._has_dwell = deque(maxlen=window_size_metrics)
-        self._dwell_wrist_mean_velocity = deque(maxlen=window_size_metrics)
+        self._reach_wrist_number_of_velocity_peaks = RollingWindow(window_size_metrics)
+        self._reach_wrist_mean_velocity = RollingWindow(window_size_metrics)
+        self._reach_wrist_sparc = RollingWindow(window_size_metrics)
+        self._reach_wrist_jerk = RollingWindow(window_size_metrics)
+        self._reach_trunk_rom = RollingWindow(window_size_metrics)
+        self._reach_hand_path_ratio = RollingWindow(window_size_metrics)
+        self._has_dwell = RollingWindow(window_size_metrics)
+        self._dwell_wrist_mean_velocity = RollingWindow(window_size_metrics)
 
         self._last_score = None
         self._last_window_score = None
@@ -82,8 +148,18 @@ class DifficulyAdapter:
         self._model = None
         self._scaler = None
         
-        self._last_context = None
-        self._last_context_scaled = None
+        # The contexts are preallocated, one row in the order of _CONTEXT_COLS
+        n_context_cols = len(DifficulyAdapter._CONTEXT_COLS)
+        self._last_context = numpy.zeros((1, n_context_cols))
+        self._last_context_scaled = numpy.zeros((1, n_context_cols))
+        self._next_context = numpy.zeros((1, n_context_cols))
+
+        # Asynchronous decision (data-based DDA), None : the model runs synchronously in get_parameters
+        self._decision_deadline_ms = decision_deadline_ms
+        self._decision_executor = None
+        self._decision = None # [future, submission timestamp, too hard, too easy]
+        self._late_decision = None # Future of a decision that missed the deadline
+        self._n_missed_deadlines = 0
         
         # Init DDA
         if type == DifficulyAdapter.TYPE_RANDOM_BASED:
@@ -94,7 +170,11 @@ class DifficulyAdapter:
             self._init_data_based()
 
     def close(self):
-        pass
+        # Wait for the pending decision
+        if self._decision_executor is not None: self._decision_executor.shutdown(wait=True)
+
+        # Write the pending data
+        if self._own_writer: self._writer.close()
 
     def _init_random_based(self):
         if self._pretrained_model_path is not None:
@@ -108,10 +188,37 @@ class DifficulyAdapter:
         if self._pretrained_model_path is None:
             raise RuntimeError("A pretrained model is required for data-based DDA")
         
+        # Load the model, the .npz format (linear models only) does not need mabwiser and scikit-learn
+        if os.path.splitext(self._pretrained_model_path)[1] == ".npz":
+            self._load_npz_model()
+        else:
+            self._load_pkl_model()
+
+        # Check the context
+        if self._scaler.mean.shape[0] != len(DifficulyAdapter._CONTEXT_COLS):
+            raise RuntimeError("The pretrained model does not use the context of the DDA")
+        
+        # Set the worker, for the asynchronous decision
+        # Only one worker : the model updates and predictions are applied in order
+        if self._decision_deadline_ms is not None:
+            self._decision_executor = ThreadPoolExecutor(max_workers=1)
+
+    def _load_npz_model(self):
+        result = LinearBandit.load(self._pretrained_model_path)
+        self._model = result[0]
+        self._scaler = _OnlineStandardizer.create_from_statistics(*result[1])
+
+        # Check the context columns
+        if result[2] != DifficulyAdapter._CONTEXT_COLS:
+            raise RuntimeError("The pretrained model does not use the context of the DDA")
+
+    def _load_pkl_model(self):
+        import cloudpickle # Also imports mabwiser and scikit-learn, slow
+
         with open(self._pretrained_model_path, "rb") as file:
             model = cloudpickle.load(file)
             self._model = model["model"]
-            self._scaler = model["scaler"]
+            self._scaler = _OnlineStandardizer.create_from_scaler(model["scaler"])
 
     def get_parameters(self, id):
         self._id = id
@@ -148,6 +255,8 @@ class DifficulyAdapter:
             parameter = self._get_random_based_parameter(too_hard, too_easy)
         elif self._type == DifficulyAdapter.TYPE_RULE_BASED:
             parameter = self._get_rule_based_parameter(too_hard, too_easy)
+        elif self._type == DifficulyAdapter.TYPE_DATA_BASED and self._decision is not None:
+            parameter = self._get_data_based_decision(too_hard, too_easy)
         elif self._type == DifficulyAdapter.TYPE_DATA_BASED:
             parameter = self._get_data_based_parameter(too_hard, too_easy)
 
@@ -230,6 +339,9 @@ class DifficulyAdapter:
         # Write data
         self._write_data()
 
+        # Prepare the next decision in the background, the results of the target are known
+        if self._decision_executor is not None: self._submit_data_based_decision()
+
     def _get_min_max_diff_value(self, value):
         value = min(value, 1.0)
         value = max(value, 0.0)
@@ -311,41 +423,90 @@ class DifficulyAdapter:
         return parameter
 
     def _get_data_based_parameter(self, too_hard, too_easy):
+        # Get the reward and the context, from the state of the DDA
+        reward = self._get_window_score_improvement()
+        self._fill_context(self._next_context[0])
+
+        # Run the model
+        parameter = self._run_model(self._adjusted_parameter, reward, too_hard, too_easy)
+
+        return parameter
+
+    def _submit_data_based_decision(self):
+        # Wait for the late decision, the model and the contexts are used by one decision at a time
+        if self._late_decision is not None: self._late_decision.result()
+        self._late_decision = None
+
+        # Get the difficulty status (too hard, too easy, OK), as get_parameters will
+        window_score = self._get_window_score()
+        too_hard = self._is_difficulty_too_high(window_score)
+        too_easy = self._is_difficulty_too_low(window_score)
+
+        # Get the reward and the context, from the state of the DDA (the worker does not read it)
+        reward = self._get_window_score_improvement()
+        self._fill_context(self._next_context[0])
+
+        # Run the model in the worker
+        future = self._decision_executor.submit(self._run_model, self._adjusted_parameter, reward, too_hard, too_easy)
+        self._decision = [future, time.monotonic(), too_hard, too_easy]
+
+    def _get_data_based_decision(self, too_hard, too_easy):
+        future, submission_ts, decision_too_hard, decision_too_easy = self._decision
+        self._decision = None
+
+        # Check the decision
+        if decision_too_hard != too_hard or decision_too_easy != too_easy: raise RuntimeError("The decision does not match the difficulty status")
+
+        # Wait for the model, until the deadline
+        remaining_time_ms = self._decision_deadline_ms - (time.monotonic() - submission_ts) * 1000
+        try:
+            parameter = future.result(timeout=max(0, remaining_time_ms) / 1000)
+        except TimeoutError:
+            # The model is too slow, use the rule-based DDA for this target
+            # The model is still updated with the parameter actually adjusted, on the next decision
+            self._n_missed_deadlines += 1
+            self._late_decision = future # Waited for on the next submission
+            parameter = self._get_rule_based_parameter(too_hard, too_easy)
+
+        return parameter
+
+    def _run_model(self, adjusted_parameter, reward, too_hard, too_easy):
         # The Contextual Bandits ran
         # Update the data scaler, the scaling parameters (mean and standard deviation per feature) change over time (as the data arrives one by one)
         # Update also the Contextual Bandits
-        if self._adjusted_parameter != DifficulyAdapter._PARAMETER_TYPE_NONE:
+        if adjusted_parameter != DifficulyAdapter._PARAMETER_TYPE_NONE:
             self._scaler.partial_fit(self._last_context)
-            reward = self._get_window_score_improvement()
-            self._model.partial_fit(decisions=[self._adjusted_parameter], rewards=[reward], contexts=self._last_context_scaled)
+            self._model.partial_fit(decisions=[adjusted_parameter], rewards=[reward], contexts=self._last_context_scaled)
 
         # The difficulty is OK
         if not too_hard and not too_easy:
             return DifficulyAdapter._PARAMETER_TYPE_NONE
 
         # Get the context
-        self._last_context = pandas.DataFrame([{
-            "diff_target_distance" : self._diff_target_distance,
-            "diff_target_size" : self._diff_target_size,
-            "diff_reach_time" : self._diff_reach_time,
-            "window_reach_wrist_number_of_velocity_peaks" : self._get_window_metric_score(self._reach_wrist_number_of_velocity_peaks),
-            "window_reach_wrist_mean_velocity" : self._get_window_metric_score(self._reach_wrist_mean_velocity),
-            "window_reach_wrist_sparc" : self._get_window_metric_score(self._reach_wrist_sparc),
-            "window_reach_wrist_jerk" : self._get_window_metric_score(self._reach_wrist_jerk),
-            "window_reach_trunk_rom" : self._get_window_metric_score(self._reach_trunk_rom),
-            "window_reach_hand_path_ratio" : self._get_window_metric_score(self._reach_hand_path_ratio),
-            "window_has_dwell" : self._get_window_metric_score(self._has_dwell),
-            "window_dwell_wrist_mean_velocity" : self._get_window_metric_score(self._dwell_wrist_mean_velocity),
-        }])
+        self._last_context[:] = self._next_context
 
         # Normalize the context
-        self._last_context_scaled = self._scaler.transform(self._last_context)
+        self._scaler.transform(self._last_context, self._last_context_scaled)
 
         # Choose the parameter to adjust (pull the arm)
         parameter = self._model.predict(self._last_context_scaled)
 
         return parameter
 
+    def _fill_context(self, context):
+        # Same order as _CONTEXT_COLS
+        context[0] = self._diff_target_distance
+        context[1] = self._diff_target_size
+        context[2] = self._diff_reach_time
+        context[3] = self._get_window_metric_score(self._reach_wrist_number_of_velocity_peaks)
+        context[4] = self._get_window_metric_score(self._reach_wrist_mean_velocity)
+        context[5] = self._get_window_metric_score(self._reach_wrist_sparc)
+        context[6] = self._get_window_metric_score(self._reach_wrist_jerk)
+        context[7] = self._get_window_metric_score(self._reach_trunk_rom)
+        context[8] = self._get_window_metric_score(self._reach_hand_path_ratio)
+        context[9] = self._get_window_metric_score(self._has_dwell)
+        context[10] = self._get_window_metric_score(self._dwell_wrist_mean_velocity)
+
     def get_score(self):
         n_targets = self._n_targets
         n_successes = self._n_targets_succeeded
@@ -358,17 +519,19 @@ class DifficulyAdapter:
         str_score = str(n_successes) + "/" + str(n_targets)
         return str_score
 
+    def get_n_targets(self):
+        return self._n_targets
+
+    def get_missed_deadlines(self):
+        return self._n_missed_deadlines
+
     def _get_window_score(self):
         score = self._get_window_metric_score(self._target_succeeded)
         return score
             
     def _get_window_metric_score(self, metric):
-        total_metric = 0
-        n_metric = 0
-        for c_metric in metric:
-            total_metric += c_metric
-            n_metric += 1
-        score = total_metric / n_metric if n_metric > 0 else 0
+        # Running mean of the window, O(1)
+        score = metric.get_mean()
         return score
 
     def _get_window_score_improvement(self):
@@ -431,10 +594,8 @@ class DifficulyAdapter:
             "reach_wrist_number_of_velocity_peaks", "reach_wrist_mean_velocity", "reach_wrist_sparc", "reach_wrist_jerk", "reach_trunk_rom", "reach_hand_path_ratio", "has_dwell", "dwell_wrist_mean_velocity",
             "window_reach_wrist_number_of_velocity_peaks", "window_reach_wrist_mean_velocity", "window_reach_wrist_sparc", "window_reach_wrist_jerk", "window_reach_trunk_rom", "window_reach_hand_path_ratio", "window_has_dwell", "window_dwell_wrist_mean_velocity",
         ]
-        header_str = ",".join(header)
-
         # Write the header
-        with open(self._scores_file, "a") as file: file.write(header_str + "\n")
+        self._writer.write_row(self._scores_file, header)
 
     def _write_data(self):
         # Get the start timestamp
@@ -458,7 +619,6 @@ class DifficulyAdapter:
             self._reach_wrist_number_of_velocity_peaks[-1], self._reach_wrist_mean_velocity[-1], self._reach_wrist_sparc[-1], self._reach_wrist_jerk[-1], self._reach_trunk_rom[-1], self._reach_hand_path_ratio[-1], self._has_dwell[-1], self._dwell_wrist_mean_velocity[-1],
             self._get_window_metric_score(self._reach_wrist_number_of_velocity_peaks), self._get_window_metric_score(self._reach_wrist_mean_velocity), self._get_window_metric_score(self._reach_wrist_sparc), self._get_window_metric_score(self._reach_wrist_jerk), self._get_window_metric_score(self._reach_trunk_rom), self._get_window_metric_score(self._reach_hand_path_ratio), self._get_window_metric_score(self._has_dwell), self._get_window_metric_score(self._dwell_wrist_mean_velocity),
         ]
-        line_str = ",".join(str(data) for data in line)
         
         # Write the line
-        with open(self._scores_file, "a") as file: file.write(line_str + "\n")
\ No newline at end of file
+        self._writer.write_row(self._scores_file, line)
\ No newline at end of file
@@ -1,5 +1,8 @@
-import pygame
+import math
 import time
+import bisect
+import heapq
+from collections import OrderedDict
 
 
 class _GameBackground:
@@ -25,22 +28,128 @@ class _GameBackground:
     @staticmethod
     def create_background_image(image):
         obj = _GameBackground(_GameBackground.IMAGE)
-        obj.image = image
+        obj.set_image(image)
         return obj
     
     def __init__(self, type):
         self.type = type
         self.color = None
         self.image = None
+        self.image_surface = None # Copy of the image, owned by the background (reused by the next images)
+        self.scaled_surface = None # Image scaled to the drawing surface, reused by the next images
+
+    def set_image(self, image):
+        import pygame
+        # Copy the image (RGB, [height, width], any strides) to a surface, once per image (about 0.4 ms at 640x480)
+        # A surface that wraps the image memory would be overwritten by the capture thread (recycled images) while it is scaled or drawn
+        self.image = image
+        size = (image.shape[1], image.shape[0])
+        if self.image_surface is None or self.image_surface.get_size() != size:
+            self.image_surface = pygame.Surface(size, 0, 24)
+        pygame.surfarray.blit_array(self.image_surface, image.swapaxes(0, 1)) # [width, height] view, without copy
 
     def draw(self, surface):
+        import pygame
         if self.type == _GameBackground.COLOR:
             # Fill the surface
             surface.fill(self.color)
         elif self.type == _GameBackground.IMAGE:
             # Copy the image to the surface
-            # Axes swap : source image is [height, width], Pygame expects [width, height]
-            pygame.surfarray.blit_array(surface, self.image.swapaxes(0, 1))
+            size = surface.get_size()
+            if self.image_surface.get_size() == size:
+                surface.blit(self.image_surface, (0, 0))
+                return
+
+            # Scale the image first (the camera is smaller than the canvas)
+            if self.scaled_surface is None or self.scaled_surface.get_size() != size:
+                self.scaled_surface = pygame.Surface(size, 0, self.image_surface) # Same format as the image
+            pygame.transform.scale(self.image_surface, size, self.scaled_surface)
+            surface.blit(self.scaled_surface, (0, 0))
+
+
+class _TextCache:
+
+    def __init__(self, max_size):
+        self._max_size = max_size # Max number of rendered texts
+        self._fonts = {} # Fonts by size
+        self._surfaces = OrderedDict() # Rendered texts by text, size and color, the least recently used first
+        self._n_hits = 0
+        self._n_misses = 0
+
+    def get_surface(self, text, text_size, color):
+        import pygame
+        # Get the rendered text, the color is normalized to be hashable (list, name or pygame.Color)
+        key = (text, text_size, tuple(pygame.Color(color)))
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self._n_hits += 1
+            return surface
+
+        # Get the font
+        font = self._fonts.get(text_size)
+        if font is None:
+            font = pygame.font.Font(None, text_size) # Default font
+            self._fonts[text_size] = font
+
+        # Render the text, the least recently used text is removed when the cache is full
+        surface = font.render(text, True, color) # Anti-aliasing enabled
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self._max_size: self._surfaces.popitem(last=False)
+        self._n_misses += 1
+        return surface
+
+    def get_stats(self):
+        return {
+            "text_cache_size" : len(self._surfaces),
+            "text_cache_hits" : self._n_hits,
+            "text_cache_misses" : self._n_misses,
+        }
+
+
+class _SpatialGrid:
+
+    def __init__(self, cell_size):
+        self._cell_size = cell_size # px, Size of the square cells
+        self._cells = {} # Ids of the objects by cell (column, row), only the occupied cells
+        self._object_ranges = {} # Cells of each object id (first column, first row, last column, last row)
+
+    def update(self, object_id, bounds):
+        # Move the object to the cells of its bounds (x1, y1, x2, y2), None : the object is removed
+        cell_range = None if bounds is None else self._get_cell_range(bounds)
+        if self._object_ranges.get(object_id) == cell_range: return # Same cells (small moves)
+
+        self.remove(object_id)
+        if cell_range is None: return
+        self._object_ranges[object_id] = cell_range
+        for cell in self._get_cells(cell_range):
+            self._cells.setdefault(cell, set()).add(object_id)
+
+    def remove(self, object_id):
+        cell_range = self._object_ranges.pop(object_id, None)
+        if cell_range is None: return
+
+        for cell in self._get_cells(cell_range):
+            object_ids = self._cells[cell]
+            object_ids.discard(object_id)
+            if not object_ids: del self._cells[cell]
+
+    def query(self, bounds):
+        # Ids of the objects in the cells of the bounds, the contacts are checked by the caller
+        object_ids = set()
+        for cell in self._get_cells(self._get_cell_range(bounds)):
+            cell_object_ids = self._cells.get(cell)
+            if cell_object_ids: object_ids.update(cell_object_ids)
+        return object_ids
+
+    def _get_cell_range(self, bounds):
+        x1, y1, x2, y2 = bounds
+        size = self._cell_size
+        return (int(x1 // size), int(y1 // size), int(x2 // size), int(y2 // size))
+
+    def _get_cells(self, cell_range):
+        column1, row1, column2, row2 = cell_range
+        return [(column, row) for column in range(column1, column2 + 1) for row in range(row1, row2 + 1)]
 
 
 class _GameObject:
@@ -60,8 +169,8 @@ class _GameObject:
         return _GameObject._OBJECTS
 
     @staticmethod
-    def create_object_circle(x, y, color, radius):
-        obj = _GameObject(_GameObject.CIRCLE)
+    def create_object_circle(x, y, color, radius, clock):
+        obj = _GameObject(_GameObject.CIRCLE, clock)
         obj.x1 = x
         obj.y1 = y
         obj.color = color
@@ -69,8 +178,8 @@ class _GameObject:
         return obj
 
     @staticmethod
-    def create_object_line(x1, y1, x2, y2, color, width):
-        obj = _GameObject(_GameObject.LINE)
+    def create_object_line(x1, y1, x2, y2, color, width, clock):
+        obj = _GameObject(_GameObject.LINE, clock)
         obj.x1 = x1
         obj.y1 = y1
         obj.x2 = x2
@@ -80,8 +189,8 @@ class _GameObject:
         return obj
 
     @staticmethod
-    def create_object_text(x, y, color, text, text_size):
-        obj = _GameObject(_GameObject.TEXT)
+    def create_object_text(x, y, color, text, text_size, clock):
+        obj = _GameObject(_GameObject.TEXT, clock)
         obj.x1 = x
         obj.y1 = y
         obj.color = color
@@ -89,9 +198,9 @@ class _GameObject:
         obj.text_size = text_size
         return obj
 
-    def __init__(self, type):
+    def __init__(self, type, clock):
         self.type = type
-        self.creation_ts = time.monotonic()
+        self.creation_ts = clock() # s, Time of the clock of its controller
         self.x1 = 0
         self.y1 = 0
         self.x2 = 0
@@ -104,6 +213,13 @@ class _GameObject:
         # Text
         self.text = ""
         self.text_size = 0
+        self.text_surface = None # Rendered text, until the text, its size or its color changes
+        self.text_key = None
+        # Dirty rectangles
+        self.drawn_rect = None # Area of the last drawing
+        self.drawn_state = None # State of the last drawing, the object is drawn again when it changes
+        # Events
+        self.events = [] # Events of the object, evaluated again when it changes
 
     def update_object_circle(self, x, y, color, radius):
         if self.type != _GameObject.CIRCLE: raise RuntimeError("The object is not a circle")
@@ -129,16 +245,40 @@ class _GameObject:
         self.text = text if text is not None else self.text
         self.text_size = text_size if text_size is not None else self.text_size
 
-    def draw(self, surface):
+    def draw(self, surface, text_cache):
         if self.type == _GameObject.CIRCLE:
             self._draw_circle(surface)
         elif self.type == _GameObject.LINE:
             self._draw_line(surface)
         elif self.type == _GameObject.TEXT:
-            self._draw_text(surface)
+            self._draw_text(surface, text_cache)
+
+    def get_state(self):
+        return (self.x1, self.y1, self.x2, self.y2, self.color, self.radius, self.width, self.text, self.text_size)
 
-    def is_expired(self, max_duration_ms):
-        current_ts = time.monotonic()
+    def get_rect(self, text_cache):
+        import pygame
+        # Area covered by the drawing, with a margin for the anti-aliasing and the rounding
+        if self.type == _GameObject.CIRCLE:
+            rect = pygame.Rect(self.x1 - self.radius, self.y1 - self.radius, 2 * self.radius, 2 * self.radius)
+        elif self.type == _GameObject.LINE:
+            rect = pygame.Rect(min(self.x1, self.x2), min(self.y1, self.y2), abs(self.x2 - self.x1), abs(self.y2 - self.y1))
+            rect.inflate_ip(self.width, self.width)
+        elif self.type == _GameObject.TEXT:
+            self._update_text_surface(text_cache)
+            rect = self.text_surface.get_rect(topleft=(self.x1, self.y1))
+        return rect.inflate(4, 4)
+
+    def get_bounds(self):
+        # Area of the shape for the contacts (x1, y1, x2, y2), None : no contact (text)
+        if self.type == _GameObject.CIRCLE:
+            return (self.x1 - self.radius, self.y1 - self.radius, self.x1 + self.radius, self.y1 + self.radius)
+        elif self.type == _GameObject.LINE:
+            half_width = self.width / 2
+            return (min(self.x1, self.x2) - half_width, min(self.y1, self.y2) - half_width, max(self.x1, self.x2) + half_width, max(self.y1, self.y2) + half_width)
+        return None
+
+    def is_expired(self, max_duration_ms, current_ts):
         duration_ms = (current_ts - self.creation_ts) * 1000
         expired = duration_ms > max_duration_ms
         return expired
@@ -146,19 +286,48 @@ class _GameObject:
     def in_contact(self, obj):
         if self.type == _GameObject.CIRCLE and obj.type == _GameObject.CIRCLE:
             return self._in_contact_circle_with_circle(obj)
+        elif self.type == _GameObject.LINE and obj.type == _GameObject.CIRCLE:
+            return self._in_contact_line_with_circle(obj)
+        elif self.type == _GameObject.CIRCLE and obj.type == _GameObject.LINE:
+            return obj._in_contact_line_with_circle(self)
+        elif self.type == _GameObject.LINE and obj.type == _GameObject.LINE:
+            return self._in_contact_line_with_line(obj)
         else:
             raise RuntimeError("The contact function is not available for these objects")
 
+    def in_rect(self, x1, y1, x2, y2):
+        if self.type == _GameObject.CIRCLE:
+            return self._in_rect_circle(x1, y1, x2, y2)
+        elif self.type == _GameObject.LINE:
+            return self._in_rect_line(x1, y1, x2, y2)
+        else:
+            raise RuntimeError("The rectangle function is not available for this object")
+
     def _draw_circle(self, surface):
+        import pygame
         pygame.draw.circle(surface, self.color, (self.x1, self.y1), self.radius)
 
     def _draw_line(self, surface):
-        pygame.draw.line(surface, self.color, (self.x1, self.y1), (self.x2, self.y2), self.width)
-
-    def _draw_text(self, surface):
-        font = pygame.font.Font(None, self.text_size) # Default font
-        text_surface = font.render(self.text, True, self.color) # Anti-aliasing enabled
-        surface.blit(text_surface, (self.x1, self.y1))
+        import pygame
+        # The line is clipped to the surface first : PyGame extends a thick line clipped by itself to the edge of the clip area
+        # Its ends are then inside the surface and inside the redrawn areas (they contain the whole line), PyGame does not clip it again
+        width, height = surface.get_size()
+        ends = ((self.x1, self.y1), (self.x2, self.y2))
+        if not (0 <= self.x1 < width and 0 <= self.y1 < height and 0 <= self.x2 < width and 0 <= self.y2 < height):
+            ends = _GameObject._clip_segment(self.x1, self.y1, self.x2, self.y2, 0, 0, width - 1, height - 1)
+            if ends is None: return
+        pygame.draw.line(surface, self.color, ends[0], ends[1], self.width)
+
+    def _draw_text(self, surface, text_cache):
+        self._update_text_surface(text_cache)
+        surface.blit(self.text_surface, (self.x1, self.y1))
+
+    def _update_text_surface(self, text_cache):
+        # Render the text when it changes, otherwise it is only blitted
+        key = (self.text, self.text_size, self.color)
+        if key != self.text_key:
+            self.text_surface = text_cache.get_surface(self.text, self.text_size, self.color)
+            self.text_key = key
 
     def _in_contact_circle_with_circle(self, obj):
         a = self.x1 - obj.x1
@@ -166,6 +335,70 @@ class _GameObject:
         c = self.radius + obj.radius
         return a*a + b*b <= c*c
 
+    def _in_contact_line_with_circle(self, obj):
+        distance = _GameObject._get_distance_point_to_segment(obj.x1, obj.y1, self.x1, self.y1, self.x2, self.y2)
+        return distance <= obj.radius + self.width / 2
+
+    def _in_contact_line_with_line(self, obj):
+        distance = _GameObject._get_distance_segment_to_segment(self.x1, self.y1, self.x2, self.y2, obj.x1, obj.y1, obj.x2, obj.y2)
+        return distance <= (self.width + obj.width) / 2
+
+    def _in_rect_circle(self, x1, y1, x2, y2):
+        # Distance to the closest point of the rectangle
+        a = self.x1 - min(max(self.x1, x1), x2)
+        b = self.y1 - min(max(self.y1, y1), y2)
+        return a*a + b*b <= self.radius*self.radius
+
+    def _in_rect_line(self, x1, y1, x2, y2):
+        # An end inside the rectangle, or a side close to the line
+        if x1 <= self.x1 <= x2 and y1 <= self.y1 <= y2: return True
+        if x1 <= self.x2 <= x2 and y1 <= self.y2 <= y2: return True
+        sides = [(x1, y1, x2, y1), (x2, y1, x2, y2), (x2, y2, x1, y2), (x1, y2, x1, y1)]
+        distance = min(_GameObject._get_distance_segment_to_segment(self.x1, self.y1, self.x2, self.y2, *side) for side in sides)
+        return distance <= self.width / 2
+
+    @staticmethod
+    def _clip_segment(x1, y1, x2, y2, x_min, y_min, x_max, y_max):
+        # Part of the segment inside the rectangle (Liang-Barsky), rounded to px, None : outside
+        dx = x2 - x1
+        dy = y2 - y1
+        t1, t2 = 0, 1
+        for p, q in ((-dx, x1 - x_min), (dx, x_max - x1), (-dy, y1 - y_min), (dy, y_max - y1)):
+            if p == 0:
+                if q < 0: return None
+                continue
+            t = q / p
+            if p < 0: t1 = max(t1, t)
+            else: t2 = min(t2, t)
+            if t1 > t2: return None
+        return (round(x1 + t1*dx), round(y1 + t1*dy)), (round(x1 + t2*dx), round(y1 + t2*dy))
+
+    @staticmethod
+    def _get_distance_point_to_segment(x, y, x1, y1, x2, y2):
+        # Distance to the projection of the point, clamped to the segment
+        dx = x2 - x1
+        dy = y2 - y1
+        length2 = dx*dx + dy*dy
+        t = 0 if length2 == 0 else min(max(((x - x1)*dx + (y - y1)*dy) / length2, 0), 1)
+        return math.hypot(x - x1 - t*dx, y - y1 - t*dy)
+
+    @staticmethod
+    def _get_distance_segment_to_segment(x1, y1, x2, y2, x3, y3, x4, y4):
+        # Crossing segments (each segment separates the ends of the other)
+        side1 = (x4 - x3)*(y1 - y3) - (y4 - y3)*(x1 - x3)
+        side2 = (x4 - x3)*(y2 - y3) - (y4 - y3)*(x2 - x3)
+        side3 = (x2 - x1)*(y3 - y1) - (y2 - y1)*(x3 - x1)
+        side4 = (x2 - x1)*(y4 - y1) - (y2 - y1)*(x4 - x1)
+        if side1*side2 < 0 and side3*side4 < 0: return 0
+
+        # Otherwise the closest points include an end
+        return min(
+            _GameObject._get_distance_point_to_segment(x1, y1, x3, y3, x4, y4),
+            _GameObject._get_distance_point_to_segment(x2, y2, x3, y3, x4, y4),
+            _GameObject._get_distance_point_to_segment(x3, y3, x1, y1, x2, y2),
+            _GameObject._get_distance_point_to_segment(x4, y4, x1, y1, x2, y2),
+        )
+
 
 class _GameEvent:
 
@@ -183,76 +416,82 @@ class _GameEvent:
     def get_events():
         return _GameEvent._EVENTS
     
+    _DEADLINE_MARGIN = 1e-6 # s, The deadlines are checked a bit early, the rounding errors do not delay the events
+
     @staticmethod
-    def create_event_expired(object1, max_duration_ms):
-        event = _GameEvent(_GameEvent.EXPIRED)
+    def create_event_expired(event_id, object1, max_duration_ms, callback):
+        event = _GameEvent(_GameEvent.EXPIRED, event_id, callback)
         event.object1 = object1
         event.max_duration_ms = max_duration_ms
         return event
     
     @staticmethod
-    def create_event_contact(object1, object2):
-        event = _GameEvent(_GameEvent.CONTACT)
+    def create_event_contact(event_id, object1, object2, callback):
+        event = _GameEvent(_GameEvent.CONTACT, event_id, callback)
         event.object1 = object1
         event.object2 = object2
         return event
     
     @staticmethod
-    def create_event_dwell(object1, object2, min_duration_ms):
-        event = _GameEvent(_GameEvent.DWELL)
+    def create_event_dwell(event_id, object1, object2, min_duration_ms, callback):
+        event = _GameEvent(_GameEvent.DWELL, event_id, callback)
         event.object1 = object1
         event.object2 = object2
         event.min_duration_ms = min_duration_ms
         return event
     
-    def __init__(self, type):
+    def __init__(self, type, id, callback):
         self.type = type
+        self.id = id
+        self.callback = callback # Called with the event id and the continuous state when it changes, None : no callback
         self.object1 = None
         self.object2 = None
         self.continuous_state = False
-        self.prev_trigger_state = False
         self.trigger_state = False
+        self.deadline = None # s, Time of the next evaluation, None : only when the objects change
+        self.deleted = False
         # Expired
         self.max_duration_ms = 0
         # Dwell
         self.min_duration_ms = 0
         self.enter_dwell_ts = 0
 
-    def update_continuous_state(self):
+    def update_state(self, current_ts):
+        # Update the continuous state, and the deadline of the next evaluation
         state = False
+        self.deadline = None
         
         if self.type == _GameEvent.EXPIRED:
-            state = self._get_expired()
+            state = self._get_expired(current_ts)
         elif self.type == _GameEvent.CONTACT:
             state = self._get_contact()
         elif self.type == _GameEvent.DWELL:
-            state = self._get_dwell()
-        
-        self.continuous_state = state
-
-    def update_state(self):
-        state = self.continuous_state
-        self.trigger_state = False
+            state = self._get_dwell(current_ts)
 
         # The trigger state is true only when the state changes from false to true
-        if state and not self.prev_trigger_state: self.trigger_state = True
-        self.prev_trigger_state = state
+        changed = state != self.continuous_state
+        self.trigger_state = state and changed
+        self.continuous_state = state
 
-    def _get_expired(self):
-        return self.object1.is_expired(self.max_duration_ms)
+        return changed
+
+    def _get_expired(self, current_ts):
+        state = self.object1.is_expired(self.max_duration_ms, current_ts)
+        if not state: self.deadline = self.object1.creation_ts + self.max_duration_ms / 1000 - _GameEvent._DEADLINE_MARGIN
+        return state
 
     def _get_contact(self):
         return self.object1.in_contact(self.object2)
 
-    def _get_dwell(self):
+    def _get_dwell(self, current_ts):
         contact = self.object1.in_contact(self.object2)
-        current_ts = time.monotonic()
         state = False
 
         if contact:
             if self.enter_dwell_ts == 0: self.enter_dwell_ts = current_ts # Set timestamp
             duration_ms = (current_ts - self.enter_dwell_ts) * 1000
             state = duration_ms >= self.min_duration_ms
+            if not state: self.deadline = self.enter_dwell_ts + self.min_duration_ms / 1000 - _GameEvent._DEADLINE_MARGIN
         else:
             self.enter_dwell_ts = 0 # Reset timestamp
         
@@ -269,7 +508,28 @@ class GameController:
     COLOR_GREEN_2    = (42, 190, 105)
     COLOR_GREEN_3    = (38, 176, 97)
 
-    def __init__(self, fps, canvas_width, canvas_height, name, icon):
+    RENDER_FULL  = 0 # The screen is redrawn at each frame
+    RENDER_DIRTY = 1 # Only the areas of the objects that changed are redrawn (full redraw with an image background)
+
+    _RENDERS = [
+        RENDER_FULL,
+        RENDER_DIRTY,
+    ]
+
+    def __init__(self, fps, canvas_width, canvas_height, name, icon, clock = None, text_cache_size = 256, render_type = RENDER_FULL, grid_cell_size = 64):
+        import pygame # Slow to import : the functions that use it import it, not the module
+
+        # Check the render type
+        if render_type not in GameController._RENDERS:
+            raise RuntimeError("The render type does not exist")
+
+        # Check the grid
+        if grid_cell_size <= 0:
+            raise RuntimeError("The grid cell size must be positive")
+
+        # Set the clock, a replay gives the time of its frames
+        self._get_time = time.monotonic if clock is None else clock # Clock of the objects and the events (s)
+
         pygame.init()
         pygame.font.init()
 
@@ -285,9 +545,24 @@ class GameController:
         self._background = None
         self._transient_objects = []
         self._persistent_objects = {}
+        self._sorted_object_ids = [] # Ids of the persistent objects in the drawing order, kept sorted
+        self._grid = _SpatialGrid(grid_cell_size) # Cells of the persistent circles and lines, for the contact queries
         self._events = {}
+        self._tick_ts = None # s, Time of the last refresh of the states, shared by all the events of the frame
+        self._deadlines = [] # Heap of [deadline, sequence number, event], the events evaluated when their deadline passes
+        self._deadline_count = 0 # Sequence number of the deadlines, the events of a same deadline are not compared
+        self._changed_events = {} # Events to evaluate at the next refresh (new events, events of the changed objects), in insertion order
+        self._triggered_events = [] # Events triggered at the last refresh, reset at the next one
+        self._text_cache = _TextCache(text_cache_size) # Fonts and rendered texts
+
+        # Dirty rectangles
+        self._render_type = render_type
+        self._full_redraw = True # The next frame is fully redrawn (first frame, new background)
+        self._dirty_rects = [] # Areas of the objects deleted since the last frame
+        self._transient_rects = [] # Areas of the transient objects of the last frame
 
     def close(self):
+        import pygame
         pygame.font.quit()
         pygame.quit()
 
@@ -295,93 +570,153 @@ class GameController:
         self._clock.tick(self._fps)
 
     def refresh_states(self):
+        import pygame
         # Process the PyGame events
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self._running = False
 
-        # Proces the custom events
-        for event in self._events:
-            event = self._events[event]
-            event.update_continuous_state()
-            event.update_state()
+        # One timestamp for all the custom events of the frame
+        current_ts = self._get_time()
+        self._tick_ts = current_ts
+
+        # The trigger states last one frame
+        for event in self._triggered_events: event.trigger_state = False
+        self._triggered_events.clear()
+
+        # Events to evaluate : the changed events, and the events whose deadline passed
+        events = self._changed_events
+        self._changed_events = {}
+        while self._deadlines and self._deadlines[0][0] <= current_ts:
+            deadline, _, event = heapq.heappop(self._deadlines)
+            if event.deleted or event.deadline != deadline: continue # Outdated deadline
+            events[event.id] = event
+
+        # Process the custom events, the other events keep their state
+        for event in events.values():
+            if event.deleted: continue # Deleted by a callback
+            previous_deadline = event.deadline
+            changed = event.update_state(current_ts)
+            if event.trigger_state: self._triggered_events.append(event)
+            # A deadline checked too early (margin) is checked again at the next refresh
+            if event.deadline is not None and (event.deadline != previous_deadline or event.deadline <= current_ts): self._schedule_event(event)
+            if changed and event.callback is not None: event.callback(event.id, event.continuous_state)
 
     def refresh_screen(self):
-        # Draw the background
-        if self._background is not None:
-            self._background.draw(self._surface)
-        
-        # Draw the persistent object
-        for object_id in sorted(self._persistent_objects):
-            obj = self._persistent_objects[object_id]
-            obj.draw(self._surface)
-
-        # Draw the transient objects
-        for obj in self._transient_objects:
-            obj.draw(self._surface)
+        # The image background (camera) changes at each frame
+        full_redraw = self._full_redraw or self._render_type == GameController.RENDER_FULL
+        full_redraw = full_redraw or self._background is None or self._background.type == _GameBackground.IMAGE
+        if full_redraw: self._refresh_full_screen()
+        else: self._refresh_dirty_screen()
 
         # Delete the transient objects
         self._transient_objects.clear()
+        self._full_redraw = False
 
-        # Display the screen
-        self._screen.blit(self._surface, (0, 0)) # Copy the surface to the screen
-        pygame.display.flip() # Display the screen
-    
     def set_background_color(self, color):
         self._background = _GameBackground.create_background_color(color)
+        self._full_redraw = True
     
     def set_background_image(self, image):
+        # The image of each frame replaces the previous one, the scaled surface is kept
+        if self._background is not None and self._background.type == _GameBackground.IMAGE:
+            self._background.set_image(image)
+            return
+
         self._background = _GameBackground.create_background_image(image)
+        self._full_redraw = True
 
     def create_object_circle(self, object_id, x, y, color, radius):
-        obj = _GameObject.create_object_circle(x, y, color, radius)
+        obj = _GameObject.create_object_circle(x, y, color, radius, self._get_time)
         self._add_in_transient_or_persistent_objects(object_id, obj)
 
     def create_object_line(self, object_id, x1, y1, x2, y2, color, width):
-        obj = _GameObject.create_object_line(x1, y1, x2, y2, color, width)
+        obj = _GameObject.create_object_line(x1, y1, x2, y2, color, width, self._get_time)
         self._add_in_transient_or_persistent_objects(object_id, obj)
 
     def create_object_text(self, object_id, x, y, color, text, text_size):
-        obj = _GameObject.create_object_text(x, y, color, text, text_size)
+        obj = _GameObject.create_object_text(x, y, color, text, text_size, self._get_time)
         self._add_in_transient_or_persistent_objects(object_id, obj)
 
     def update_object_circle(self, object_id, x, y, color, radius):
         obj = self._get_object(object_id)
         obj.update_object_circle(x, y, color, radius)
+        self._grid.update(object_id, obj.get_bounds())
+        self._set_changed_events(obj)
 
     def update_object_line(self, object_id, x1, y1, x2, y2, color, width):
         obj = self._get_object(object_id)
         obj.update_object_line(x1, y1, x2, y2, color, width)
+        self._grid.update(object_id, obj.get_bounds())
+        self._set_changed_events(obj)
 
     def update_object_text(self, object_id, x, y, color, text, text_size):
         obj = self._get_object(object_id)
         obj.update_object_text(x, y, color, text, text_size)
+        self._set_changed_events(obj)
 
     def delete_object(self, object_id):
-        self._persistent_objects.pop(object_id, None) # Avoid key error
+        obj = self._persistent_objects.pop(object_id, None) # Avoid key error
+        if obj is None: return
+
+        # Its area is redrawn
+        self._sorted_object_ids.remove(object_id)
+        self._grid.remove(object_id)
+        if obj.drawn_rect is not None: self._dirty_rects.append(obj.drawn_rect)
 
-    def create_event_expired(self, event_id, object_id, max_duration_ms):
+    def create_event_expired(self, event_id, object_id, max_duration_ms, callback=None):
         obj = self._get_object(object_id)
-        event = _GameEvent.create_event_expired(obj, max_duration_ms)
-        self._events[event_id] = event
+        event = _GameEvent.create_event_expired(event_id, obj, max_duration_ms, callback)
+        self._add_event(event) # Only its deadline changes its state, not its object
 
-    def create_event_contact(self, event_id, object_id1, object_id2):
+    def create_event_contact(self, event_id, object_id1, object_id2, callback=None):
         obj1 = self._get_object(object_id1)
         obj2 = self._get_object(object_id2)
-        event = _GameEvent.create_event_contact(obj1, obj2)
-        self._events[event_id] = event
+        event = _GameEvent.create_event_contact(event_id, obj1, obj2, callback)
+        self._add_event(event, obj1, obj2)
 
-    def create_event_dwell(self, event_id, object_id1, object_id2, min_duration_ms):
+    def create_event_dwell(self, event_id, object_id1, object_id2, min_duration_ms, callback=None):
         obj1 = self._get_object(object_id1)
         obj2 = self._get_object(object_id2)
-        event = _GameEvent.create_event_dwell(obj1, obj2, min_duration_ms)
-        self._events[event_id] = event
+        event = _GameEvent.create_event_dwell(event_id, obj1, obj2, min_duration_ms, callback)
+        self._add_event(event, obj1, obj2)
 
     def delete_event(self, event_id):
-        self._events.pop(event_id, None) # Avoid key error
+        event = self._events.pop(event_id, None) # Avoid key error
+        if event is None: return
+
+        # Its deadline is ignored, its objects do not evaluate it anymore
+        event.deleted = True
+        self._changed_events.pop(event_id, None)
+        for obj in (event.object1, event.object2):
+            if obj is not None and event in obj.events: obj.events.remove(event)
+
+    def get_objects_in_contact(self, object_id):
+        # Ids of the persistent objects in contact with the object (circle or line), in the drawing order
+        obj = self._get_object(object_id)
+        bounds = obj.get_bounds()
+        if bounds is None: raise RuntimeError("The contact function is not available for this object")
+        return self._get_objects_in_contact(obj, bounds, object_id)
+
+    def get_objects_in_circle(self, x, y, radius):
+        obj = _GameObject.create_object_circle(x, y, None, radius, self._get_time)
+        return self._get_objects_in_contact(obj, obj.get_bounds(), None)
+
+    def get_objects_in_line(self, x1, y1, x2, y2, width):
+        obj = _GameObject.create_object_line(x1, y1, x2, y2, None, width, self._get_time)
+        return self._get_objects_in_contact(obj, obj.get_bounds(), None)
+
+    def get_objects_in_rect(self, x, y, width, height):
+        bounds = (x, y, x + width, y + height)
+        object_ids = [i for i in self._grid.query(bounds) if self._persistent_objects[i].in_rect(*bounds)]
+        object_ids.sort()
+        return object_ids
 
     def get_running_state(self):
         return self._running
+
+    def get_stats(self):
+        return self._text_cache.get_stats()
     
     def get_event_continuous_state(self, event_id):
         event = self._events.get(event_id)
@@ -397,7 +732,7 @@ class GameController:
         event = self._events.get(event_id)
         if event is None: raise RuntimeError("The event id does not exist")
         if event.type != _GameEvent.EXPIRED: raise RuntimeError("The event is not of type expired")
-        current_ts = time.monotonic()
+        current_ts = self._get_tick_ts()
         creation_ts = event.object1.creation_ts
         duration_ms = (current_ts - creation_ts) * 1000
         max_duration_ms = event.max_duration_ms
@@ -409,7 +744,7 @@ class GameController:
         if event is None: raise RuntimeError("The event id does not exist")
         if event.type != _GameEvent.DWELL: raise RuntimeError("The event is not of type dwell")
         
-        current_ts = time.monotonic()
+        current_ts = self._get_tick_ts()
         remaining_time_ms = 0
         
         if event.enter_dwell_ts == 0:
@@ -420,9 +755,122 @@ class GameController:
         
         return remaining_time_ms
 
+    def _get_objects_in_contact(self, obj, bounds, excluded_object_id):
+        # Only the objects of the cells of the bounds are checked
+        object_ids = [i for i in self._grid.query(bounds) if i != excluded_object_id and obj.in_contact(self._persistent_objects[i])]
+        object_ids.sort()
+        return object_ids
+
+    def _add_event(self, event, *objects):
+        # A replaced event is deleted first, the new event is evaluated at the next refresh
+        self.delete_event(event.id)
+        self._events[event.id] = event
+        self._changed_events[event.id] = event
+        for obj in objects:
+            if event not in obj.events: obj.events.append(event)
+
+    def _set_changed_events(self, obj):
+        for event in obj.events: self._changed_events[event.id] = event
+
+    def _schedule_event(self, event):
+        self._deadline_count += 1
+        heapq.heappush(self._deadlines, [event.deadline, self._deadline_count, event])
+
+    def _get_tick_ts(self):
+        # Time of the last refresh, the remaining times match the states
+        return self._get_time() if self._tick_ts is None else self._tick_ts
+
     def _add_in_transient_or_persistent_objects(self, object_id, obj):
-        if object_id is None: self._transient_objects.append(obj)
-        else: self._persistent_objects[object_id] = obj
+        if object_id is None:
+            self._transient_objects.append(obj)
+            return
+
+        # A replaced object is deleted first
+        if object_id in self._persistent_objects: self.delete_object(object_id)
+        self._persistent_objects[object_id] = obj
+        bisect.insort(self._sorted_object_ids, object_id)
+        self._grid.update(object_id, obj.get_bounds())
+
+    def _refresh_full_screen(self):
+        import pygame
+        # Draw the background
+        if self._background is not None:
+            self._background.draw(self._surface)
+        
+        # Draw the persistent object
+        for object_id in self._sorted_object_ids:
+            obj = self._persistent_objects[object_id]
+            obj.draw(self._surface, self._text_cache)
+            obj.drawn_rect = obj.get_rect(self._text_cache)
+            obj.drawn_state = obj.get_state()
+
+        # Draw the transient objects
+        for obj in self._transient_objects:
+            obj.draw(self._surface, self._text_cache)
+        self._transient_rects = [obj.get_rect(self._text_cache) for obj in self._transient_objects]
+        self._dirty_rects.clear()
+
+        # Display the screen
+        self._screen.blit(self._surface, (0, 0)) # Copy the surface to the screen
+        pygame.display.flip() # Display the screen
+
+    def _refresh_dirty_screen(self):
+        import pygame
+        # Areas of the deleted objects, of the changed objects (before and after) and of the transient objects (last frame and this frame)
+        dirty_rects = self._dirty_rects + self._transient_rects
+        self._dirty_rects = []
+        objects = [self._persistent_objects[object_id] for object_id in self._sorted_object_ids]
+        for obj in objects:
+            state = obj.get_state()
+            if state == obj.drawn_state: continue
+            if obj.drawn_rect is not None: dirty_rects.append(obj.drawn_rect)
+            obj.drawn_rect = obj.get_rect(self._text_cache)
+            obj.drawn_state = state
+            dirty_rects.append(obj.drawn_rect)
+        self._transient_rects = [obj.get_rect(self._text_cache) for obj in self._transient_objects]
+        dirty_rects += self._transient_rects
+
+        # Redraw the background and the objects of each area, an area that touches a line contains all of it
+        # PyGame draws a clipped line with other pixels than the full line, the lines are never clipped by an area
+        line_rects = [obj.drawn_rect for obj in objects if obj.type == _GameObject.LINE]
+        line_rects += [rect for i, rect in enumerate(self._transient_rects) if self._transient_objects[i].type == _GameObject.LINE]
+        dirty_rects = self._merge_rects(dirty_rects, line_rects)
+        for rect in dirty_rects:
+            self._surface.set_clip(rect)
+            self._background.draw(self._surface)
+            for obj in objects:
+                if obj.drawn_rect.colliderect(rect): obj.draw(self._surface, self._text_cache)
+            for i, obj in enumerate(self._transient_objects):
+                if self._transient_rects[i].colliderect(rect): obj.draw(self._surface, self._text_cache)
+        self._surface.set_clip(None)
+
+        # Display the areas
+        for rect in dirty_rects:
+            self._screen.blit(self._surface, rect, rect)
+        pygame.display.update(dirty_rects)
+
+    def _merge_rects(self, rects, line_rects):
+        # The overlapping areas are merged, and extended to the lines they touch, then clipped to the surface
+        result = []
+        surface_rect = self._surface.get_rect()
+        line_rects = [rect.clip(surface_rect) for rect in line_rects] # The full drawing is also clipped to the surface
+        for rect in rects:
+            rect = rect.clip(surface_rect)
+            if rect.width == 0 or rect.height == 0: continue
+            while True:
+                i = rect.collidelist(result)
+                if i != -1:
+                    rect.union_ip(result.pop(i))
+                    continue
+                # A line in an area is not checked again : the areas that touch it touch this area, they are merged with it
+                i = rect.collidelist(line_rects)
+                if i != -1:
+                    rect.union_ip(line_rects.pop(i))
+                    continue
+                break
+            result.append(rect)
+
+        return result
 
     def _get_object(self, object_id):
         obj = self._persistent_objects.get(object_id)
@@ -0,0 +1,147 @@
+import numpy
+
+
+class Kinematics:
+
+    # SPARC parameters (spectral arc length, Balasubramanian et al.)
+    _SPARC_PADLEVEL  = 4
+    _SPARC_CUTOFF_HZ = 10.0
+    _SPARC_AMP_TH    = 0.05
+
+    @staticmethod
+    def compute(timestamp, neck, hip, shoulder, elbow, wrist, end_effector, target, reference):
+        # The joints are [x, y] arrays, one column per data (z is always 0)
+        # The reference is the vector used for the trunk compensation
+        t = numpy.asarray(timestamp, dtype=numpy.float64)
+        neck = numpy.asarray(neck, dtype=numpy.float64)
+        hip = numpy.asarray(hip, dtype=numpy.float64)
+        shoulder = numpy.asarray(shoulder, dtype=numpy.float64)
+        elbow = numpy.asarray(elbow, dtype=numpy.float64)
+        wrist = numpy.asarray(wrist, dtype=numpy.float64)
+        end_effector = numpy.asarray(end_effector, dtype=numpy.float64)
+        target = numpy.asarray(target, dtype=numpy.float64)
+        reference = numpy.asarray(reference[:2], dtype=numpy.float64)
+
+        # Check the data
+        if t.shape[0] < 2: raise RuntimeError("At least two data are needed to compute the kinematics")
+
+        # Compute the angles (degrees), all the vectors at once
+        trunk_angle = Kinematics._get_angles(neck - hip, reference[:, None])
+        shoulder_angle = Kinematics._get_angles(elbow - shoulder, hip - neck)
+        elbow_angle = Kinematics._get_angles(shoulder - elbow, wrist - elbow)
+
+        # Compute the speed profiles : angular speed for the shoulder and the elbow, linear speed for the wrist
+        # One gradient for the three profiles
+        gradients = numpy.gradient(numpy.vstack([shoulder_angle, elbow_angle, wrist]), t, axis=1)
+        speeds = numpy.empty((3, t.shape[0]))
+        speeds[:2] = numpy.absolute(gradients[:2])
+        speeds[2] = numpy.hypot(gradients[2], gradients[3])
+
+        # Compute the metrics of the three speed profiles
+        result = {}
+        joints = ["shoulder", "elbow", "wrist"]
+        metrics = Kinematics._get_speed_metrics(t, speeds)
+        for name in metrics:
+            for i in range(len(joints)):
+                result[joints[i] + "_" + name] = metrics[name][i]
+
+        # Compute the range of motion and the displacement
+        result["trunk_rom"] = numpy.max(trunk_angle) - numpy.min(trunk_angle)
+        result["shoulder_rom"] = numpy.max(shoulder_angle) - numpy.min(shoulder_angle)
+        result["elbow_rom"] = numpy.max(elbow_angle) - numpy.min(elbow_angle)
+
+        result["trunk_displacement"] = numpy.absolute(trunk_angle[-1] - trunk_angle[0])
+        result["shoulder_displacement"] = numpy.absolute(shoulder_angle[-1] - shoulder_angle[0])
+        result["elbow_displacement"] = numpy.absolute(elbow_angle[-1] - elbow_angle[0])
+
+        # Compute the end effector metrics
+        path_length = numpy.sum(numpy.hypot(*numpy.diff(end_effector, axis=1)))
+        straight_distance = numpy.hypot(*(target[:, -1] - end_effector[:, 0]))
+        result["target_error_distance"] = numpy.hypot(*(target[:, -1] - end_effector[:, -1]))
+        result["hand_path_ratio"] = path_length / straight_distance if straight_distance > 0 else 0
+
+        return result
+
+    @staticmethod
+    def _get_angles(vectors_1, vectors_2):
+        # Angle between each pair of 2D vectors
+        dot = numpy.sum(vectors_1 * vectors_2, axis=0)
+        norms = numpy.hypot(*vectors_1) * numpy.hypot(*vectors_2)
+        cos_angles = numpy.divide(dot, norms, out=numpy.ones_like(dot), where=norms > 0)
+        cos_angles = numpy.clip(cos_angles, -1.0, 1.0) # Avoid floating point rounding error
+        return numpy.degrees(numpy.arccos(cos_angles))
+
+    @staticmethod
+    def _get_speed_metrics(t, speeds):
+        # The speeds are one profile per row
+        movement_time = t[-1] - t[0]
+
+        # Compute the acceleration and jerk profiles
+        accelerations = numpy.gradient(speeds, t, axis=1)
+        jerks = numpy.gradient(accelerations, t, axis=1)
+
+        # Velocity peaks : the acceleration goes from positive to negative
+        positive = accelerations > 0
+        number_of_velocity_peaks = numpy.count_nonzero(positive[:, :-1] & ~positive[:, 1:], axis=1)
+
+        # Mean and peak velocities
+        mean_velocity = numpy.mean(speeds, axis=1)
+        peak_velocity = numpy.max(speeds, axis=1)
+        ratio_mean_peak_velocity = numpy.divide(mean_velocity, peak_velocity, out=numpy.zeros_like(mean_velocity), where=peak_velocity > 0)
+
+        # Time to peak velocity
+        time_to_peak = t[numpy.argmax(speeds, axis=1)] - t[0]
+        percentage_time_to_peak_velocity = time_to_peak / movement_time * 100 if movement_time > 0 else numpy.zeros(speeds.shape[0])
+
+        # Dimensionless jerk : integral of the squared jerk, normalized by the movement time and the peak velocity
+        squared_jerks = jerks * jerks
+        integrals = numpy.sum((squared_jerks[:, 1:] + squared_jerks[:, :-1]) * numpy.diff(t) / 2, axis=1) # Trapezoidal rule
+        jerk = numpy.divide(integrals * movement_time ** 3, peak_velocity * peak_velocity, out=numpy.zeros_like(integrals), where=peak_velocity > 0)
+
+        # Smoothness
+        sparc = Kinematics._get_sparc(t, speeds)
+
+        return {
+            "number_of_velocity_peaks" : number_of_velocity_peaks,
+            "ratio_mean_peak_velocity" : ratio_mean_peak_velocity,
+            "mean_velocity" : mean_velocity,
+            "peak_velocity" : peak_velocity,
+            "sparc" : sparc,
+            "jerk" : jerk,
+            "movement_time" : numpy.full(speeds.shape[0], movement_time),
+            "percentage_time_to_peak_velocity" : percentage_time_to_peak_velocity,
+        }
+
+    @staticmethod
+    def _get_sparc(t, speeds):
+        # Sampling frequency (the camera frames are not exactly periodic)
+        fs = (t.shape[0] - 1) / (t[-1] - t[0]) if t[-1] > t[0] else 0
+        result = numpy.zeros(speeds.shape[0])
+        if fs <= 0: return result
+
+        # Magnitude spectra of the three profiles, in one FFT
+        nfft = int(2 ** (numpy.ceil(numpy.log2(speeds.shape[1])) + Kinematics._SPARC_PADLEVEL))
+        f = numpy.arange(nfft // 2 + 1) * fs / nfft
+        spectra = numpy.absolute(numpy.fft.rfft(speeds, nfft, axis=1))
+        selected = f <= Kinematics._SPARC_CUTOFF_HZ
+        f = f[selected]
+        spectra = spectra[:, selected]
+
+        for i in range(speeds.shape[0]):
+            # Normalize the spectrum
+            spectrum = spectra[i]
+            max_spectrum = numpy.max(spectrum)
+            if max_spectrum == 0: continue
+            spectrum = spectrum / max_spectrum
+
+            # Keep the frequencies above the amplitude threshold
+            indices = numpy.nonzero(spectrum >= Kinematics._SPARC_AMP_TH)[0]
+            f_sel = f[indices[0]:indices[-1] + 1]
+            spectrum = spectrum[indices[0]:indices[-1] + 1]
+            if f_sel.shape[0] < 2: continue
+
+            # Arc length
+            df = numpy.diff(f_sel) / (f_sel[-1] - f_sel[0])
+            result[i] = -numpy.sum(numpy.sqrt(df * df + numpy.diff(spectrum) ** 2))
+
+        return result
@@ -0,0 +1,70 @@
+import math
+import numpy
+
+
+class LandmarkFilter:
+
+    def __init__(self, n_landmarks, min_cutoff, beta, d_cutoff, max_gap):
+        # Check the parameters
+        if min_cutoff <= 0 or d_cutoff <= 0:
+            raise RuntimeError("The cutoff frequencies must be positive")
+        if max_gap < 0:
+            raise RuntimeError("The max gap must be positive or zero")
+
+        # One-Euro filter (Casiez et al., 2012) : the cutoff frequency increases with the speed (less jitter at rest, less lag in motion)
+        self._min_cutoff = min_cutoff # Hz, Cutoff frequency at rest
+        self._beta = beta # Increase of the cutoff frequency per unit of speed (normalized coordinates per second)
+        self._d_cutoff = d_cutoff # Hz, Cutoff frequency of the speed
+        self._max_gap = max_gap # Frames predicted at constant speed when a landmark is lost, before it is dropped
+
+        # State of each landmark
+        self._coordinates = numpy.zeros((n_landmarks, 2)) # Filtered coordinates
+        self._speeds = numpy.zeros((n_landmarks, 2)) # Filtered speeds (per second)
+        self._tracked = numpy.zeros(n_landmarks, dtype=bool) # The landmark has a state (measured, or predicted for less than max gap frames)
+        self._gaps = numpy.zeros(n_landmarks, dtype=numpy.int64) # Frames since the last measure
+        self._timestamp = None # s, Time of the last frame
+
+    def filter(self, landmarks, timestamp):
+        # Landmarks : [coordinates, visibility mask] of the frame, None when no pose was detected
+        # Result : [coordinates, visibility mask, prediction mask] (the predicted landmarks are visible), None when no landmark is visible
+        n_landmarks = self._coordinates.shape[0]
+        if landmarks is None: landmarks = [self._coordinates, numpy.zeros(n_landmarks, dtype=bool)]
+        coordinates, measured = landmarks
+
+        # Time since the last frame, the first frame (or a frame out of order) initializes the filters
+        dt = 0 if self._timestamp is None else timestamp - self._timestamp
+        self._timestamp = timestamp
+        if dt <= 0: self._tracked[:] = False
+
+        # Landmarks measured for the first time (or after a long gap) : no filtering
+        started = measured & ~self._tracked
+        self._coordinates[started] = coordinates[started]
+        self._speeds[started] = 0
+
+        # Measured landmarks : One-Euro filter
+        filtered = measured & self._tracked
+        if numpy.any(filtered):
+            speeds = (coordinates[filtered] - self._coordinates[filtered]) / dt
+            speeds = self._smooth(speeds, self._speeds[filtered], dt, self._d_cutoff)
+            cutoffs = self._min_cutoff + self._beta * numpy.hypot(speeds[:, 0], speeds[:, 1])
+            self._coordinates[filtered] = self._smooth(coordinates[filtered], self._coordinates[filtered], dt, cutoffs[:, numpy.newaxis])
+            self._speeds[filtered] = speeds
+
+        # Lost landmarks : constant speed for a few frames, then dropped
+        predicted = ~measured & self._tracked & (self._gaps < self._max_gap)
+        self._coordinates[predicted] += self._speeds[predicted] * dt
+
+        self._gaps[measured] = 0
+        self._gaps[~measured] += 1
+        self._tracked = measured | predicted
+
+        # Check the landmarks
+        if not numpy.any(self._tracked): return None
+
+        return [self._coordinates.copy(), self._tracked.copy(), predicted]
+
+    def _smooth(self, values, previous_values, dt, cutoff):
+        # Exponential smoothing, its factor is set by the cutoff frequency
+        tau = 1 / (2 * math.pi * cutoff)
+        alpha = 1 / (1 + tau / dt)
+        return alpha * values + (1 - alpha) * previous_values
@@ -0,0 +1,120 @@
+import json
+import numpy
+
+
+class LinearBandit:
+
+    # Linear policies of mabwiser (regression of the _Linear implementor)
+    REGRESSION_RIDGE = "ridge" # LinGreedy
+    REGRESSION_UCB   = "ucb"   # LinUCB
+    REGRESSION_TS    = "ts"    # LinTS
+
+    _REGRESSIONS = [
+        REGRESSION_RIDGE,
+        REGRESSION_UCB,
+        REGRESSION_TS,
+    ]
+
+    @staticmethod
+    def load(path):
+        # The archive is written by model_training.export_linear_model (no pickle needed to load it)
+        with numpy.load(path, allow_pickle=False) as data:
+            bandit = LinearBandit(
+                str(data["regression"]), data["arms"], float(data["epsilon"]), float(data["alpha"]),
+                data["A"], data["A_inv"], data["xty"], data["beta"], json.loads(str(data["rng_state"])), json.loads(str(data["arm_rng_states"]))
+            )
+            scaler = [data["scaler_mean"], data["scaler_var"], float(data["scaler_n_samples"])]
+            context_cols = data["context_cols"].tolist()
+
+        return [bandit, scaler, context_cols]
+
+    def __init__(self, regression, arms, epsilon, alpha, A, A_inv, xty, beta, rng_state, arm_rng_states):
+        # Check the regression
+        if regression not in LinearBandit._REGRESSIONS: raise RuntimeError("The regression does not exist")
+
+        # Check the arms, one matrix per arm
+        n_arms = len(arms)
+        if A.shape[0] != n_arms or A_inv.shape[0] != n_arms or xty.shape[0] != n_arms or beta.shape[0] != n_arms or len(arm_rng_states) != n_arms:
+            raise RuntimeError("The model must have one matrix per arm")
+
+        self._regression = regression
+        self._arms = numpy.array(arms)
+        self._epsilon = epsilon
+        self._alpha = alpha
+
+        # Ridge regression of each arm : A = XtX + l2_lambda * I, beta = A^-1 * Xty
+        self._A = numpy.array(A, dtype=numpy.float64)
+        self._A_inv = numpy.array(A_inv, dtype=numpy.float64)
+        self._xty = numpy.array(xty, dtype=numpy.float64)
+        self._beta = numpy.array(beta, dtype=numpy.float64)
+
+        # Continue the random numbers of the trained model
+        # As in mabwiser, an arm gets its own generator (a copy of the shared one) when it is fitted for the first time, None : shared
+        self._rng = self._create_rng(rng_state)
+        self._arm_rngs = [None if state is None else self._create_rng(state) for state in arm_rng_states]
+
+    def partial_fit(self, decisions, rewards, contexts):
+        # Same update as mabwiser, one regression per arm
+        decisions = numpy.asarray(decisions)
+        rewards = numpy.asarray(rewards, dtype=numpy.float64)
+        contexts = numpy.asarray(contexts, dtype=numpy.float64)
+
+        # Check the decisions
+        if not numpy.all(numpy.isin(decisions, self._arms)): raise RuntimeError("The decision is not an arm of the model")
+
+        for i in range(self._arms.shape[0]):
+            indices = numpy.nonzero(decisions == self._arms[i])[0]
+            if indices.shape[0] == 0: continue
+
+            # The arm gets its own generator
+            if self._arm_rngs[i] is None: self._arm_rngs[i] = self._create_rng(self._rng.bit_generator.state)
+
+            X = contexts[indices]
+            y = rewards[indices]
+            self._A[i] += numpy.dot(X.T, X)
+            self._A_inv[i] = numpy.linalg.inv(self._A[i])
+            self._xty[i] += numpy.dot(X.T, y)
+            self._beta[i] = numpy.dot(self._A_inv[i], self._xty[i])
+
+    def predict(self, contexts):
+        # Same draws as mabwiser, in the same order : the trained model and its export choose the same arms
+        contexts = numpy.asarray(contexts, dtype=numpy.float64)
+        n_contexts = contexts.shape[0]
+        n_arms = self._arms.shape[0]
+        expectations = numpy.empty((n_contexts, n_arms))
+
+        # With the epsilon probability, the expectations are random
+        random_mask = self._rng.random(n_contexts) < self._epsilon
+        random_indices = numpy.nonzero(random_mask)[0]
+        expectations[random_indices] = self._rng.random((random_indices.shape[0], n_arms))
+
+        # Otherwise, the expectations of the regressions
+        nonrandom_indices = numpy.nonzero(~random_mask)[0]
+        nonrandom_contexts = contexts[nonrandom_indices]
+        for i in range(n_arms):
+            expectations[nonrandom_indices, i] = self._get_expectations(i, nonrandom_contexts)
+
+        # Pull the arm with the best expectation
+        predictions = self._arms[numpy.argmax(expectations, axis=1)].tolist()
+        return predictions if len(predictions) > 1 else predictions[0]
+
+    def _get_expectations(self, i, contexts):
+        # LinGreedy : x * beta
+        if self._regression == LinearBandit.REGRESSION_RIDGE:
+            return numpy.dot(contexts, self._beta[i])
+
+        # LinUCB : x * beta + alpha * sqrt(x * A^-1 * xt)
+        if self._regression == LinearBandit.REGRESSION_UCB:
+            x_A_inv = numpy.dot(contexts, self._A_inv[i])
+            ucb = self._alpha * numpy.sqrt(numpy.sum(x_A_inv * contexts, axis=1))
+            return numpy.dot(contexts, self._beta[i]) + ucb
+
+        # LinTS : x * beta sampled from N(beta, alpha^2 * A^-1)
+        rng = self._rng if self._arm_rngs[i] is None else self._arm_rngs[i]
+        beta_sampled = rng.multivariate_normal(self._beta[i], numpy.square(self._alpha) * self._A_inv[i], size=contexts.shape[0], method="cholesky")
+        return numpy.sum(contexts * numpy.squeeze(beta_sampled), axis=1)
+
+    def _create_rng(self, state):
+        rng = numpy.random.default_rng()
+        rng.bit_generator.state = state
+        return rng
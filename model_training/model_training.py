@@ -3,6 +3,7 @@ import cloudpickle
 import json
 import datetime
 import pandas
+import numpy
 from sklearn.preprocessing import StandardScaler
 from mabwiser.mab import MAB, LearningPolicy, NeighborhoodPolicy
 
@@ -181,6 +182,48 @@ def train_models(models, df_data, context_cols):
         model["model"].fit(decisions=df_data["adjusted_parameter"], rewards=df_data["window_score_improvement"], contexts=scaled_context)
 
 
+def is_linear_model(model):
+    # Linear policies, without neighborhood policy and without internal scaling (the scaler is applied before the model)
+    learning_policy = model.learning_policy
+    if model.neighborhood_policy is not None: return False
+    if not isinstance(learning_policy, (LearningPolicy.LinGreedy, LearningPolicy.LinUCB, LearningPolicy.LinTS)): return False
+    if learning_policy.scale: return False
+    return True
+
+
+def get_arm_rng_state(implementor, regression):
+    # The regression of an arm uses the shared generator until it is fitted, then its own copy
+    if regression.rng is implementor.rng: return None
+    return regression.rng.rng.bit_generator.state
+
+
+def export_linear_model(model, scaler, context_cols, path):
+    # Compact NumPy archive, loaded by linear_bandit.LinearBandit without mabwiser and scikit-learn
+    # https://github.com/fidelity/mabwiser/blob/master/mabwiser/linear.py
+    implementor = model._imp
+    arms = implementor.arms
+    regressions = [implementor.arm_to_model[arm] for arm in arms]
+
+    numpy.savez(
+        path,
+        regression=numpy.array(implementor.regression),
+        arms=numpy.array(arms),
+        epsilon=numpy.array(implementor.epsilon, dtype=numpy.float64),
+        alpha=numpy.array(implementor.alpha, dtype=numpy.float64),
+        A=numpy.array([regression.A for regression in regressions], dtype=numpy.float64),
+        A_inv=numpy.array([regression.A_inv for regression in regressions], dtype=numpy.float64),
+        xty=numpy.array([regression.Xty for regression in regressions], dtype=numpy.float64),
+        beta=numpy.array([regression.beta for regression in regressions], dtype=numpy.float64),
+        rng_state=numpy.array(json.dumps(model._rng.rng.bit_generator.state)), # The state integers do not fit in 64 bits
+        arm_rng_states=numpy.array(json.dumps([get_arm_rng_state(implementor, regression) for regression in regressions])),
+        scaler_mean=numpy.array(scaler.mean_, dtype=numpy.float64),
+        scaler_var=numpy.array(scaler.var_, dtype=numpy.float64),
+        scaler_scale=numpy.array(scaler.scale_, dtype=numpy.float64),
+        scaler_n_samples=numpy.array(numpy.max(scaler.n_samples_seen_), dtype=numpy.float64),
+        context_cols=numpy.array(context_cols),
+    )
+
+
 # =================================================================================================
 # Main
 # =================================================================================================
@@ -216,6 +259,11 @@ def main():
                 "scaler": model["scaler"],
             }, file)
 
+        # Also export the linear models in the fast-loading format
+        if is_linear_model(model["model"]):
+            path = os.path.join(results_path, model["title"] + ".npz")
+            export_linear_model(model["model"], model["scaler"], CONTEXT_COLS, path)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -22,9 +22,10 @@ class ParametersManager:
     def save_parameters(
             self,
             user_id, user_trained_side,
-            game_width, game_height, game_fps,
+            game_width, game_height, game_fps, game_seed,
             camera_type, camera_width, camera_height, camera_fps,
             pose_model_complexity, pose_min_visibility, pose_excluded_landmarks,
+            pose_filter_min_cutoff, pose_filter_beta, pose_filter_d_cutoff, pose_filter_max_gap,
             data_ref_vector, data_folder, data_date,
             diff_type, diff_pretrained_model, diff_goal_score, diff_margin_score, diff_start, diff_increment, diff_window_size_score, diff_window_size_metrics,
             diff_min_target_angle, diff_max_target_angle, diff_max_trunk_angle, diff_dwell_time,
@@ -37,6 +38,7 @@ class ParametersManager:
             "game_width": game_width,
             "game_height": game_height,
             "game_fps": game_fps,
+            "game_seed": game_seed,
             "camera_type": camera_type,
             "camera_width": camera_width,
             "camera_height": camera_height,
@@ -44,6 +46,10 @@ class ParametersManager:
             "pose_model_complexity": pose_model_complexity,
             "pose_min_visibility": pose_min_visibility,
             "pose_excluded_landmarks": pose_excluded_landmarks,
+            "pose_filter_min_cutoff": pose_filter_min_cutoff,
+            "pose_filter_beta": pose_filter_beta,
+            "pose_filter_d_cutoff": pose_filter_d_cutoff,
+            "pose_filter_max_gap": pose_filter_max_gap,
             "data_ref_vector": data_ref_vector,
             "data_folder": data_folder,
             "data_date": data_date,
@@ -1,4 +1,4 @@
-import mediapipe
+import numpy
 
 
 class PoseLandmark:
@@ -15,6 +15,10 @@ class PoseLandmark:
     _MP_LEFT_INDEX     = 20
     _MP_RIGHT_HIP      = 23
     _MP_LEFT_HIP       = 24
+    _MP_N_LANDMARKS    = 33
+
+    # MediaPipe landmarks of the mirrored image : the left and right landmarks are swapped (nose, eyes, ears, mouth, upper and lower body)
+    _MP_MIRRORED = [0, 4, 5, 6, 1, 2, 3, 8, 7, 10, 9, 12, 11, 14, 13, 16, 15, 18, 17, 20, 19, 22, 21, 24, 23, 26, 25, 28, 27, 30, 29, 32, 31]
 
     RIGHT_SHOULDER     = 1000
     LEFT_SHOULDER      = 1001
@@ -40,6 +44,33 @@ class PoseLandmark:
         MIDDLE_SHOULDER,
     ]
 
+    _NAMES = {
+        RIGHT_SHOULDER  : "right_shoulder",
+        LEFT_SHOULDER   : "left_shoulder",
+        RIGHT_ELBOW     : "right_elbow",
+        LEFT_ELBOW      : "left_elbow",
+        RIGHT_WRIST     : "right_wrist",
+        LEFT_WRIST      : "left_wrist",
+        MIDDLE_HIP      : "middle_hip",
+        RIGHT_HAND      : "right_hand",
+        LEFT_HAND       : "left_hand",
+        MIDDLE_SHOULDER : "middle_shoulder",
+    }
+
+    # MediaPipe landmarks of each landmark (their mean)
+    _MP_SOURCES = {
+        RIGHT_SHOULDER  : [_MP_RIGHT_SHOULDER],
+        LEFT_SHOULDER   : [_MP_LEFT_SHOULDER],
+        RIGHT_ELBOW     : [_MP_RIGHT_ELBOW],
+        LEFT_ELBOW      : [_MP_LEFT_ELBOW],
+        RIGHT_WRIST     : [_MP_RIGHT_WRIST],
+        LEFT_WRIST      : [_MP_LEFT_WRIST],
+        MIDDLE_HIP      : [_MP_RIGHT_HIP, _MP_LEFT_HIP],
+        RIGHT_HAND      : [_MP_RIGHT_WRIST, _MP_RIGHT_PINKY, _MP_RIGHT_INDEX],
+        LEFT_HAND       : [_MP_LEFT_WRIST, _MP_LEFT_PINKY, _MP_LEFT_INDEX],
+        MIDDLE_SHOULDER : [_MP_LEFT_SHOULDER, _MP_RIGHT_SHOULDER],
+    }
+
     _CONNECTIONS = [
         [MIDDLE_HIP, LEFT_SHOULDER],
         [LEFT_SHOULDER, LEFT_ELBOW],
@@ -61,6 +92,10 @@ class PoseLandmark:
     def get_landmarks():
         return PoseLandmark._LANDMARKS
 
+    @staticmethod
+    def get_name(landmark):
+        return PoseLandmark._NAMES[landmark]
+
     @staticmethod
     def get_connections():
         return PoseLandmark._CONNECTIONS
@@ -88,12 +123,26 @@ class PoseEstimator:
         MODEL_COMPLEXITY_BALANCED,
         MODEL_COMPLEXITY_ACCURATE,
     ]
-    
-    def __init__(self, model_complexity, min_visibility):
+
+    def __init__(self, model_complexity, min_visibility, mirror = False):
+        import mediapipe # Slow to import : the functions that use it import it (as OpenCV), not the module
+
         self._model = None
         self._landmarks = None
         self._image = None
         self._min_visibility = min_visibility
+        self._mirror = mirror # The images are not flipped by the camera reader, the landmarks are mirrored instead
+
+        # MediaPipe landmarks of the last frame : x, y (normalized), z and visibility
+        self._mp_landmarks = numpy.zeros((PoseLandmark._MP_N_LANDMARKS, 4))
+
+        # Each landmark is the mean of MediaPipe landmarks, a matrix multiply computes all of them
+        landmarks = PoseLandmark.get_landmarks()
+        self._weights = numpy.zeros((len(landmarks), PoseLandmark._MP_N_LANDMARKS))
+        for i, landmark in enumerate(landmarks):
+            sources = PoseLandmark._MP_SOURCES[landmark]
+            self._weights[i, sources] = 1 / len(sources)
+        self._sources = (self._weights > 0).astype(numpy.float64) # MediaPipe landmarks of each landmark
     
         # Check the model complexity
         if model_complexity not in PoseEstimator._MODEL_COMPLEXITIES:
@@ -123,7 +172,12 @@ class PoseEstimator:
         if not result.pose_landmarks: return False
 
         # Set the landmarks
-        self._landmarks = result.pose_landmarks.landmark
+        self._mp_landmarks[:] = [[landmark.x, landmark.y, landmark.z, landmark.visibility] for landmark in result.pose_landmarks.landmark]
+        self._landmarks = self._mp_landmarks
+        if self._mirror:
+            # As if the image was flipped horizontally
+            self._landmarks = self._mp_landmarks[PoseLandmark._MP_MIRRORED]
+            self._landmarks[:, 0] = 1 - self._landmarks[:, 0]
         return True
 
     def get_landmark(self, landmark):
@@ -132,84 +186,35 @@ class PoseEstimator:
 
         # Check the landmarks
         if self._landmarks is None: return None
-        
-        # Get the coordinates of the landmark
-        result = None
-
-        if landmark == PoseLandmark.RIGHT_SHOULDER:
-            result = self._get_landmarks_mean([
-                self._landmarks[PoseLandmark._MP_RIGHT_SHOULDER],
-            ])
-        elif landmark == PoseLandmark.LEFT_SHOULDER:
-            result = self._get_landmarks_mean([
-                self._landmarks[PoseLandmark._MP_LEFT_SHOULDER],
-            ])
-        elif landmark == PoseLandmark.RIGHT_ELBOW:
-            result = self._get_landmarks_mean([
-                self._landmarks[PoseLandmark._MP_RIGHT_ELBOW],
-            ])
-        elif landmark == PoseLandmark.LEFT_ELBOW:
-            result = self._get_landmarks_mean([
-                self._landmarks[PoseLandmark._MP_LEFT_ELBOW],
-            ])
-        elif landmark == PoseLandmark.RIGHT_WRIST:
-            result = self._get_landmarks_mean([
-                self._landmarks[PoseLandmark._MP_RIGHT_WRIST],
-            ])
-        elif landmark == PoseLandmark.LEFT_WRIST:
-            result = self._get_landmarks_mean([
-                self._landmarks[PoseLandmark._MP_LEFT_WRIST],
-            ])
-        elif landmark == PoseLandmark.MIDDLE_HIP:
-            result = self._get_landmarks_mean([
-                self._landmarks[PoseLandmark._MP_RIGHT_HIP],
-                self._landmarks[PoseLandmark._MP_LEFT_HIP],
-            ])
-        elif landmark == PoseLandmark.RIGHT_HAND:
-            result = self._get_landmarks_mean([
-                self._landmarks[PoseLandmark._MP_RIGHT_WRIST],
-                self._landmarks[PoseLandmark._MP_RIGHT_PINKY],
-                self._landmarks[PoseLandmark._MP_RIGHT_INDEX],
-            ])
-        elif landmark == PoseLandmark.LEFT_HAND:
-            result = self._get_landmarks_mean([
-                self._landmarks[PoseLandmark._MP_LEFT_WRIST],
-                self._landmarks[PoseLandmark._MP_LEFT_PINKY],
-                self._landmarks[PoseLandmark._MP_LEFT_INDEX],
-            ])
-        elif landmark == PoseLandmark.MIDDLE_SHOULDER:
-            result = self._get_landmarks_mean([
-                self._landmarks[PoseLandmark._MP_LEFT_SHOULDER],
-                self._landmarks[PoseLandmark._MP_RIGHT_SHOULDER],
-            ])
 
-        return result
+        # Get the coordinates of the landmark, None when it is not reliable
+        coordinates, visible = self.get_landmarks_array()
+        i = PoseLandmark.get_landmarks().index(landmark)
+        return coordinates[i].tolist() if visible[i] else None
     
     def get_landmarks(self):
         result = {}
 
-        # Add the landmarks
-        for landmark in PoseLandmark.get_landmarks():
-            output = self.get_landmark(landmark)
-            if output is None: continue
-            result[landmark] = output
+        # Check the landmarks
+        if self._landmarks is None: return result
+
+        # Add the reliable landmarks
+        coordinates, visible = self.get_landmarks_array()
+        for i, landmark in enumerate(PoseLandmark.get_landmarks()):
+            if not visible[i]: continue
+            result[landmark] = coordinates[i].tolist()
 
         return result
 
-    def _get_landmarks_mean(self, landmarks):
-        # Check the reliability
-        for landmark in landmarks:
-            if landmark.visibility < self._min_visibility:
-                return None
+    def get_landmarks_array(self, width = 1, height = 1):
+        # Check the landmarks
+        if self._landmarks is None: return None
 
-        # Compute the mean
-        result = [0, 0]
-        for landmark in landmarks:
-            result[0] = result[0] + landmark.x
-            result[1] = result[1] + landmark.y
+        # Coordinates of the landmarks (in the order of PoseLandmark.get_landmarks), scaled to the width and the height (px, normalized by default)
+        coordinates = numpy.dot(self._weights, self._landmarks[:, 0:2])
+        if width != 1 or height != 1: coordinates *= [width, height]
 
-        size = len(landmarks)
-        result[0] = result[0] / size
-        result[1] = result[1] / size
+        # A landmark is reliable when all its MediaPipe landmarks are visible
+        visible = numpy.dot(self._sources, self._landmarks[:, 3] < self._min_visibility) == 0
 
-        return result
\ No newline at end of file
+        return [coordinates, visible]
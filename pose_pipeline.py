@@ -0,0 +1,115 @@
+import time
+import threading
+
+
+class PosePipeline:
+
+    def __init__(self, camera_reader, pose_estimator):
+        self._camera_reader = camera_reader
+        self._pose_estimator = pose_estimator
+        self._lock = threading.Lock()
+        self._running = True
+        self._error = None
+        self._finished = False # The camera source is finished and its last frame was estimated
+        self._result = None # Newest result, not yet read by the game loop
+        self._landmarks = None # Last result read by the game loop
+
+        # Counters
+        self._n_estimated = 0
+        self._n_dropped = 0
+        self._n_read = 0
+        self._pose_latency_ms = 0
+        self._pose_total_latency_ms = 0
+        self._game_latency_ms = 0
+        self._game_total_latency_ms = 0
+
+        # Start the pose worker
+        self._thread = threading.Thread(target=self._estimate, daemon=True) # Daemon : do not prevent the program from exiting
+        self._thread.start()
+
+    def close(self):
+        # Stop the pose worker (the camera reader and the pose estimator are closed by their owner)
+        self._running = False
+        self._thread.join()
+
+    def read(self):
+        # Check the pose worker
+        if self._error is not None: raise RuntimeError("The pose worker stopped") from self._error
+
+        # Get the newest result, without waiting for the pose estimation
+        with self._lock:
+            result = self._result
+            self._result = None
+            if result is None: return False # No new result since the last read
+
+            # Latency between the capture and the use of the frame
+            self._game_latency_ms = (time.monotonic() - result[2]) * 1000
+            self._game_total_latency_ms += self._game_latency_ms
+            self._n_read += 1
+
+        # Set the landmarks
+        self._landmarks = result
+        return True
+
+    def get_landmarks(self):
+        # Check the landmarks
+        if self._landmarks is None: return None
+
+        # Landmarks (None when no pose was detected), frame sequence number and capture timestamp (monotonic)
+        return self._landmarks
+
+    def is_finished(self):
+        # The camera source is finished (video file, image directory) and the last result was read
+        with self._lock:
+            return self._finished and self._result is None
+
+    def get_stats(self):
+        with self._lock:
+            n_estimated = self._n_estimated
+            n_read = self._n_read
+
+            return {
+                # Camera stage
+                "camera_queue_depth" : self._camera_reader.get_buffer_depth(),
+                "camera_dropped_frames" : self._camera_reader.get_dropped_frames(),
+                # Pose stage
+                "pose_queue_depth" : 0 if self._result is None else 1,
+                "pose_estimated_frames" : n_estimated,
+                "pose_dropped_results" : self._n_dropped,
+                "pose_latency_ms" : self._pose_latency_ms,
+                "pose_mean_latency_ms" : self._pose_total_latency_ms / n_estimated if n_estimated > 0 else 0,
+                # Game stage (capture to read)
+                "game_read_results" : n_read,
+                "game_latency_ms" : self._game_latency_ms,
+                "game_mean_latency_ms" : self._game_total_latency_ms / n_read if n_read > 0 else 0,
+            }
+
+    def _estimate(self):
+        try:
+            while self._running:
+                # Get the newest frame
+                if not self._camera_reader.read():
+                    if self._camera_reader.is_finished():
+                        with self._lock: self._finished = True
+                        break
+                    time.sleep(0.001) # Avoid a busy loop while waiting for the camera
+                    continue
+
+                image = self._camera_reader.get_image()[0]
+                frame_info = self._camera_reader.get_frame_info()
+
+                # Estimate the pose
+                start_ts = time.monotonic()
+                self._pose_estimator.set_image(image)
+                landmarks = self._pose_estimator.get_landmarks_array() if self._pose_estimator.estimate() else None
+                pose_latency_ms = (time.monotonic() - start_ts) * 1000
+
+                # Publish the result, an unread result is overwritten
+                with self._lock:
+                    if self._result is not None: self._n_dropped += 1
+                    self._result = [landmarks, frame_info[0], frame_info[1]]
+                    self._n_estimated += 1
+                    self._pose_latency_ms = pose_latency_ms
+                    self._pose_total_latency_ms += pose_latency_ms
+        except Exception as error:
+            self._error = error
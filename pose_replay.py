@@ -0,0 +1,65 @@
+import csv
+import numpy
+from pose_estimator import PoseLandmark
+
+
+class PoseReplay:
+
+    def __init__(self, path):
+        self._frames = [] # [[coordinates, visibility mask] or None, frame sequence number, capture timestamp], as the results of PosePipeline
+        self._index = -1
+        self._landmarks = None
+
+        # Load the trace, before the replay (the replay only measures the game)
+        # Columns : frame, timestamp, then x and y of each landmark (NaN : not detected)
+        with open(path, "r", newline="") as file:
+            reader = csv.DictReader(file)
+            landmark_columns = []
+            for i, landmark in enumerate(PoseLandmark.get_landmarks()):
+                name = PoseLandmark.get_name(landmark)
+                if name + "_x" not in reader.fieldnames: continue # Not recorded, never visible
+                landmark_columns.append([i, name + "_x", name + "_y"])
+
+            n_landmarks = len(PoseLandmark.get_landmarks())
+            for row in reader:
+                coordinates = numpy.full((n_landmarks, 2), numpy.nan)
+                for i, column_x, column_y in landmark_columns:
+                    coordinates[i] = [float(row[column_x]), float(row[column_y])]
+                visible = ~numpy.any(numpy.isnan(coordinates), axis=1)
+
+                landmarks = [coordinates, visible] if numpy.any(visible) else None # None : no pose detected
+                self._frames.append([landmarks, int(row["frame"]), float(row["timestamp"])])
+
+        # Check the trace
+        if len(self._frames) == 0: raise RuntimeError("The trace does not contain any frame")
+
+    def close(self):
+        pass
+
+    def read(self):
+        # Get the next frame, without waiting (unthrottled replay)
+        if self.is_finished(): return False
+        self._index += 1
+        self._landmarks = self._frames[self._index]
+        return True
+
+    def get_landmarks(self):
+        # Check the landmarks
+        if self._landmarks is None: return None
+
+        # Landmarks (None when no pose was detected), frame sequence number and capture timestamp
+        return self._landmarks
+
+    def get_time(self):
+        # Time of the game, the capture timestamp of the current frame (s)
+        if self._landmarks is None: return self._frames[0][2]
+        return self._landmarks[2]
+
+    def is_finished(self):
+        return self._index >= len(self._frames) - 1
+
+    def get_stats(self):
+        return {
+            "replay_frames" : len(self._frames),
+            "replay_read_frames" : self._index + 1,
+        }
@@ -0,0 +1,72 @@
+import math
+from collections import deque
+
+
+class RollingWindow:
+
+    # The running sums are recomputed from the values after this number of evictions, to bound the floating point drift
+    _RESYNC_EVICTIONS = 1000
+
+    def __init__(self, size):
+        # Check the size
+        if size < 1: raise RuntimeError("The window size must be at least one")
+
+        self._values = deque(maxlen=size)
+        self._sum = 0 # Running sums of the finite values
+        self._sum_squares = 0
+        self._n_non_finite = 0 # NaN and infinite values of the window, the sums are computed from the values while there are some
+        self._n_evictions = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    def append(self, value):
+        # Evict the oldest value
+        if len(self._values) == self._values.maxlen:
+            oldest = self._values[0]
+            if math.isfinite(oldest):
+                self._sum -= oldest
+                self._sum_squares -= oldest * oldest
+            else:
+                self._n_non_finite -= 1
+            self._n_evictions += 1
+
+        # Add the value, a non finite value would make the running sums NaN after its eviction
+        self._values.append(value)
+        if math.isfinite(value):
+            self._sum += value
+            self._sum_squares += value * value
+        else:
+            self._n_non_finite += 1
+
+        # Recompute the running sums
+        if self._n_evictions >= RollingWindow._RESYNC_EVICTIONS:
+            finite_values = [c_value for c_value in self._values if math.isfinite(c_value)]
+            self._sum = sum(finite_values)
+            self._sum_squares = sum(c_value * c_value for c_value in finite_values)
+            self._n_evictions = 0
+
+    def get_sum(self):
+        # NaN or infinite while the window has a non finite value, as the sum of the values
+        if self._n_non_finite > 0: return sum(self._values)
+        return self._sum
+
+    def get_mean(self):
+        n_values = len(self._values)
+        mean = self.get_sum() / n_values if n_values > 0 else 0
+        return mean
+
+    def get_variance(self):
+        # Population variance
+        n_values = len(self._values)
+        if n_values == 0: return 0
+        mean = self.get_mean()
+        sum_squares = sum(c_value * c_value for c_value in self._values) if self._n_non_finite > 0 else self._sum_squares
+        variance = sum_squares / n_values - mean * mean
+        return max(variance, 0) # Avoid floating point rounding error (NaN is kept)
@@ -0,0 +1,45 @@
+import os
+import json
+import numpy
+from session_writer import SessionWriter
+
+
+class SessionLoader:
+
+    @staticmethod
+    def load_arrays(path):
+        # Get the .npz path (a CSV path can be given)
+        npz_path = os.path.splitext(path)[0] + ".npz"
+        if not os.path.isfile(npz_path): raise RuntimeError("The .npz file does not exist")
+
+        # Load the columns and the metadata
+        columns = {}
+        metadata = None
+        with numpy.load(npz_path, allow_pickle=False) as data:
+            for name in data.files:
+                if name == SessionWriter.NPZ_METADATA:
+                    metadata = json.loads(str(data[name]))
+                else:
+                    columns[name] = data[name]
+
+        return [columns, metadata]
+
+    @staticmethod
+    def load_dataframe(path):
+        import pandas # Only needed by the analyses
+
+        # Load the .npz file, or parse the CSV file when there is none
+        npz_path = os.path.splitext(path)[0] + ".npz"
+        if not os.path.isfile(npz_path):
+            csv_path = os.path.splitext(path)[0] + ".csv"
+            return pandas.read_csv(csv_path)
+
+        result = SessionLoader.load_arrays(npz_path)
+        columns = result[0]
+        return pandas.DataFrame(columns)
+
+    @staticmethod
+    def load_metadata(path):
+        result = SessionLoader.load_arrays(path)
+        metadata = result[1]
+        return metadata
@@ -0,0 +1,168 @@
+import os
+import json
+import numpy
+import atexit
+import threading
+
+
+class SessionWriter:
+
+    FORMAT_CSV         = 0
+    FORMAT_CSV_AND_NPZ = 1 # Also write typed columns to a .npz file (NumPy archive) next to each CSV file, from the CSV file on close
+
+    _FORMATS = [
+        FORMAT_CSV,
+        FORMAT_CSV_AND_NPZ,
+    ]
+
+    NPZ_METADATA = "__metadata__" # Name of the metadata entry in the .npz files
+
+    def __init__(self, max_rows = 1000, max_delay_ms = 1000, format = FORMAT_CSV, metadata = None):
+        self._max_rows = max_rows
+        self._max_delay_ms = max_delay_ms
+        self._format = format
+        self._metadata = metadata # Embedded in the .npz files (ex : the session parameters)
+        self._files = {}
+        self._pending = [] # [path, rows], in the order of the calls
+        self._n_pending_rows = 0
+        self._closed = False
+        self._error = None # Exception of the flush thread, raised by the next call
+
+        # The condition protects the pending rows, the write lock the files
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+
+        # Check the format
+        if format not in SessionWriter._FORMATS: raise RuntimeError("The format does not exist")
+
+        # Check the thresholds
+        if max_rows < 1: raise RuntimeError("The max rows must be at least one")
+        if max_delay_ms <= 0: raise RuntimeError("The max delay must be positive")
+
+        # Start the flush thread
+        self._thread = threading.Thread(target=self._flush_periodically, daemon=True) # Daemon : do not prevent the program from exiting
+        self._thread.start()
+
+        # Flush the pending rows on exit, even when the game crashes
+        atexit.register(self.close)
+
+    @staticmethod
+    def write_npz(path, metadata = None):
+        # Write the typed columns of a CSV file to a .npz file next to it (also for the sessions that were not closed)
+        with open(path, "r") as file:
+            lines = file.read().splitlines()
+        
+        # Check the file
+        if len(lines) == 0: raise RuntimeError("The CSV file is empty")
+
+        # Get the columns, the first line is the header (the rows are written without quotes)
+        header = lines[0].split(",")
+        rows = [line.split(",") for line in lines[1:]]
+        columns = list(zip(*rows)) if len(rows) > 0 else [() for name in header]
+
+        # Get the typed columns
+        arrays = {}
+        for i in range(len(header)):
+            arrays[header[i]] = SessionWriter._get_typed_column(columns[i])
+
+        # Get the metadata, as a JSON string (no pickle needed to load it)
+        arrays[SessionWriter.NPZ_METADATA] = numpy.array(json.dumps(metadata))
+
+        # Write the file
+        npz_path = os.path.splitext(path)[0] + ".npz"
+        numpy.savez(npz_path, **arrays) # Not compressed : faster to load
+
+    def close(self):
+        # Stop the flush thread
+        with self._condition:
+            if self._closed: return
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        atexit.unregister(self.close)
+
+        # Write the pending rows and release the files
+        try:
+            if self._error is None: self.flush()
+        finally:
+            with self._write_lock:
+                for file in self._files.values():
+                    file.flush()
+                    os.fsync(file.fileno()) # Durable
+                    file.close()
+                paths = list(self._files)
+                self._files = {}
+
+        # Check the flush thread
+        self._check_error()
+
+        # Write the .npz files, from the CSV files (the rows are not kept in memory)
+        if self._format == SessionWriter.FORMAT_CSV_AND_NPZ:
+            for path in paths:
+                SessionWriter.write_npz(path, self._metadata)
+
+    def write_row(self, path, row):
+        self.write_rows(path, [row])
+
+    def write_rows(self, path, rows):
+        with self._condition:
+            # Check the writer
+            if self._closed: raise RuntimeError("The writer is closed")
+            self._check_error()
+
+            # Add the rows, they are formatted by the flush thread
+            self._pending.append([path, rows])
+            self._n_pending_rows += len(rows)
+
+            # Wake up the flush thread
+            if self._n_pending_rows >= self._max_rows: self._condition.notify()
+
+    def flush(self):
+        with self._write_lock:
+            # Take the pending rows
+            with self._condition:
+                pending = self._pending
+                self._pending = []
+                self._n_pending_rows = 0
+
+            # Write the rows
+            for path, rows in pending:
+                file = self._get_file(path)
+                lines = [",".join(str(data) for data in row) + "\n" for row in rows]
+                file.writelines(lines)
+
+            for file in self._files.values():
+                file.flush()
+
+    def _get_file(self, path):
+        file = self._files.get(path)
+        if file is None:
+            file = open(path, "a")
+            self._files[path] = file
+        return file
+
+    @staticmethod
+    def _get_typed_column(column):
+        # Integers, then floats, then strings
+        for dtype in [numpy.int64, numpy.float64]:
+            try: return numpy.array(column, dtype=dtype)
+            except (TypeError, ValueError, OverflowError): pass
+        return numpy.array(column, dtype=str)
+
+    def _check_error(self):
+        if self._error is not None: raise RuntimeError("The session files could not be written") from self._error
+
+    def _flush_periodically(self):
+        while True:
+            # Wait for the size or the time threshold
+            with self._condition:
+                if self._closed: return
+                if self._n_pending_rows < self._max_rows: self._condition.wait(self._max_delay_ms / 1000)
+                if self._closed: return
+
+            # A failed write stops the thread, the error is raised by the next call of the game
+            try:
+                self.flush()
+            except Exception as error:
+                with self._condition: self._error = error
+                return
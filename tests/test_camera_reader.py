@@ -0,0 +1,141 @@
+import os
+import time
+import cv2
+import numpy
+import pytest
+from camera_reader import CameraReader
+
+WIDTH = 40
+HEIGHT = 30
+
+
+def create_images(folder, n_images):
+    # Images of one color each (BGR), the names are not in the creation order
+    colors = []
+    for i in range(n_images):
+        color = [10 * i, 100, 200 - 10 * i]
+        image = numpy.empty((HEIGHT, WIDTH, 3), dtype=numpy.uint8)
+        image[:] = color
+        cv2.imwrite(os.path.join(str(folder), "frame-" + str(n_images - 1 - i).zfill(3) + ".png"), image)
+        colors.append(color)
+    (folder / "notes.txt").write_text("not an image")
+    return colors[::-1] # In the order of the names
+
+
+def read_all(camera, timeout=5):
+    # Frames read until the source is finished : [RGB color of the first pixel, frame number]
+    frames = []
+    end_ts = time.monotonic() + timeout
+    while not camera.is_finished() and time.monotonic() < end_ts:
+        if not camera.read():
+            time.sleep(0.001)
+            continue
+        image, width, height = camera.get_image()
+        assert [width, height] == [WIDTH, HEIGHT]
+        assert image.shape == (HEIGHT, WIDTH, 3)
+        frames.append([image[0, 0].tolist(), camera.get_frame_info()[0]])
+    return frames
+
+
+def test_synthetic_source():
+    camera = CameraReader(CameraReader.CAMERA_SYNTHETIC, WIDTH, HEIGHT, 30, source_timing=CameraReader.TIMING_MAX_SPEED, flip=False)
+
+    # The gradient moves by one column per frame, and restarts after one image width
+    images = []
+    for i in range(WIDTH + 1):
+        assert camera.read()
+        image, width, height = camera.get_image()
+        assert [width, height] == [WIDTH, HEIGHT]
+        images.append(image.copy())
+    assert camera.get_frame_info()[0] == WIDTH + 1
+    assert not camera.is_finished()
+    camera.close()
+
+    assert not numpy.array_equal(images[0], images[1])
+    numpy.testing.assert_array_equal(images[0][:, 1:], images[1][:, :-1]) # The next window starts one column further
+    numpy.testing.assert_array_equal(images[0], images[WIDTH])
+    assert images[0][0, 0].tolist() == [0, 255, 0] # RGB, first column and row : red (by row) and blue gradients at 0, green one at 255
+
+
+def test_synthetic_source_flip():
+    camera = CameraReader(CameraReader.CAMERA_SYNTHETIC, WIDTH, HEIGHT, 30, source_timing=CameraReader.TIMING_MAX_SPEED, flip=False)
+    flipped_camera = CameraReader(CameraReader.CAMERA_SYNTHETIC, WIDTH, HEIGHT, 30, source_timing=CameraReader.TIMING_MAX_SPEED, flip=True)
+    for i in range(3):
+        assert camera.read() and flipped_camera.read()
+        numpy.testing.assert_array_equal(camera.get_image()[0][:, ::-1], flipped_camera.get_image()[0])
+    camera.close()
+    flipped_camera.close()
+
+
+def test_image_directory_source(tmp_path):
+    colors = create_images(tmp_path, 4)
+    camera = CameraReader(CameraReader.CAMERA_IMAGE_DIRECTORY, 0, 0, 30, source_path=str(tmp_path), source_timing=CameraReader.TIMING_MAX_SPEED, flip=False)
+
+    # The images in the order of their names, converted to RGB, then the end of the source
+    frames = read_all(camera)
+    assert frames == [[color[::-1], i + 1] for i, color in enumerate(colors)]
+    assert camera.is_finished()
+    assert not camera.read()
+    assert camera.get_frame_info()[0] == 4
+    camera.close()
+
+
+def test_image_directory_source_threaded(tmp_path):
+    colors = create_images(tmp_path, 6)
+    camera = CameraReader(CameraReader.CAMERA_IMAGE_DIRECTORY, 0, 0, 30, CameraReader.CAPTURE_THREADED, 2, str(tmp_path), CameraReader.TIMING_MAX_SPEED, False)
+
+    # The newest frames are read, the others are dropped, the last frame is always read
+    frames = read_all(camera)
+    assert camera.is_finished()
+    assert not camera.read()
+    camera.close()
+
+    assert frames[-1] == [colors[-1][::-1], 6]
+    assert len(frames) + camera.get_dropped_frames() == 6
+    assert [frame[1] for frame in frames] == sorted(set(frame[1] for frame in frames))
+    for color, frame_number in frames:
+        assert color == colors[frame_number - 1][::-1]
+
+
+@pytest.mark.parametrize("capture_type", [CameraReader.CAPTURE_SYNCHRONOUS, CameraReader.CAPTURE_THREADED])
+def test_recorded_timing(tmp_path, capture_type):
+    create_images(tmp_path, 5)
+    fps = 20
+
+    # The frames are delivered at the FPS : 4 frame periods between the first and the last frame
+    start_ts = time.monotonic()
+    camera = CameraReader(CameraReader.CAMERA_IMAGE_DIRECTORY, 0, 0, fps, capture_type, 10, str(tmp_path), CameraReader.TIMING_RECORDED, False)
+    frames = read_all(camera)
+    duration = time.monotonic() - start_ts
+    camera.close()
+
+    assert frames[-1][1] == 5
+    assert duration >= 4 / fps
+    assert duration < 2
+
+
+def test_recorded_timing_synthetic():
+    fps = 50
+    camera = CameraReader(CameraReader.CAMERA_SYNTHETIC, WIDTH, HEIGHT, fps, source_timing=CameraReader.TIMING_RECORDED, flip=False)
+
+    # Same frame period after the first frame
+    timestamps = []
+    for i in range(6):
+        assert camera.read()
+        timestamps.append(camera.get_frame_info()[1])
+    camera.close()
+
+    assert timestamps[-1] - timestamps[0] >= 5 / fps - 0.002
+    assert all(b >= a for a, b in zip(timestamps, timestamps[1:]))
+
+
+def test_image_directory_errors(tmp_path):
+    with pytest.raises(RuntimeError, match="does not exist"):
+        CameraReader(CameraReader.CAMERA_IMAGE_DIRECTORY, 0, 0, 30, source_path=str(tmp_path / "missing"))
+
+    (tmp_path / "notes.txt").write_text("not an image")
+    with pytest.raises(RuntimeError, match="does not contain any image"):
+        CameraReader(CameraReader.CAMERA_IMAGE_DIRECTORY, 0, 0, 30, source_path=str(tmp_path))
+
+    with pytest.raises(RuntimeError, match="needs a source path"):
+        CameraReader(CameraReader.CAMERA_IMAGE_DIRECTORY, 0, 0, 30)
@@ -0,0 +1,243 @@
+import os
+import random
+import threading
+import warnings
+import numpy
+import pytest
+from types import SimpleNamespace
+from difficulty_adapter import DifficulyAdapter
+
+MODEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "model_training", "2026-03-29-18-15-41", "LinGreedy (epsilon = 0.2).pkl")
+NPZ_MODEL_FILE = os.path.splitext(MODEL_FILE)[0] + ".npz"
+
+
+class LegacyDataBasedDDA:
+
+    # Previous computation of the data-based DDA : one-row DataFrame per decision, scaled by the StandardScaler of the model
+
+    def __init__(self, path):
+        import cloudpickle
+        with open(path, "rb") as file:
+            model = cloudpickle.load(file)
+        self.model = model["model"]
+        self.scaler = model["scaler"]
+        self.last_context = None
+        self.last_context_scaled = None
+
+    def run_model(self, adjusted_parameter, reward, too_hard, too_easy, context):
+        import pandas
+        if adjusted_parameter != DifficulyAdapter._PARAMETER_TYPE_NONE:
+            self.scaler.partial_fit(self.last_context)
+            self.model.partial_fit(decisions=[adjusted_parameter], rewards=[reward], contexts=self.last_context_scaled)
+
+        if not too_hard and not too_easy:
+            return DifficulyAdapter._PARAMETER_TYPE_NONE
+
+        self.last_context = pandas.DataFrame([context])
+        self.last_context_scaled = self.scaler.transform(self.last_context)
+        return self.model.predict(self.last_context_scaled)
+
+
+def get_legacy_context(adapter):
+    # Context built by name, from the state of the DDA
+    score = adapter._get_window_metric_score
+    return {
+        "diff_target_distance" : adapter._diff_target_distance,
+        "diff_target_size" : adapter._diff_target_size,
+        "diff_reach_time" : adapter._diff_reach_time,
+        "window_reach_wrist_number_of_velocity_peaks" : score(adapter._reach_wrist_number_of_velocity_peaks),
+        "window_reach_wrist_mean_velocity" : score(adapter._reach_wrist_mean_velocity),
+        "window_reach_wrist_sparc" : score(adapter._reach_wrist_sparc),
+        "window_reach_wrist_jerk" : score(adapter._reach_wrist_jerk),
+        "window_reach_trunk_rom" : score(adapter._reach_trunk_rom),
+        "window_reach_hand_path_ratio" : score(adapter._reach_hand_path_ratio),
+        "window_has_dwell" : score(adapter._has_dwell),
+        "window_dwell_wrist_mean_velocity" : score(adapter._dwell_wrist_mean_velocity),
+    }
+
+
+def get_iteration(rng):
+    # Results of an iteration, in the ranges of the sessions
+    return SimpleNamespace(
+        timestamp=[0.0, 1.0],
+        wrist_number_of_velocity_peaks=rng.randint(1, 6),
+        wrist_mean_velocity=rng.uniform(0.05, 0.6),
+        wrist_sparc=rng.uniform(-4, -1.3),
+        wrist_jerk=rng.uniform(50, 2000),
+        trunk_rom=rng.uniform(0, 15),
+        hand_path_ratio=rng.uniform(1, 2),
+    )
+
+
+def test_same_decisions_as_dataframe_and_standard_scaler(tmp_path):
+    pytest.importorskip("mabwiser")
+    pytest.importorskip("pandas")
+    warnings.filterwarnings("ignore", module="sklearn") # Model pickled with another scikit-learn version
+
+    adapter = DifficulyAdapter(DifficulyAdapter.TYPE_DATA_BASED, MODEL_FILE, 0.75, 0.05, 0.5, 0.05, 10, 5, str(tmp_path), None)
+    legacy = LegacyDataBasedDDA(MODEL_FILE)
+
+    # Both computations run on the same inputs, at each decision
+    decisions = []
+    run_model = adapter._run_model
+    def run_both_models(adjusted_parameter, reward, too_hard, too_easy):
+        legacy_parameter = legacy.run_model(adjusted_parameter, reward, too_hard, too_easy, get_legacy_context(adapter))
+        parameter = run_model(adjusted_parameter, reward, too_hard, too_easy)
+        decisions.append([parameter, legacy_parameter])
+        return parameter
+    adapter._run_model = run_both_models
+
+    # Session of 200 targets, the success rate changes to get too hard and too easy phases
+    rng = random.Random(0)
+    for i in range(200):
+        adapter.get_parameters(i)
+        success_rate = 0.95 if (i // 40) % 2 == 0 else 0.4
+        dwell_iteration = get_iteration(rng) if rng.random() < 0.7 else None
+        adapter.set_results(get_iteration(rng), dwell_iteration, rng.random() < success_rate, False, False, False)
+    adapter.close()
+
+    # Same arms
+    assert len(decisions) > 50
+    assert sum(decision[0] != DifficulyAdapter._PARAMETER_TYPE_NONE for decision in decisions) > 20
+    assert [decision[0] for decision in decisions] == [decision[1] for decision in decisions]
+
+    # Same scaler statistics
+    assert adapter._scaler.n_samples == legacy.scaler.n_samples_seen_.max()
+    numpy.testing.assert_allclose(adapter._scaler.mean, legacy.scaler.mean_, rtol=1e-12)
+    numpy.testing.assert_allclose(adapter._scaler.m2 / adapter._scaler.n_samples, legacy.scaler.var_, rtol=1e-12)
+    numpy.testing.assert_allclose(adapter._last_context_scaled, legacy.last_context_scaled, rtol=1e-9, atol=1e-12)
+
+
+class StubModel:
+
+    # Runs the model of the DDA in place of _run_model, once released, and records the calls
+
+    def __init__(self, adapter, parameter=None, error=None):
+        self.run_model = adapter._run_model
+        self.parameter = parameter # None : the decision of the model
+        self.error = error
+        self.released = threading.Event()
+        self.calls = []
+        self.n_running = 0
+        self.max_running = 0
+        adapter._run_model = self
+
+    def __call__(self, adjusted_parameter, reward, too_hard, too_easy):
+        self.n_running += 1
+        self.max_running = max(self.max_running, self.n_running)
+        try:
+            if not self.released.wait(timeout=5): raise RuntimeError("The stub was not released")
+            self.calls.append([adjusted_parameter, too_hard, too_easy])
+            if self.error is not None: raise self.error
+            parameter = self.run_model(adjusted_parameter, reward, too_hard, too_easy)
+            return parameter if self.parameter is None else self.parameter
+        finally:
+            self.n_running -= 1
+
+
+def create_async_adapter(tmp_path, decision_deadline_ms):
+    return DifficulyAdapter(DifficulyAdapter.TYPE_DATA_BASED, NPZ_MODEL_FILE, 0.75, 0.05, 0.5, 0.05, 10, 5, str(tmp_path), None, None, decision_deadline_ms)
+
+
+def set_failed_target(adapter, rng):
+    # Failed by the trunk : too hard, the rule-based DDA decreases the target distance (no tie)
+    adapter.set_results(get_iteration(rng), None, False, True, False, False)
+
+
+def test_decision_on_time(tmp_path):
+    adapter = create_async_adapter(tmp_path, 5000)
+    model = StubModel(adapter, DifficulyAdapter._PARAMETER_TYPE_TARGET_SIZE)
+    model.released.set()
+    rng = random.Random(0)
+
+    adapter.get_parameters(0)
+    set_failed_target(adapter, rng)
+    parameters = adapter.get_parameters(1)
+    adapter.close()
+
+    # The decision of the model is applied
+    assert model.calls == [[DifficulyAdapter._PARAMETER_TYPE_NONE, True, False]]
+    assert parameters == pytest.approx([0.5, 0.45, 0.5])
+    assert adapter._adjusted_parameter == DifficulyAdapter._PARAMETER_TYPE_TARGET_SIZE
+    assert adapter.get_missed_deadlines() == 0
+
+
+def test_missed_deadline_uses_rule_based_decision(tmp_path):
+    adapter = create_async_adapter(tmp_path, 20)
+    model = StubModel(adapter, DifficulyAdapter._PARAMETER_TYPE_TARGET_SIZE)
+    rng = random.Random(0)
+
+    adapter.get_parameters(0)
+    set_failed_target(adapter, rng)
+    parameters = adapter.get_parameters(1)
+
+    # The model is still running, the rule-based DDA decreases the target distance
+    assert model.calls == []
+    assert parameters == pytest.approx([0.45, 0.5, 0.5])
+    assert adapter._adjusted_parameter == DifficulyAdapter._PARAMETER_TYPE_TARGET_DISTANCE
+    assert adapter.get_missed_deadlines() == 1
+
+    model.released.set()
+    adapter.close()
+
+
+def test_late_decision_is_applied_before_the_next_decision(tmp_path):
+    adapter = create_async_adapter(tmp_path, 20)
+    model = StubModel(adapter)
+    n_samples = adapter._scaler.n_samples
+    rng = random.Random(0)
+
+    adapter.get_parameters(0)
+    set_failed_target(adapter, rng)
+    adapter.get_parameters(1)
+    assert adapter.get_missed_deadlines() == 1
+
+    # The late decision finishes once the next target is done, the next decision waits for it
+    timer = threading.Timer(0.1, model.released.set)
+    timer.start()
+    set_failed_target(adapter, rng)
+    assert len(model.calls) == 1
+    parameters = adapter.get_parameters(2)
+    adapter.close()
+    timer.join()
+
+    # The late decision updated the model state, the next one is on time and updates the model with the rule-based parameter
+    assert model.max_running == 1
+    assert model.calls == [
+        [DifficulyAdapter._PARAMETER_TYPE_NONE, True, False],
+        [DifficulyAdapter._PARAMETER_TYPE_TARGET_DISTANCE, True, False],
+    ]
+    assert adapter._scaler.n_samples == n_samples + 1
+    assert adapter.get_missed_deadlines() == 1
+    assert adapter._adjusted_parameter != DifficulyAdapter._PARAMETER_TYPE_NONE
+    assert sum(parameters) == pytest.approx(1.5 - 0.05 - 0.05)
+
+
+def test_worker_error_is_raised_by_the_decision(tmp_path):
+    adapter = create_async_adapter(tmp_path, 5000)
+    model = StubModel(adapter, error=ValueError("model error"))
+    model.released.set()
+    rng = random.Random(0)
+
+    adapter.get_parameters(0)
+    set_failed_target(adapter, rng)
+    with pytest.raises(ValueError, match="model error"):
+        adapter.get_parameters(1)
+    adapter.close()
+
+
+def test_late_worker_error_is_raised_by_the_next_submission(tmp_path):
+    adapter = create_async_adapter(tmp_path, 20)
+    model = StubModel(adapter, error=ValueError("model error"))
+    rng = random.Random(0)
+
+    adapter.get_parameters(0)
+    set_failed_target(adapter, rng)
+    adapter.get_parameters(1)
+    assert adapter.get_missed_deadlines() == 1
+
+    # The error of the late decision is not lost
+    model.released.set()
+    with pytest.raises(ValueError, match="model error"):
+        set_failed_target(adapter, rng)
+    adapter.close()
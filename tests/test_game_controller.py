@@ -0,0 +1,393 @@
+import os
+import random
+import hashlib
+import numpy
+import pygame
+import pytest
+
+os.environ["SDL_VIDEODRIVER"] = "dummy" # No window
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+from game_controller import GameController, _GameObject, _SpatialGrid, _TextCache
+
+ICON_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "docs", "icon.png")
+
+
+class FakeClock:
+
+    START = 10.0 # s, Not 0 : a dwell timestamp of 0 means not in contact
+
+    def __init__(self):
+        self.time = FakeClock.START
+
+    def __call__(self):
+        return self.time
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def controller(clock):
+    controller = GameController(60, 640, 480, "test", ICON_FILE, clock)
+    yield controller
+    controller.close()
+
+
+def tick(controller, clock, time):
+    clock.time = FakeClock.START + time
+    controller.refresh_states()
+
+
+def test_expired_event_fires_at_its_deadline(controller, clock):
+    calls = []
+    controller.create_object_circle(1, 100, 100, GameController.COLOR_GREEN, 10)
+    controller.create_event_expired(10, 1, 100, lambda event_id, state: calls.append([event_id, state]))
+
+    tick(controller, clock, 0.05)
+    assert not controller.get_event_continuous_state(10)
+    assert controller.get_event_expired_remaining_time_ms(10) == pytest.approx(50)
+
+    tick(controller, clock, 0.0999)
+    assert not controller.get_event_continuous_state(10)
+
+    tick(controller, clock, 0.1001)
+    assert controller.get_event_continuous_state(10)
+    assert controller.get_event_state(10)
+    assert calls == [[10, True]]
+
+    # The trigger state lasts one frame
+    tick(controller, clock, 0.2)
+    assert controller.get_event_continuous_state(10)
+    assert not controller.get_event_state(10)
+    assert calls == [[10, True]]
+
+
+def test_dwell_event_fires_without_moves(controller, clock):
+    calls = []
+    controller.create_object_circle(1, 100, 100, GameController.COLOR_GREEN, 20)
+    controller.create_object_circle(2, 110, 100, GameController.COLOR_BLUE, 10)
+    controller.create_event_dwell(11, 1, 2, 80, lambda event_id, state: calls.append([event_id, state]))
+
+    tick(controller, clock, 0.0) # Enters the target
+    tick(controller, clock, 0.05)
+    assert not controller.get_event_continuous_state(11)
+    assert controller.get_event_dwell_remaining_time_ms(11) == pytest.approx(30)
+
+    tick(controller, clock, 0.08) # Only the deadline evaluates the event
+    assert controller.get_event_continuous_state(11)
+    assert controller.get_event_state(11)
+
+    # Leaving the target resets the dwell
+    controller.update_object_circle(2, 300, 300, None, None)
+    tick(controller, clock, 0.1)
+    assert not controller.get_event_continuous_state(11)
+    assert controller.get_event_dwell_remaining_time_ms(11) == 80
+    assert calls == [[11, True], [11, False]]
+
+    # Entering again starts a new dwell
+    controller.update_object_circle(2, 100, 100, None, None)
+    tick(controller, clock, 0.2)
+    tick(controller, clock, 0.27)
+    assert not controller.get_event_continuous_state(11)
+    tick(controller, clock, 0.28)
+    assert controller.get_event_continuous_state(11)
+
+
+def test_deleted_event(controller, clock):
+    calls = []
+    controller.create_object_circle(1, 100, 100, GameController.COLOR_GREEN, 10)
+    controller.create_event_expired(10, 1, 100, lambda event_id, state: calls.append([event_id, state]))
+    tick(controller, clock, 0.05)
+
+    # Its deadline is ignored
+    controller.delete_event(10)
+    tick(controller, clock, 0.2)
+    assert calls == []
+    with pytest.raises(RuntimeError):
+        controller.get_event_continuous_state(10)
+
+    # Deleting it again is allowed
+    controller.delete_event(10)
+
+
+def test_replaced_event(controller, clock):
+    calls = []
+    controller.create_object_circle(1, 100, 100, GameController.COLOR_GREEN, 10)
+    controller.create_event_expired(10, 1, 100, lambda event_id, state: calls.append(["first", state]))
+    tick(controller, clock, 0.05)
+
+    # The deadline of the first event is ignored, the new event has its own
+    controller.create_event_expired(10, 1, 200, lambda event_id, state: calls.append(["second", state]))
+    tick(controller, clock, 0.15)
+    assert not controller.get_event_continuous_state(10)
+    tick(controller, clock, 0.2001)
+    assert controller.get_event_continuous_state(10)
+    assert calls == [["second", True]]
+
+
+def test_contact_event_follows_the_moves(controller, clock):
+    controller.create_object_circle(1, 100, 100, GameController.COLOR_GREEN, 20)
+    controller.create_object_circle(2, 300, 100, GameController.COLOR_BLUE, 10)
+    controller.create_event_contact(12, 1, 2)
+
+    tick(controller, clock, 0.0)
+    assert not controller.get_event_continuous_state(12)
+
+    controller.update_object_circle(2, 125, 100, None, None)
+    tick(controller, clock, 0.01)
+    assert controller.get_event_continuous_state(12)
+    assert controller.get_event_state(12)
+
+    tick(controller, clock, 0.02)
+    assert controller.get_event_continuous_state(12)
+    assert not controller.get_event_state(12)
+
+
+def test_controllers_keep_their_clock(controller, clock):
+    controller.create_object_circle(1, 100, 100, GameController.COLOR_GREEN, 10)
+    controller.create_event_expired(10, 1, 100)
+
+    # A second controller (ex : a replay) does not change the clock of the first one
+    other_clock = FakeClock()
+    other_clock.time = 1000.0
+    other = GameController(60, 640, 480, "other", ICON_FILE, other_clock)
+    other.create_object_circle(1, 100, 100, GameController.COLOR_GREEN, 10)
+    other.create_event_expired(10, 1, 100)
+
+    tick(controller, clock, 0.05)
+    assert not controller.get_event_continuous_state(10)
+    assert controller.get_event_expired_remaining_time_ms(10) == pytest.approx(50)
+
+    other_clock.time = 1000.2
+    other.refresh_states()
+    assert other.get_event_continuous_state(10)
+    assert not controller.get_event_continuous_state(10)
+    other.close()
+
+
+def test_background_image_is_copied(controller):
+    image = numpy.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=numpy.uint8)
+    expected = image[:, ::-1].copy()
+
+    # A flipped view (not contiguous) is accepted, and the image is copied : the camera can reuse its memory
+    controller.set_background_image(image[:, ::-1])
+    image[:] = 0
+    controller.refresh_screen()
+    assert numpy.array_equal(pygame.surfarray.array3d(controller._surface).swapaxes(0, 1), expected)
+
+    # A smaller image is scaled to the canvas
+    controller.set_background_image(numpy.full((240, 320, 3), 200, dtype=numpy.uint8))
+    controller.refresh_screen()
+    assert numpy.all(pygame.surfarray.array3d(controller._surface) == 200)
+
+
+def test_text_cache_evicts_the_least_recently_used_text(controller):
+    cache = _TextCache(2)
+
+    a = cache.get_surface("a", 20, GameController.COLOR_RED)
+    b = cache.get_surface("b", 20, GameController.COLOR_RED)
+    assert cache.get_surface("a", 20, GameController.COLOR_RED) is a
+    assert cache.get_stats() == {"text_cache_size" : 2, "text_cache_hits" : 1, "text_cache_misses" : 2}
+
+    # "b" is the least recently used
+    cache.get_surface("c", 20, GameController.COLOR_RED)
+    assert cache.get_surface("a", 20, GameController.COLOR_RED) is a
+    assert cache.get_surface("b", 20, GameController.COLOR_RED) is not b
+    assert cache.get_stats() == {"text_cache_size" : 2, "text_cache_hits" : 2, "text_cache_misses" : 4}
+
+    # Another size is another text
+    cache.get_surface("a", 30, GameController.COLOR_RED)
+    assert cache.get_stats()["text_cache_misses"] == 5
+
+
+def test_text_cache_colors(controller):
+    cache = _TextCache(8)
+
+    # The same color, whatever its type
+    red = cache.get_surface("a", 20, (255, 0, 0))
+    assert cache.get_surface("a", 20, [255, 0, 0]) is red
+    assert cache.get_surface("a", 20, pygame.Color(255, 0, 0)) is red
+    assert cache.get_surface("a", 20, "red") is red
+    assert cache.get_stats() == {"text_cache_size" : 1, "text_cache_hits" : 3, "text_cache_misses" : 1}
+
+    cache.get_surface("a", 20, [0, 255, 0])
+    assert cache.get_stats() == {"text_cache_size" : 2, "text_cache_hits" : 3, "text_cache_misses" : 2}
+
+
+def test_text_cache_stats(controller, clock):
+    # The objects keep their rendered text, the cache is used when the text changes
+    controller.create_object_text(1, 100, 100, GameController.COLOR_RED, "score", 20)
+    controller.create_object_text(2, 100, 200, GameController.COLOR_RED, "score", 20)
+    for i in range(3):
+        tick(controller, clock, i / 60)
+        controller.refresh_screen()
+    assert controller.get_stats() == {"text_cache_size" : 1, "text_cache_hits" : 1, "text_cache_misses" : 1}
+
+    controller.update_object_text(1, None, None, None, "1/1", None)
+    tick(controller, clock, 3 / 60)
+    controller.refresh_screen()
+    controller.update_object_text(1, None, None, None, "score", None)
+    tick(controller, clock, 4 / 60)
+    controller.refresh_screen()
+    assert controller.get_stats() == {"text_cache_size" : 2, "text_cache_hits" : 2, "text_cache_misses" : 2}
+
+
+def test_distance_segment_to_segment():
+    distance = _GameObject._get_distance_segment_to_segment
+    assert distance(0, 0, 10, 10, 0, 10, 10, 0) == 0 # Crossing
+    assert distance(0, 0, 10, 0, 0, 5, 10, 5) == pytest.approx(5) # Parallel
+    assert distance(0, 0, 10, 0, 13, -4, 13, 4) == pytest.approx(3) # End to segment
+    assert distance(0, 0, 10, 0, 13, 4, 20, 4) == pytest.approx(5) # End to end
+    assert distance(0, 0, 10, 0, 10, 0, 20, 0) == 0 # Touching ends
+    assert distance(0, 0, 0, 0, 3, 4, 3, 4) == pytest.approx(5) # Points
+
+
+def test_contact_line_with_line(controller):
+    controller.create_object_line(1, 0, 0, 100, 0, GameController.COLOR_GREEN, 4)
+    assert controller.get_objects_in_line(50, -50, 50, 50, 2) == [1] # Crossing
+    assert controller.get_objects_in_line(0, 3, 100, 3, 2) == [1] # Parallel, 3 px <= (4 + 2) / 2
+    assert controller.get_objects_in_line(0, 4, 100, 4, 2) == []
+    assert controller.get_objects_in_line(104, -10, 104, 10, 2) == [] # Beyond the end : 4 px
+
+
+def test_contact_line_with_circle(controller):
+    controller.create_object_line(1, 0, 0, 100, 0, GameController.COLOR_GREEN, 4)
+    assert controller.get_objects_in_circle(50, 10, 8) == [1] # 10 px <= 8 + 4 / 2
+    assert controller.get_objects_in_circle(50, 11, 8) == []
+    assert controller.get_objects_in_circle(108, 6, 7) == [] # Closest to the end : 10 px > 7 + 4 / 2
+    assert controller.get_objects_in_circle(106, 6, 7) == [1]
+
+    controller.create_object_circle(2, 200, 200, GameController.COLOR_BLUE, 10)
+    assert controller.get_objects_in_line(200, 150, 200, 250, 2) == [2]
+    assert controller.get_objects_in_line(212, 150, 212, 250, 2) == []
+
+
+def test_objects_in_rect(controller):
+    controller.create_object_circle(1, 100, 100, GameController.COLOR_GREEN, 10)
+    assert controller.get_objects_in_rect(105, 105, 50, 50) == [1] # Center outside, disk inside
+    assert controller.get_objects_in_rect(108, 108, 50, 50) == [] # Corner : 11.3 px from the center
+
+    controller.create_object_line(2, 300, 0, 300, 400, GameController.COLOR_GREEN, 2)
+    assert controller.get_objects_in_rect(250, 100, 100, 10) == [2] # Crossing, no end inside
+    assert controller.get_objects_in_rect(250, -10, 100, 20) == [2] # End inside
+    assert controller.get_objects_in_rect(302, 100, 50, 10) == [] # 2 px from the line
+    assert controller.get_objects_in_rect(301, 100, 50, 10) == [2]
+
+
+def test_negative_coordinates(controller):
+    controller.create_object_circle(1, -100, -30, GameController.COLOR_GREEN, 10)
+    controller.create_object_line(2, -200, -200, -150, -150, GameController.COLOR_GREEN, 2)
+    assert controller.get_objects_in_circle(-85, -30, 6) == [1]
+    assert controller.get_objects_in_rect(-60, -60, 50, 50) == []
+    assert controller.get_objects_in_rect(-170, -170, 10, 10) == [2]
+    assert controller.get_objects_in_line(-300, -100, 0, -100, 2) == []
+
+
+def test_grid_cells_follow_the_objects(controller):
+    controller.create_object_circle(1, 10, 10, GameController.COLOR_GREEN, 5)
+    controller.create_object_circle(2, 300, 300, GameController.COLOR_BLUE, 5)
+    assert controller.get_objects_in_contact(2) == []
+
+    # Moved to the cell of the other circle
+    controller.update_object_circle(1, 305, 300, None, None)
+    assert controller.get_objects_in_contact(2) == [1]
+    assert controller.get_objects_in_circle(10, 10, 5) == []
+
+    # Moved inside its cell, then to a negative cell
+    controller.update_object_circle(1, 320, 300, None, None)
+    assert controller.get_objects_in_contact(2) == []
+    controller.update_object_circle(1, -40, -40, None, None)
+    assert controller.get_objects_in_circle(-40, -40, 1) == [1]
+
+    # Deleted and replaced objects
+    controller.delete_object(1)
+    assert controller.get_objects_in_circle(-40, -40, 1) == []
+    controller.create_object_circle(2, 0, 0, GameController.COLOR_BLUE, 5)
+    assert controller.get_objects_in_circle(300, 300, 10) == []
+    assert controller.get_objects_in_circle(0, 0, 1) == [2]
+
+
+def test_grid_cells():
+    grid = _SpatialGrid(64)
+    grid.update(1, (-10, -10, 10, 10)) # Four cells, around the origin
+    assert grid._cells.keys() == {(-1, -1), (-1, 0), (0, -1), (0, 0)}
+    assert grid.query((-64, -64, -60, -60)) == {1}
+
+    grid.update(1, (70, 0, 80, 10))
+    assert grid._cells.keys() == {(1, 0)}
+    assert grid.query((-10, -10, 10, 10)) == set()
+
+    grid.update(1, None)
+    assert grid._cells == {}
+    grid.remove(1) # Already removed
+
+
+COLORS = [GameController.COLOR_WHITE, GameController.COLOR_RED, GameController.COLOR_GREEN, GameController.COLOR_BLUE]
+
+
+def get_rendered_frames(render_type, seed, n_frames = 100, shapes = ("circle", "line", "text")):
+    # Random creations, moves, deletions, replaced ids and transient objects, the same for each render type
+    rng = random.Random(seed)
+    clock = FakeClock()
+    controller = GameController(60, 320, 240, "test", ICON_FILE, clock, render_type=render_type)
+    controller.set_background_color(GameController.COLOR_BLACK)
+    objects = {} # Shape of each object id
+    frames = []
+
+    def point():
+        return rng.randint(-20, 340), rng.randint(-20, 260)
+
+    def create(object_id, shape):
+        if shape == "circle": controller.create_object_circle(object_id, *point(), rng.choice(COLORS), rng.randint(2, 30))
+        elif shape == "line": controller.create_object_line(object_id, *point(), *point(), rng.choice(COLORS), rng.randint(1, 8))
+        elif shape == "text": controller.create_object_text(object_id, *point(), rng.choice(COLORS), rng.choice(["a", "score", "12/20"]), rng.choice([20, 40]))
+
+    try:
+        for frame in range(n_frames):
+            for _ in range(rng.randint(0, 4)):
+                action = rng.choice(["create", "create", "update", "update", "update", "delete"])
+                object_id = rng.randint(0, 7)
+                if action == "create" or object_id not in objects:
+                    objects[object_id] = rng.choice(shapes) # A new object, or a replaced id
+                    create(object_id, objects[object_id])
+                elif action == "update" and objects[object_id] == "circle":
+                    controller.update_object_circle(object_id, *point(), rng.choice([None] + COLORS), rng.choice([None, 5, 15]))
+                elif action == "update" and objects[object_id] == "line":
+                    controller.update_object_line(object_id, *point(), *point(), None, rng.choice([None, 1, 4]))
+                elif action == "update" and objects[object_id] == "text":
+                    controller.update_object_text(object_id, *point(), None, rng.choice([None, "b", "score"]), None)
+                elif action == "delete":
+                    controller.delete_object(object_id)
+                    del objects[object_id]
+            for _ in range(rng.randint(0, 2)):
+                create(None, rng.choice(shapes))
+
+            tick(controller, clock, frame / 60)
+            controller.refresh_screen()
+            frames.append(hashlib.sha256(pygame.image.tobytes(controller._screen, "RGB")).hexdigest())
+    finally:
+        controller.close()
+
+    return frames
+
+
+@pytest.mark.parametrize("shapes", [("circle",), ("line",), ("text",), ("circle", "line", "text")])
+@pytest.mark.parametrize("seed", range(5))
+def test_dirty_rendering_matches_full_rendering(seed, shapes):
+    # The lines that leave the canvas and the areas that cut the lines draw other pixels with PyGame
+    full_frames = get_rendered_frames(GameController.RENDER_FULL, seed, shapes=shapes)
+    dirty_frames = get_rendered_frames(GameController.RENDER_DIRTY, seed, shapes=shapes)
+    different_frames = [i for i in range(len(full_frames)) if full_frames[i] != dirty_frames[i]]
+    assert different_frames == []
+
+
+def test_clip_segment():
+    clip = _GameObject._clip_segment
+    assert clip(10, 10, 20, 20, 0, 0, 99, 99) == ((10, 10), (20, 20))
+    assert clip(-10, 50, 110, 50, 0, 0, 99, 99) == ((0, 50), (99, 50))
+    assert clip(133, -10, 250, 146, 0, 0, 319, 239) == ((140, 0), (250, 146))
+    assert clip(-10, -10, -5, 50, 0, 0, 99, 99) is None
+    assert clip(150, 0, 0, 150, 0, 0, 99, 99) == ((99, 51), (51, 99))
@@ -0,0 +1,141 @@
+import csv
+import os
+import numpy
+import pytest
+from kinematics import Kinematics
+from data_manager import DataManager
+
+COORDINATES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "coordinates.csv")
+REFERENCE = [0, -1, 0] # Vertical trunk, as __play_game.py
+
+
+def get_reference_sparc(movement, fs, padlevel=4, fc=10.0, amp_th=0.05):
+    # Reference implementation of SPARC (Balasubramanian et al., 2015), kept as published
+    nfft = int(pow(2, numpy.ceil(numpy.log2(len(movement))) + padlevel))
+    f = numpy.arange(0, fs, fs / nfft)
+    Mf = abs(numpy.fft.fft(movement, nfft))
+    Mf = Mf / max(Mf)
+    fc_inx = ((f <= fc) * 1).nonzero()
+    f_sel = f[fc_inx]
+    Mf_sel = Mf[fc_inx]
+    inx = ((Mf_sel >= amp_th) * 1).nonzero()[0]
+    fc_inx = range(inx[0], inx[-1] + 1)
+    f_sel = f_sel[fc_inx]
+    Mf_sel = Mf_sel[fc_inx]
+    return -sum(numpy.sqrt(pow(numpy.diff(f_sel) / (f_sel[-1] - f_sel[0]), 2) + pow(numpy.diff(Mf_sel), 2)))
+
+
+def get_minimum_jerk_reach(fs, duration=1.0, distance=300.0):
+    # Straight reach of the wrist along x, the other joints do not move
+    t = numpy.linspace(0, duration, int(fs * duration) + 1)
+    tau = t / duration
+    x = distance * (10 * tau**3 - 15 * tau**4 + 6 * tau**5)
+    y = numpy.zeros_like(t)
+    still = lambda x, y: [numpy.full_like(t, x), numpy.full_like(t, y)]
+    wrist = [x, y]
+    target = still(distance, 0)
+    return Kinematics.compute(t, still(0, -100), still(0, 0), still(20, -100), still(20, -50), wrist, wrist, target, REFERENCE)
+
+
+def test_minimum_jerk_reach():
+    result = get_minimum_jerk_reach(1000)
+
+    # Analytic values : peak velocity 1.875 D/T at T/2, mean velocity D/T, dimensionless jerk 720 / 1.875^2
+    assert result["wrist_number_of_velocity_peaks"] == 1
+    assert result["wrist_peak_velocity"] == pytest.approx(1.875 * 300, rel=1e-3)
+    assert result["wrist_mean_velocity"] == pytest.approx(300, rel=1e-2)
+    assert result["wrist_ratio_mean_peak_velocity"] == pytest.approx(1 / 1.875, rel=1e-2)
+    assert result["wrist_percentage_time_to_peak_velocity"] == pytest.approx(50)
+    assert result["wrist_movement_time"] == pytest.approx(1)
+    assert result["wrist_jerk"] == pytest.approx(720 / 1.875**2, rel=2e-2)
+    assert result["hand_path_ratio"] == pytest.approx(1)
+    assert result["target_error_distance"] == pytest.approx(0)
+
+    # The joints that do not move
+    assert result["trunk_rom"] == pytest.approx(0)
+    assert result["shoulder_peak_velocity"] == pytest.approx(0)
+
+
+@pytest.mark.parametrize("fs", [30, 60, 100, 1000])
+def test_sparc_matches_reference(fs):
+    t = numpy.linspace(0, 1, fs + 1)
+    speeds = numpy.vstack([
+        30 * t**2 - 60 * t**3 + 30 * t**4, # Minimum jerk
+        numpy.exp(-((t - 0.5) / 0.1)**2 / 2), # Gaussian
+        numpy.sin(numpy.pi * t)**2 + 0.5 * numpy.sin(3 * numpy.pi * t)**2, # Two submovements
+    ])
+    sparc = Kinematics._get_sparc(t, speeds)
+    for i in range(speeds.shape[0]):
+        assert sparc[i] == pytest.approx(get_reference_sparc(speeds[i], fs), abs=1e-9)
+
+
+def test_sparc_minimum_jerk():
+    # Value of the reference implementation with its default parameters (padlevel 4, 10 Hz, 0.05)
+    result = get_minimum_jerk_reach(100)
+    assert result["wrist_sparc"] == pytest.approx(-1.406, abs=1e-3)
+
+
+def test_angles():
+    # Elbow rotating around the shoulder from 30 to 90 degrees (the trunk is vertical)
+    fs = 100
+    t = numpy.linspace(0, 1, fs + 1)
+    angles = numpy.radians(30 + 60 * t)
+    still = lambda x, y: [numpy.full_like(t, x), numpy.full_like(t, y)]
+    elbow = [20 + 50 * numpy.sin(angles), -100 + 50 * numpy.cos(angles)]
+    result = Kinematics.compute(t, still(0, -100), still(0, 0), still(20, -100), elbow, elbow, elbow, still(70, -100), REFERENCE)
+
+    assert result["shoulder_rom"] == pytest.approx(60)
+    assert result["shoulder_displacement"] == pytest.approx(60)
+    assert result["shoulder_peak_velocity"] == pytest.approx(60)
+    assert result["trunk_rom"] == pytest.approx(0)
+
+
+def get_recorded_iterations():
+    # Iterations of the recorded coordinates : [side, type, id, iteration, rows]
+    iterations = {}
+    with open(COORDINATES_FILE, "r", newline="") as file:
+        for row in csv.DictReader(file):
+            key = (int(row["side"]), int(row["type"]), int(row["id"]), int(row["iteration"]))
+            iterations.setdefault(key, []).append([float(row[name]) for name in [
+                "timestamp", "neck_x", "neck_y", "hip_x", "hip_y", "shoulder_x", "shoulder_y", "elbow_x",
+                "elbow_y", "wrist_x", "wrist_y", "end_effector_x", "end_effector_y", "target_x", "target_y"
+            ]])
+    return [list(key) + [rows] for key, rows in iterations.items()]
+
+
+def compute_recorded_iterations(folder, kinematics_type):
+    data_manager = DataManager(REFERENCE, folder, None, None, kinematics_type, 2)
+    result = []
+    for side, type, id, iteration, rows in get_recorded_iterations():
+        data_manager.start_iteration(side, type, id, iteration)
+        for row in rows: data_manager.add_data(*row)
+        data_manager.end_iteration()
+        result.append(data_manager.get_last_iteration(type))
+    data_manager.close()
+    return result
+
+
+@pytest.fixture(scope="module")
+def recorded_iterations(tmp_path_factory):
+    # The recorded iterations computed by CKATool and by the NumPy computation
+    pytest.importorskip("ckatool")
+    folder = tmp_path_factory.mktemp("kinematics")
+    ckatool_iterations = compute_recorded_iterations(str(folder / "ckatool"), DataManager.KINEMATICS_CKATOOL)
+    numpy_iterations = compute_recorded_iterations(str(folder / "numpy"), DataManager.KINEMATICS_NUMPY)
+    return ckatool_iterations, numpy_iterations
+
+
+KINEMATICS = [
+    "number_of_velocity_peaks", "ratio_mean_peak_velocity", "mean_velocity", "peak_velocity",
+    "sparc", "jerk", "movement_time", "percentage_time_to_peak_velocity",
+]
+
+
+@pytest.mark.parametrize("name", [joint + "_" + name for name in KINEMATICS for joint in ["shoulder", "elbow", "wrist"]] + [
+    "trunk_rom", "shoulder_rom", "elbow_rom",
+    "trunk_displacement", "shoulder_displacement", "elbow_displacement",
+    "target_error_distance", "hand_path_ratio",
+])
+def test_parity_with_ckatool(recorded_iterations, name):
+    for ckatool_it, numpy_it in zip(*recorded_iterations):
+        assert getattr(numpy_it, name) == pytest.approx(getattr(ckatool_it, name), rel=1e-6, abs=1e-9)
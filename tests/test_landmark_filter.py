@@ -0,0 +1,109 @@
+import numpy
+import pytest
+
+from landmark_filter import LandmarkFilter
+
+FPS = 30
+
+
+def create_filter(max_gap = 3):
+    return LandmarkFilter(2, 1.0, 10.0, 1.0, max_gap)
+
+
+def measure(coordinates, visible = (True, True)):
+    return [numpy.array(coordinates, dtype=numpy.float64), numpy.array(visible)]
+
+
+def test_constant_signal():
+    landmark_filter = create_filter()
+    for i in range(60):
+        result = landmark_filter.filter(measure([[0.2, 0.4], [0.6, 0.8]]), i / FPS)
+        assert numpy.allclose(result[0], [[0.2, 0.4], [0.6, 0.8]])
+        assert result[1].all()
+        assert not result[2].any()
+
+
+def test_step():
+    landmark_filter = create_filter()
+    landmark_filter.filter(measure([[0.2, 0.5], [0.5, 0.5]]), 0)
+
+    # The first landmark jumps, it moves toward the new value without overshoot, the second one does not move
+    previous = 0.2
+    for i in range(1, 60):
+        result = landmark_filter.filter(measure([[0.5, 0.5], [0.5, 0.5]]), i / FPS)
+        assert previous <= result[0][0, 0] <= 0.5
+        previous = result[0][0, 0]
+        assert result[0][1].tolist() == [0.5, 0.5]
+
+    # Filtered but not delayed for long : the speed makes the cutoff frequency increase
+    result = landmark_filter.filter(measure([[0.5, 0.5], [0.5, 0.5]]), 60 / FPS)
+    assert result[0][0, 0] == pytest.approx(0.5, abs=1e-3)
+
+
+def test_gap():
+    landmark_filter = create_filter(max_gap=3)
+
+    # Constant speed of the first landmark (0.3 per second)
+    for i in range(60):
+        landmark_filter.filter(measure([[0.1 + 0.3 * i / FPS, 0.5], [0.5, 0.5]]), i / FPS)
+
+    # The first landmark is lost : it is predicted at constant speed for 3 frames, then dropped
+    positions = [landmark_filter.filter(measure([[0.1 + 0.3 * 60 / FPS, 0.5], [0.5, 0.5]]), 60 / FPS)[0][0]]
+    for i in range(1, 4):
+        result = landmark_filter.filter(measure([[0, 0], [0.5, 0.5]], [False, True]), (60 + i) / FPS)
+        assert result[1].tolist() == [True, True]
+        assert result[2].tolist() == [True, False]
+        positions.append(result[0][0])
+    steps = numpy.diff(positions, axis=0)
+    assert numpy.all(steps[:, 0] > 0)
+    assert numpy.allclose(steps, steps[0])
+    result = landmark_filter.filter(measure([[0, 0], [0.5, 0.5]], [False, True]), 64 / FPS)
+    assert result[1].tolist() == [False, True]
+    assert result[2].tolist() == [False, False]
+
+    # Measured again : it starts from the measure, without filtering
+    result = landmark_filter.filter(measure([[0.9, 0.1], [0.5, 0.5]]), 65 / FPS)
+    assert result[0][0].tolist() == [0.9, 0.1]
+    assert result[1].tolist() == [True, True]
+
+
+def test_no_pose():
+    landmark_filter = create_filter(max_gap=1)
+    landmark_filter.filter(measure([[0.2, 0.4], [0.6, 0.8]]), 0)
+
+    # No pose : the landmarks are predicted (at rest), then there is no landmark
+    result = landmark_filter.filter(None, 1 / FPS)
+    assert result[2].all()
+    assert numpy.allclose(result[0], [[0.2, 0.4], [0.6, 0.8]])
+    assert landmark_filter.filter(None, 2 / FPS) is None
+
+
+def get_reach_errors(beta):
+    # Minimum jerk reach of 0.3 (normalized coordinates) in 1 s, after 1 s at rest, with a detection noise
+    t = numpy.arange(0, 3, 1 / FPS)
+    tau = numpy.clip(t - 1, 0, 1)
+    x = 0.3 + 0.3 * (10 * tau ** 3 - 15 * tau ** 4 + 6 * tau ** 5)
+    noise = numpy.random.default_rng(0).normal(0, 0.003, (20, t.shape[0]))
+    moving = (t >= 1) & (t <= 2)
+
+    def run(signal):
+        landmark_filter = LandmarkFilter(1, 1.0, beta, 1.0, 3)
+        return numpy.array([landmark_filter.filter(measure([[value, 0.5]], [True]), ts)[0][0, 0] for ts, value in zip(t, signal)])
+
+    # Lag : max error without noise, noise kept : ratio of the noise left in motion
+    clean = run(x)
+    lag = numpy.max(numpy.abs(clean - x)[moving])
+    noise_kept = numpy.mean([numpy.std((run(x + n) - clean)[moving]) / 0.003 for n in noise])
+    return lag, noise_kept
+
+
+def test_reach_lag_and_noise():
+    # The beta of the game (10) : about 8 px of lag at 640 px, 40 % of the noise removed in motion
+    lag, noise_kept = get_reach_errors(10.0)
+    assert lag < 0.015
+    assert noise_kept < 0.65
+
+    # A beta of 1 removes more noise, but lags three times more
+    lag_1, noise_kept_1 = get_reach_errors(1.0)
+    assert lag_1 > 3 * lag
+    assert noise_kept_1 < noise_kept
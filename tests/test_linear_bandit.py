@@ -0,0 +1,74 @@
+import os
+import warnings
+import numpy
+import pytest
+
+from linear_bandit import LinearBandit
+
+MODEL_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "model_training", "2026-03-29-18-15-41")
+MODEL_FILE = os.path.join(MODEL_FOLDER, "LinGreedy (epsilon = 0.2)")
+
+
+def load_mabwiser_model(path):
+    import cloudpickle
+    with open(path, "rb") as file, warnings.catch_warnings():
+        warnings.simplefilter("ignore") # The scaler was pickled by another scikit-learn version
+        return cloudpickle.load(file)["model"]
+
+
+def get_contexts(seed, n_contexts, n_columns):
+    return numpy.random.default_rng(seed).normal(0, 1, (n_contexts, n_columns))
+
+
+def get_mismatches(model, bandit, n_columns):
+    # Decisions one by one (as the DDA), then a partial fit on the decisions, then decisions again
+    mismatches = 0
+    contexts = get_contexts(1, 100, n_columns)
+    decisions = []
+    for context in contexts:
+        decision = model.predict(context[numpy.newaxis])
+        mismatches += decision != bandit.predict(context[numpy.newaxis])
+        decisions.append(decision)
+
+    rewards = numpy.random.default_rng(2).random(len(decisions))
+    model.partial_fit(decisions, rewards, contexts)
+    bandit.partial_fit(decisions, rewards, contexts)
+
+    for context in get_contexts(3, 100, n_columns):
+        mismatches += model.predict(context[numpy.newaxis]) != bandit.predict(context[numpy.newaxis])
+
+    return mismatches
+
+
+def test_shipped_model():
+    pytest.importorskip("mabwiser")
+    model = load_mabwiser_model(MODEL_FILE + ".pkl")
+    bandit, scaler, context_cols = LinearBandit.load(MODEL_FILE + ".npz")
+    assert get_mismatches(model, bandit, len(context_cols)) == 0
+
+
+@pytest.mark.parametrize("policy", ["LinUCB", "LinTS", "LinGreedy"])
+def test_trained_model(policy, tmp_path):
+    pytest.importorskip("mabwiser")
+    from mabwiser.mab import MAB, LearningPolicy
+    from sklearn.preprocessing import StandardScaler
+    from model_training.model_training import export_linear_model
+
+    # Small model, trained on random contexts (the first arm is never fitted : it keeps the shared generator)
+    learning_policies = {
+        "LinUCB" : LearningPolicy.LinUCB(alpha=1.5),
+        "LinTS" : LearningPolicy.LinTS(alpha=0.5),
+        "LinGreedy" : LearningPolicy.LinGreedy(epsilon=0.2),
+    }
+    context_cols = ["a", "b", "c", "d"]
+    contexts = get_contexts(0, 60, len(context_cols))
+    decisions = numpy.random.default_rng(4).choice([1, 2], 60).tolist()
+    rewards = numpy.random.default_rng(5).random(60)
+    model = MAB(arms=[0, 1, 2], learning_policy=learning_policies[policy], seed=7)
+    model.fit(decisions, rewards, contexts)
+
+    path = os.path.join(tmp_path, "model.npz")
+    export_linear_model(model, StandardScaler().fit(contexts), context_cols, path)
+    bandit, scaler, loaded_context_cols = LinearBandit.load(path)
+    assert loaded_context_cols == context_cols
+    assert get_mismatches(model, bandit, len(context_cols)) == 0
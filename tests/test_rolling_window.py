@@ -0,0 +1,83 @@
+import math
+import random
+import statistics
+import pytest
+
+from rolling_window import RollingWindow
+
+
+def create_window(size, values):
+    window = RollingWindow(size)
+    for value in values: window.append(value)
+    return window
+
+
+def test_empty():
+    window = RollingWindow(3)
+    assert len(window) == 0
+    assert window.get_sum() == 0
+    assert window.get_mean() == 0
+    assert window.get_variance() == 0
+    with pytest.raises(RuntimeError):
+        RollingWindow(0)
+
+
+def test_mean_and_variance():
+    window = create_window(5, [1, 2, 3, 4])
+    assert list(window) == [1, 2, 3, 4]
+    assert window.get_sum() == 10
+    assert window.get_mean() == 2.5
+    assert window.get_variance() == pytest.approx(statistics.pvariance([1, 2, 3, 4]))
+
+
+def test_eviction():
+    window = create_window(3, [1, 2, 3, 4, 5])
+    assert list(window) == [3, 4, 5]
+    assert window[0] == 3
+    assert window.get_sum() == 12
+    assert window.get_mean() == 4
+    assert window.get_variance() == pytest.approx(2 / 3)
+
+
+def test_integer_values_are_exact():
+    window = create_window(4, [1, 0, 1, 1, 0, 1])
+    assert window.get_sum() == 3
+    assert isinstance(window.get_sum(), int)
+
+
+def test_resync():
+    # Many evictions of values of different magnitudes, the sums are recomputed every 1000 evictions
+    rng = random.Random(0)
+    values = [rng.uniform(-1e6, 1e6) if i % 7 else rng.uniform(-1, 1) for i in range(5000)]
+    window = create_window(10, values)
+    assert window.get_mean() == pytest.approx(statistics.fmean(values[-10:]), abs=1e-6)
+    assert window.get_variance() == pytest.approx(statistics.pvariance(values[-10:]), rel=1e-6)
+
+
+@pytest.mark.parametrize("non_finite", [math.nan, math.inf, -math.inf])
+def test_non_finite_value(non_finite):
+    # NaN or infinite while the value is in the window, as the sum of the values
+    window = create_window(3, [1, non_finite, 2])
+    assert not math.isfinite(window.get_mean())
+    assert not math.isfinite(window.get_sum())
+
+    # Still in the window
+    window.append(3)
+    assert list(window)[1:] == [2, 3]
+    assert not math.isfinite(window.get_mean())
+
+    # Exact again once it is evicted
+    window.append(4)
+    window.append(5)
+    assert list(window) == [3, 4, 5]
+    assert window.get_sum() == 12
+    assert window.get_mean() == 4
+    assert window.get_variance() == pytest.approx(2 / 3)
+
+
+def test_non_finite_values_in_a_row():
+    window = create_window(2, [math.nan, math.nan, math.inf, 1])
+    assert math.isnan(window.get_variance())
+    window.append(2)
+    assert window.get_mean() == 1.5
+    assert window.get_variance() == pytest.approx(0.25)
@@ -0,0 +1,51 @@
+import os
+import time
+import pytest
+from session_writer import SessionWriter
+
+
+def wait_for_error(writer):
+    # The flush thread writes in the background
+    for i in range(100):
+        if writer._error is not None: return
+        time.sleep(0.01)
+
+
+def test_rows_are_written(tmp_path):
+    path = str(tmp_path / "scores.csv")
+    writer = SessionWriter(max_rows=2)
+    writer.write_row(path, ["id", "score"])
+    writer.write_rows(path, [[1, 0.5], [2, 0.75]])
+    writer.close()
+
+    with open(path, "r") as file:
+        assert file.read() == "id,score\n1,0.5\n2,0.75\n"
+
+
+def test_flush_error_is_raised_by_the_next_write(tmp_path):
+    writer = SessionWriter(max_rows=1)
+    writer.write_row(str(tmp_path), ["id"]) # A folder : the flush thread cannot open it
+    wait_for_error(writer)
+
+    with pytest.raises(RuntimeError, match="could not be written") as error:
+        writer.write_row(str(tmp_path / "scores.csv"), ["id"])
+    assert isinstance(error.value.__cause__, OSError)
+
+    with pytest.raises(RuntimeError, match="could not be written"):
+        writer.close()
+
+
+def test_flush_error_is_raised_by_close(tmp_path):
+    path = str(tmp_path / "scores.csv")
+    writer = SessionWriter(max_rows=1)
+    writer.write_row(path, ["id"])
+    writer.write_row(str(tmp_path), ["id"])
+    wait_for_error(writer)
+
+    with pytest.raises(RuntimeError, match="could not be written"):
+        writer.close()
+
+    # The rows written before the error are kept
+    with open(path, "r") as file:
+        assert file.read() == "id\n"
+    assert not os.path.exists(str(tmp_path / "scores.npz"))